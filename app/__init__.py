@@ -45,6 +45,19 @@ def create_app(config_name):
     from .contest import contest as contest_blueprint
 
     app.register_blueprint(contest_blueprint, url_prefix="/contest")
+
+    from core import events, metrics, stream
+    from .tasks import redis_con
+
+    # The queues shown on /metrics.
+    metrics.watch_streams(
+        redis_con,
+        {
+            stream.SUBMITTER_STREAM: stream.GROUP,
+            stream.CRAWLER_STREAM: stream.GROUP,
+            events.VERDICT_STREAM: events.VERDICT_GROUP,
+        },
+    )
     return app
 
 
@@ -17,6 +17,7 @@ from . import contest
 from .forms import SubmitProblemForm
 from .utlis import contest_check, generate_board
 from .. import tasks
+from ..sse import parse_ids, stream_status
 from ..models import db, Problem, Contest, ContestSubmission, User, Permission
 
 supported_languages = ["C", "C++", "Java"]
@@ -217,6 +218,19 @@ def status(contest_id):
     )
 
 
+@contest.route("/<contest_id>/status/stream")
+@contest_check
+@login_required
+def status_stream(contest_id):
+    # Verdict changes of the contest, only of the submissions listed in ids
+    # if given. The ranklist listens to all of them.
+    contest_id = str(contest_id)
+    ids = parse_ids(request.args.get("ids"))
+    return stream_status(
+        lambda x: x["contest_id"] == contest_id and (not ids or x["id"] in ids)
+    )
+
+
 @contest.route("/<contest_id>/ranklist")
 @contest_check
 @login_required
@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta
+
 from bs4 import BeautifulSoup
 from flask import (
     current_app,
@@ -12,6 +14,8 @@ from flask import (
 from flask_login import login_required, current_user
 from sqlalchemy import and_, or_
 
+from config import Config
+from core import metrics, timeline
 from . import main
 from .forms import (
     EditProfileForm,
@@ -20,6 +24,7 @@ from .forms import (
     EditProblemForm,
 )
 from .. import tasks
+from ..sse import parse_ids, stream_status
 from ..decorators import admin_required, permission_required
 from ..models import db, User, Role, Permission, Problem, Submission
 
@@ -320,6 +325,19 @@ def submit():
     return redirect(url_for(".status"))
 
 
+@main.route("/admin/timeline")
+@admin_required
+def submission_timeline():
+    hours = request.args.get("hours", 24, type=float)
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return render_template(
+        "timeline.html",
+        hours=hours,
+        quantiles=timeline.QUANTILES,
+        spans=timeline.breakdown(since),
+    )
+
+
 @main.route("/status")
 def status():
     id = request.args.get("id", None, type=int)
@@ -403,6 +421,28 @@ def status():
     )
 
 
+@main.route("/status/stream")
+def status_stream():
+    # Verdict changes of the submissions listed in ids, see app/sse.py.
+    ids = parse_ids(request.args.get("ids"))
+    return stream_status(lambda x: x["contest_id"] is None and x["id"] in ids)
+
+
+@main.route("/metrics")
+def metrics_page():
+    # Metrics of this worker, only for the scrapers in Config.METRICS_ALLOW.
+    # Behind a reverse proxy every request comes from the proxy's address, so
+    # forwarded requests are refused.
+    if (
+        request.remote_addr not in Config.METRICS_ALLOW
+        or "Forwarded" in request.headers
+        or "X-Forwarded-For" in request.headers
+    ):
+        abort(404)
+    body, content_type = metrics.render()
+    return current_app.response_class(body, content_type=content_type)
+
+
 @main.route("/ranklist")
 def rank_list():
     username = request.args.get("user")
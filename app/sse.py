@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from queue import Empty, Full, Queue
+
+import redis
+from flask import Response
+
+from config import Config, logger
+from core import metrics
+
+# Verdict changes applied by app/verdicts.py are published on this channel.
+# Every web worker subscribes to it once and fans the events out to the
+# Server-Sent Events clients it serves.
+STATUS_CHANNEL = "vjudge-status"
+KEEPALIVE_INTERVAL = 15
+CLIENT_QUEUE_SIZE = 100
+
+redis_con = redis.StrictRedis.from_url(Config.DEFAULT_REDIS_URL)
+
+
+def publish_status(submission, in_contest):
+    event = {
+        "id": submission.seq if in_contest else submission.id,
+        "contest_id": str(submission.contest_id) if in_contest else None,
+        "verdict": submission.verdict,
+        "exe_time": submission.exe_time,
+        "exe_mem": submission.exe_mem,
+    }
+    try:
+        redis_con.publish(STATUS_CHANNEL, json.dumps(event))
+    except redis.RedisError as e:
+        logger.error(f"Publish status failed, submission: {submission}, reason: {e}")
+
+
+class Broadcaster(object):
+    def __init__(self, channel):
+        self._channel = channel
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, accept):
+        # accept(event) tells which events the client wants.
+        events = Queue(CLIENT_QUEUE_SIZE)
+        with self._lock:
+            self._clients[events] = accept
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+        return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            self._clients.pop(events, None)
+
+    def client_count(self):
+        with self._lock:
+            return len(self._clients)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis_con.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    self._broadcast(message["data"])
+            except redis.RedisError as e:
+                logger.error(f"Status listener disconnected, reason: {e}")
+                time.sleep(1)
+
+    def _broadcast(self, data):
+        try:
+            event = json.loads(data)
+        except (json.JSONDecodeError, TypeError):
+            return
+        with self._lock:
+            clients = list(self._clients.items())
+        for events, accept in clients:
+            if not accept(event):
+                continue
+            try:
+                events.put_nowait(event)
+            except Full:
+                # A client this far behind reloads the page anyway.
+                pass
+
+
+broadcaster = Broadcaster(STATUS_CHANNEL)
+metrics.gauges.add(
+    "vjudge_sse_clients",
+    "Status stream clients of this worker",
+    [],
+    lambda: {(): broadcaster.client_count()},
+)
+
+
+def stream_status(accept):
+    def generate():
+        events = broadcaster.subscribe(accept)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = events.get(timeout=KEEPALIVE_INTERVAL)
+                except Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: verdict\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broadcaster.unsubscribe(events)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def parse_ids(value, limit=100):
+    ids = set()
+    for x in (value or "").split(",")[:limit]:
+        try:
+            ids.add(int(x))
+        except ValueError:
+            continue
+    return ids
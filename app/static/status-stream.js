@@ -0,0 +1,60 @@
+// Live verdicts over Server-Sent Events, see app/sse.py.
+var pendingVerdicts = ["queuing", "being-judged"];
+
+function verdictClass(verdict) {
+    return verdict.replace(/ /g, "-").toLowerCase();
+}
+
+function watchStatus(url) {
+    if (!window.EventSource) {
+        return;
+    }
+    var rows = {};
+    $("tr[data-id]").each(function () {
+        var row = $(this);
+        if (pendingVerdicts.indexOf(verdictClass(row.find(".verdict").text().trim())) >= 0) {
+            rows[row.data("id")] = row;
+        }
+    });
+    var ids = Object.keys(rows);
+    if (ids.length === 0) {
+        return;
+    }
+    var source = new EventSource(url + "?ids=" + ids.join(","));
+    source.addEventListener("verdict", function (e) {
+        var data = JSON.parse(e.data);
+        var row = rows[data.id];
+        if (!row) {
+            return;
+        }
+        var cls = verdictClass(data.verdict);
+        row.find(".verdict").attr("class", cls + " verdict").text(data.verdict);
+        row.find(".exe-time").text(data.exe_time);
+        row.find(".exe-mem").text(data.exe_mem);
+        if (pendingVerdicts.indexOf(cls) < 0) {
+            delete rows[data.id];
+            if (Object.keys(rows).length === 0) {
+                source.close();
+            }
+        }
+    });
+}
+
+function watchBoard(url, minInterval) {
+    // Reloads the ranklist on final verdicts, at most once per minInterval ms.
+    if (!window.EventSource) {
+        return;
+    }
+    var loaded = Date.now();
+    var source = new EventSource(url);
+    source.addEventListener("verdict", function (e) {
+        var data = JSON.parse(e.data);
+        if (pendingVerdicts.indexOf(verdictClass(data.verdict)) >= 0) {
+            return;
+        }
+        source.close();
+        setTimeout(function () {
+            location.reload();
+        }, Math.max(0, loaded + minInterval - Date.now()));
+    });
+}
@@ -7,10 +7,12 @@ from sqlalchemy import or_
 
 from config import Config
 from core import db as core_db
+from core import timeline
 from core.models import Contest as CoreContest
 from core.models import Problem as CoreProblem
 from core.models import Submission as CoreSubmission
 from core.site import contest_clients
+from core.stream import add_task, CRAWLER_STREAM, SUBMITTER_STREAM
 from . import celery
 from .models import db, Submission, ContestSubmission, Problem, Contest
 
@@ -31,50 +33,25 @@ def submit_problem(self, sid, in_contest=False):
     )
     core_db.session.add(core_submission)
     core_db.session.commit()
-    redis_con.lpush("vjudge-submitter-tasks", core_submission.id)
+    # The verdicts are applied by app/verdicts.py, which finds the submission
+    # by its run_id, so it is stored before the core submission is queued.
     submission.run_id = core_submission.id
     db.session.commit()
-    refresh_submit_status.delay(sid, in_contest)
-
-
-@celery.task(bind=True, default_retry_delay=1)
-def refresh_submit_status(self, sid, in_contest=False):
-    if in_contest:
-        submission = ContestSubmission.query.get(int(sid))
-    else:
-        submission = Submission.query.get(int(sid))
-    core_submission = CoreSubmission.query.get(submission.run_id)
-    verdict = core_submission.verdict
-    exe_time = core_submission.exe_time
-    exe_mem = core_submission.exe_mem
-    if verdict and verdict != submission.verdict:
-        submission.verdict = verdict
-        submission.exe_time = exe_time or 0
-        submission.exe_mem = exe_mem or 0
-        db.session.commit()
-    if verdict in ("Queuing", "Being Judged"):
-        raise self.retry(max_retries=120, countdown=self.request.retries + 1)
-    if not in_contest:
-        user = submission.user
-        user.submitted += 1
-        kvs = {
-            "user_id": submission.user_id,
-            "oj_name": submission.oj_name,
-            "problem_id": submission.problem_id,
-            "verdict": submission.verdict,
-        }
-        if Submission.query.filter_by(**kvs).count() == 1 and verdict == "Accepted":
-            problem = submission.problem
-            problem.solved += 1
-            user = submission.user
-            user.solved += 1
-    db.session.commit()
+    timeline.mark(core_submission.id, "created", submission.time_stamp)
+    timeline.mark(core_submission.id, "enqueued")
+    add_task(
+        redis_con,
+        SUBMITTER_STREAM,
+        core_submission.id,
+        lane="contest" if in_contest else "practice",
+    )
 
 
 @celery.task(bind=True)
 def refresh_problem(self, oj_name, problem_id):
-    redis_con.lpush(
-        "vjudge-crawler-tasks",
+    add_task(
+        redis_con,
+        CRAWLER_STREAM,
         json.dumps(
             {
                 "oj_name": oj_name,
@@ -83,6 +60,7 @@ def refresh_problem(self, oj_name, problem_id):
                 "problem_id": problem_id,
             }
         ),
+        lane="interactive",
     )
     update_problem.delay(oj_name=oj_name, problem_id=problem_id)
 
@@ -140,14 +118,16 @@ def refresh_contest_info(self, contest_id):
         < contest.start_time - datetime.utcnow()
     ):
         return
-    redis_con.lpush(
-        "vjudge-crawler-tasks",
+    add_task(
+        redis_con,
+        CRAWLER_STREAM,
         json.dumps(
             {
                 "oj_name": contest.clone_name,
                 "type": "contest",
             }
         ),
+        lane="interactive",
     )
 
     core_contest = CoreContest.query.filter_by(site=site, contest_id=cid).first()
@@ -214,7 +194,7 @@ def update_recent_contest():
     c = contest_clients.get("hdu")
     if c is None:
         return
-    result = c.get_recent_contest()
+    result = c.get_recent_contest(Config.BASE_URLS.get("hdu"))
     contests = [x.to_json() for x in result]
     contests.reverse()
     for contest in contests:
@@ -247,15 +227,35 @@ def update_recent_contest():
         db.session.commit()
 
 
+@celery.task(name="refresh_problem_incremental")
+def refresh_problem_incremental():
+    add_task(
+        redis_con,
+        CRAWLER_STREAM,
+        json.dumps({"oj_name": "scu", "type": "problem", "incremental": True}),
+        lane="bulk",
+    )
+    add_task(
+        redis_con,
+        CRAWLER_STREAM,
+        json.dumps({"oj_name": "hdu", "type": "problem", "incremental": True}),
+        lane="bulk",
+    )
+
+
 @celery.task(name="refresh_problem_all")
 def refresh_problem_all():
-    redis_con.lpush(
-        "vjudge-crawler-tasks",
+    add_task(
+        redis_con,
+        CRAWLER_STREAM,
         json.dumps({"oj_name": "scu", "type": "problem", "all": True}),
+        lane="bulk",
     )
-    redis_con.lpush(
-        "vjudge-crawler-tasks",
+    add_task(
+        redis_con,
+        CRAWLER_STREAM,
         json.dumps({"oj_name": "hdu", "type": "problem", "all": True}),
+        lane="bulk",
     )
 
 
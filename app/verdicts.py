@@ -0,0 +1,163 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+import redis
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import Config, logger
+from core import db as core_db
+from core import timeline
+from core.events import VERDICT_GROUP, VERDICT_STREAM
+from core.models import Submission as CoreSubmission
+from core.stream import TaskStream
+from .models import db, Submission, ContestSubmission
+from .sse import publish_status
+
+PENDING_VERDICTS = ("Queuing", "Being Judged")
+# Verdicts are read from the database as well this often, in case an event
+# was lost, for submissions pending longer than SYNC_DELAY.
+SYNC_INTERVAL = 5 * 60
+SYNC_DELAY = timedelta(minutes=1)
+
+
+def apply_verdict(submission, in_contest, verdict, exe_time, exe_mem):
+    # A final verdict is never replaced, events delivered again or late
+    # "Being Judged" events are ignored.
+    if not verdict or verdict == submission.verdict:
+        return False
+    if submission.verdict not in PENDING_VERDICTS:
+        return False
+    submission.verdict = verdict
+    submission.exe_time = exe_time or 0
+    submission.exe_mem = exe_mem or 0
+    final = verdict not in PENDING_VERDICTS
+    if final and not in_contest:
+        # Counted in the same transaction as the verdict, so a crash cannot
+        # apply one without the other.
+        user = submission.user
+        user.submitted += 1
+        kvs = {
+            "user_id": submission.user_id,
+            "oj_name": submission.oj_name,
+            "problem_id": submission.problem_id,
+            "verdict": submission.verdict,
+        }
+        if Submission.query.filter_by(**kvs).count() == 1 and verdict == "Accepted":
+            problem = submission.problem
+            problem.solved += 1
+            user.solved += 1
+    db.session.commit()
+    publish_status(submission, in_contest)
+    if final:
+        timeline.mark(int(submission.run_id), "propagated")
+    return True
+
+
+def _find_submission(core_submission_id):
+    run_id = str(core_submission_id)
+    submission = Submission.query.filter_by(run_id=run_id).first()
+    if submission is not None:
+        return submission, False
+    return ContestSubmission.query.filter_by(run_id=run_id).first(), True
+
+
+def _handle(events, entry_id, data):
+    try:
+        event = json.loads(data)
+        core_submission_id = event["submission_id"]
+    except (json.JSONDecodeError, TypeError, KeyError):
+        logger.error(f'Verdict subscriber: received corrupt data "{data}"')
+        events.dead_letter(entry_id, data, "corrupt data")
+        return
+    submission, in_contest = _find_submission(core_submission_id)
+    if submission is None:
+        # The run_id is not committed yet, the event is delivered again later.
+        logger.warning(
+            f"No submission for core submission {core_submission_id} yet, "
+            f"verdict: {event.get('verdict')}"
+        )
+        events.fail(entry_id)
+        return
+    apply_verdict(
+        submission,
+        in_contest,
+        event.get("verdict"),
+        event.get("exe_time"),
+        event.get("exe_mem"),
+    )
+    events.ack(entry_id)
+
+
+def sync_pending():
+    before = datetime.utcnow() - SYNC_DELAY
+    for model, in_contest in ((Submission, False), (ContestSubmission, True)):
+        submissions = model.query.filter(
+            model.verdict.in_(PENDING_VERDICTS),
+            model.run_id.isnot(None),
+            model.time_stamp < before,
+        ).all()
+        for submission in submissions:
+            core_submission = CoreSubmission.query.get(int(submission.run_id))
+            if core_submission is None:
+                continue
+            if apply_verdict(
+                submission,
+                in_contest,
+                core_submission.verdict,
+                core_submission.exe_time,
+                core_submission.exe_mem,
+            ):
+                logger.warning(f"Synced missed verdict of {submission}")
+    core_db.session.remove()
+
+
+def _rollback():
+    db.session.rollback()
+    core_db.session.rollback()
+
+
+def main():
+    redis_con = redis.StrictRedis.from_url(Config.DEFAULT_REDIS_URL)
+    events = TaskStream(redis_con, VERDICT_STREAM, group=VERDICT_GROUP)
+    events.create_group()
+    try:
+        # The core tables added by newer versions, such as the timelines.
+        core_db.upgrade()
+    except SQLAlchemyError as e:
+        # The VJudge may be upgrading the same database right now.
+        logger.error(f"Upgrade core database failed, reason: {e}")
+    logger.info("Started verdict subscriber")
+    last_sync = 0
+    while True:
+        if time.monotonic() - last_sync > SYNC_INTERVAL:
+            try:
+                sync_pending()
+            except Exception as e:
+                _rollback()
+                logger.error(f"Sync pending verdicts failed, reason: {e}")
+            last_sync = time.monotonic()
+        try:
+            entries = events.read(count=100)
+        except redis.RedisError as e:
+            logger.error(f"Read verdicts failed, reason: {e}")
+            time.sleep(1)
+            continue
+        for entry_id, data, _ in entries:
+            try:
+                _handle(events, entry_id, data)
+            except Exception as e:
+                # Left unacked, the event is delivered again later.
+                _rollback()
+                logger.error(f"Apply verdict failed, entry_id: {entry_id}, reason: {e}")
+                try:
+                    events.fail(entry_id)
+                except redis.RedisError:
+                    # Only the failure is not counted, it is delivered again.
+                    pass
+        # Rows are read again for every batch instead of from the identity map.
+        db.session.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+import argparse
+import html
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# A local stand-in for the HDU and SCU judges, serving the recorded pages in
+# benchmarks/pages. HDU lives under /hdu and SCU under /scu/soj, so point the
+# clients at it with base_url="http://localhost:8000/hdu" and
+# "http://localhost:8000/scu/soj" (or the [base-urls] config section). Use a
+# host name rather than an IP: aiohttp drops cookies set by IP addresses.
+#
+# SCU captchas are resolved from md5 hashes of real captcha images, which are
+# not recorded, so SOJ submits against this server fail the captcha lookup.
+# Everything else of SCU is served.
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+FIRST_RUN_ID = 40000000
+FIRST_PROBLEM_ID = 1000
+PROBLEMS_PER_VOLUME = 100
+STATUS_PAGE_SIZE = 15
+FINAL_VERDICTS = (
+    ["Accepted"] * 5
+    + ["Wrong Answer"] * 3
+    + ["Time Limit Exceeded", "Runtime Error", "Compilation Error"]
+)
+# A 1x1 gif, SOJ serves its captcha as gif.
+CAPTCHA = bytes.fromhex(
+    "47494638396101000100800000000000ffffff21f90401000000002c"
+    "00000000010001000002024401003b"
+)
+
+
+def _load(site, name):
+    with open(os.path.join(PAGES_DIR, site, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def _split_rows(text, first_row, table_end):
+    start = text.index(first_row)
+    end = text.index(table_end, start)
+    return text[:start], text[end:]
+
+
+class Run(object):
+    def __init__(self, run_id, site, user, problem_id, language, contest_id, delay):
+        self.run_id = run_id
+        self.site = site
+        self.user = user
+        self.problem_id = problem_id
+        self.language = language
+        self.contest_id = contest_id
+        self.submit_time = time.time()
+        self.judged_at = self.submit_time + delay
+        rng = random.Random(run_id)
+        self.final_verdict = rng.choice(FINAL_VERDICTS)
+        self.exe_time = rng.randrange(0, 1000, 15)
+        self.exe_mem = rng.randrange(1000, 30000)
+
+    def status(self):
+        remaining = self.judged_at - time.time()
+        if remaining <= 0:
+            return self.final_verdict, self.exe_time, self.exe_mem
+        if remaining > (self.judged_at - self.submit_time) / 2:
+            return "Queuing", 0, 0
+        return "Running", 0, 0
+
+    def submit_time_str(self):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.submit_time))
+
+
+class FakeJudge(object):
+    def __init__(self, judge_delay=3.0, volumes=10, resubmit_interval=0.0):
+        self.judge_delay = judge_delay
+        self.volumes = volumes
+        self.resubmit_interval = resubmit_interval
+        self._lock = threading.Lock()
+        self._run_ids = itertools.count(FIRST_RUN_ID)
+        self._runs = []
+        self._last_submit = {}
+        self._sessions = {}
+        self._session_ids = itertools.count(1)
+
+    def login(self, site, username, password):
+        if not username or not password:
+            return None
+        with self._lock:
+            token = f"{site}-{next(self._session_ids)}"
+            self._sessions[token] = username
+        return token
+
+    def get_user(self, token):
+        with self._lock:
+            return self._sessions.get(token)
+
+    def submit(self, site, user, problem_id, language, contest_id=None):
+        now = time.time()
+        with self._lock:
+            last = self._last_submit.get((site, user), 0)
+            if now - last < self.resubmit_interval:
+                return None
+            self._last_submit[(site, user)] = now
+            # Judging time varies around the configured delay.
+            delay = random.uniform(0.5, 1.5) * self.judge_delay
+            run = Run(
+                next(self._run_ids),
+                site,
+                user,
+                problem_id,
+                language,
+                contest_id,
+                delay,
+            )
+            self._runs.append(run)
+        return run
+
+    def runs(self, site, user="", problem_id="", first=None, contest_id=None):
+        with self._lock:
+            runs = list(reversed(self._runs))
+        return [
+            x
+            for x in runs
+            if x.site == site
+            and x.contest_id == contest_id
+            and (not user or x.user == user)
+            and (not problem_id or x.problem_id == problem_id)
+            and (first is None or x.run_id <= first)
+        ]
+
+    def problem_ids(self, volume):
+        if not 1 <= volume <= self.volumes:
+            return []
+        start = FIRST_PROBLEM_ID + (volume - 1) * PROBLEMS_PER_VOLUME
+        return list(range(start, start + PROBLEMS_PER_VOLUME))
+
+    def has_problem(self, problem_id):
+        last = FIRST_PROBLEM_ID + self.volumes * PROBLEMS_PER_VOLUME
+        return FIRST_PROBLEM_ID <= problem_id < last
+
+
+class HDUPages(object):
+    def __init__(self, judge):
+        self.judge = judge
+        status = _load("hdu", "status.html")
+        self._status_head, self._status_tail = _split_rows(
+            status, "<tr align=center", "</table></div>"
+        )
+        self._problem = _load("hdu", "problem.html")
+        self._contest = _load("hdu", "contest_show.html")
+        self._submit = _load("hdu", "submit.html")
+        self._list = _load("hdu", "listproblem.html")
+        volumes = " ".join(
+            f'<a href="listproblem.php?vol={x}">{x}</a>'
+            for x in range(1, judge.volumes + 1)
+        )
+        self._list = re.sub(
+            r"Volume: .*?</div>", f"Volume: {volumes}</div>", self._list, count=1
+        )
+
+    def route(self, handler, path, query, form):
+        user = handler.user("hdu")
+        if path == "/userloginex.php":
+            if handler.command == "POST":
+                token = self.judge.login(
+                    "hdu", form.get("username"), form.get("userpass")
+                )
+                if token is None:
+                    return 200, self._sign_in()
+                handler.set_session("hdu", token)
+            return 200, "<html><body>Welcome</body></html>"
+        if path == "/control_panel.php":
+            return 200, self._sign_in() if user is None else "<html>Panel</html>"
+        if path in ("/showproblem.php", "/contests/contest_showproblem.php"):
+            try:
+                problem_id = int(query.get("pid", ""))
+            except ValueError:
+                problem_id = 0
+            if not self.judge.has_problem(problem_id):
+                return 200, "<html><body><h1>System Message</h1></body></html>"
+            return 200, self._problem
+        if path == "/listproblem.php":
+            try:
+                volume = int(query.get("vol", 1))
+            except ValueError:
+                volume = 1
+            calls = "".join(
+                f'p(0,{x},0,"Problem {x}",0,0);' for x in self.judge.problem_ids(volume)
+            )
+            return 200, re.sub(
+                r'(<script language="javascript">).*?(</script>)',
+                lambda m: m.group(1) + calls + m.group(2),
+                self._list,
+                count=1,
+            )
+        if path == "/contests/contest_show.php":
+            return 200, self._contest
+        if path in ("/submit.php", "/contests/contest_submit.php"):
+            if user is None:
+                return 200, self._sign_in()
+            if query.get("action") != "submit":
+                return 200, self._submit
+            run = self.judge.submit(
+                "hdu",
+                user,
+                form.get("problemid", ""),
+                form.get("language", ""),
+                query.get("cid"),
+            )
+            if run is None:
+                return 200, (
+                    "<html><body>Please don't re-submit in 5 seconds, thank you."
+                    "</body></html>"
+                )
+            return 200, self._status_page([])
+        if path == "/status.php":
+            try:
+                first = int(query["first"])
+            except (KeyError, ValueError):
+                first = None
+            runs = self.judge.runs(
+                "hdu", query.get("user", ""), query.get("pid", ""), first
+            )
+            return 200, self._status_page(runs[:STATUS_PAGE_SIZE])
+        if path == "/contests/contest_status.php":
+            try:
+                page = max(1, int(query.get("page", 1)))
+            except ValueError:
+                page = 1
+            runs = self.judge.runs(
+                "hdu",
+                query.get("user", ""),
+                query.get("pid", ""),
+                contest_id=query.get("cid"),
+            )
+            start = (page - 1) * STATUS_PAGE_SIZE
+            return 200, self._status_page(runs[start : start + STATUS_PAGE_SIZE])
+        return 404, "<html><body>Not Found</body></html>"
+
+    @staticmethod
+    def _sign_in():
+        return "<html><body><h1>Sign In Your Account</h1></body></html>"
+
+    def _status_page(self, runs):
+        rows = []
+        for run in runs:
+            verdict, exe_time, exe_mem = run.status()
+            rows.append(
+                f"<tr align=center ><td height=22px>{run.run_id}</td>"
+                f"<td>{run.submit_time_str()}</td>"
+                f"<td><font color=green>{html.escape(verdict)}</font></td>"
+                f"<td>{html.escape(run.problem_id)}</td>"
+                f"<td>{exe_time}MS</td><td>{exe_mem}K</td><td>100B</td>"
+                f"<td>{html.escape(run.language)}</td>"
+                f"<td class=fixedsize>{html.escape(run.user)}</td></tr>\n"
+            )
+        return self._status_head + "".join(rows) + self._status_tail
+
+
+class SOJPages(object):
+    def __init__(self, judge):
+        self.judge = judge
+        problems = _load("scu", "problems.html")
+        volumes = " ".join(
+            f'<a href="problems.action?volume={x}">[{x}]</a>'
+            for x in range(1, judge.volumes + 1)
+        )
+        problems = re.sub(
+            r'(<tr><td colspan="5" align="center">\n).*?(\n</td></tr>)',
+            lambda m: m.group(1) + volumes + m.group(2),
+            problems,
+            count=1,
+        )
+        self._problems_head, self._problems_tail = _split_rows(
+            problems, "<tr><td></td>", "</table>"
+        )
+        self._problem = _load("scu", "problem.html")
+        solutions = _load("scu", "solutions.html")
+        self._solutions_head, self._solutions_tail = _split_rows(
+            solutions, "<tr><td>", "</table>"
+        )
+
+    def route(self, handler, path, query, form):
+        user = handler.user("scu")
+        if path == "/login.action":
+            token = self.judge.login("scu", form.get("id"), form.get("password"))
+            if token is None:
+                return 200, "<html><body>USER_NOT_EXIST</body></html>"
+            handler.set_session("scu", token)
+            return 200, "<html><body>Welcome</body></html>"
+        if path == "/update_user_form.action":
+            if user is None:
+                return 200, "<html><body>Please login first</body></html>"
+            return 200, "<html><body>Update</body></html>"
+        if path == "/problems.action":
+            try:
+                volume = int(query.get("volume", 1))
+            except ValueError:
+                volume = 1
+            rows = "".join(
+                f'<tr><td></td><td>{x}</td><td><a href="problem.action?id={x}">'
+                f"Problem {x}</a></td><td>0% (0/0)</td><td></td></tr>\n"
+                for x in self.judge.problem_ids(volume)
+            )
+            return 200, self._problems_head + rows + self._problems_tail
+        if path == "/problem.action":
+            problem_id = query.get("id", "")
+            if not problem_id.isdigit() or not self.judge.has_problem(int(problem_id)):
+                return 200, "<html><body>No such problem</body></html>"
+            return 200, self._problem.replace("1000:", f"{problem_id}:")
+        if path == "/validation_code":
+            return 200, CAPTCHA
+        if path == "/submit.action":
+            if user is None:
+                return 200, "<html><body>ERROR</body></html>"
+            run = self.judge.submit(
+                "scu", user, form.get("problemId", ""), form.get("language", "")
+            )
+            if run is None:
+                return 200, "<html><body>ERROR</body></html>"
+            return 200, "<html><body>Submitted</body></html>"
+        if path == "/solutions.action":
+            try:
+                first = int(query["from"])
+            except (KeyError, ValueError):
+                first = None
+            runs = self.judge.runs(
+                "scu", query.get("userId", ""), query.get("problemId", ""), first
+            )
+            return 200, self._solutions_page(runs[:STATUS_PAGE_SIZE])
+        return 404, "<html><body>Not Found</body></html>"
+
+    def _solutions_page(self, runs):
+        rows = []
+        for run in runs:
+            verdict, exe_time, exe_mem = run.status()
+            rows.append(
+                f"<tr><td>{run.run_id}</td><td>{html.escape(run.user)}</td>"
+                f"<td>{html.escape(run.problem_id)}</td>"
+                f"<td>{html.escape(run.language)}</td><td>100</td>"
+                f"<td>{html.escape(verdict)}</td><td>{exe_time}</td>"
+                f"<td>{exe_mem}</td><td>{run.submit_time_str()}</td></tr>\n"
+            )
+        return self._solutions_head + "".join(rows) + self._solutions_tail
+
+
+class FakeOJHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent separately, which would otherwise stall every
+    # keep-alive response on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def user(self, site):
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        morsel = cookie.get(f"{site}_session")
+        return None if morsel is None else self.server.judge.get_user(morsel.value)
+
+    def set_session(self, site, token):
+        self._cookies.append(f"{site}_session={token}; Path=/")
+
+    def _dispatch(self):
+        server = self.server
+        self._cookies = []
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8", "replace") if length else ""
+        if server.latency > 0:
+            time.sleep(random.uniform(0.5, 1.5) * server.latency)
+        if random.random() < server.error_rate:
+            self._send(502, "<html><body>Bad Gateway</body></html>")
+            return
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        form = {k: v[-1] for k, v in parse_qs(body).items()}
+        if url.path.startswith("/hdu/"):
+            status, content = server.hdu.route(self, url.path[4:], query, form)
+        elif url.path.startswith("/scu/soj/"):
+            status, content = server.scu.route(self, url.path[8:], query, form)
+        else:
+            status, content = 404, "<html><body>Not Found</body></html>"
+        self._send(status, content)
+
+    def _send(self, status, content):
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+            content_type = "text/html; charset=utf-8"
+        else:
+            content_type = "image/gif"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for cookie in self._cookies:
+            self.send_header("Set-Cookie", cookie)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class FakeOJServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        latency=0.0,
+        error_rate=0.0,
+        judge_delay=3.0,
+        volumes=10,
+        resubmit_interval=0.0,
+        verbose=False,
+    ):
+        super().__init__(address, FakeOJHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.judge = FakeJudge(judge_delay, volumes, resubmit_interval)
+        self.hdu = HDUPages(self.judge)
+        self.scu = SOJPages(self.judge)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        if host == "127.0.0.1":
+            # aiohttp ignores cookies set by IP addresses.
+            host = "localhost"
+        return f"http://{host}:{port}"
+
+
+def start_server(host="127.0.0.1", port=0, **kwargs):
+    server = FakeOJServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def add_server_arguments(arg_parser):
+    arg_parser.add_argument(
+        "--latency", type=float, default=0.05, help="mean response delay, seconds"
+    )
+    arg_parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of 502 responses"
+    )
+    arg_parser.add_argument(
+        "--judge-delay", type=float, default=3.0, help="mean judging time, seconds"
+    )
+    arg_parser.add_argument("--volumes", type=int, default=10)
+    arg_parser.add_argument(
+        "--resubmit-interval",
+        type=float,
+        default=0.0,
+        help="reject submits of one user closer than this, seconds",
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    add_server_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    server = FakeOJServer(
+        (args.host, args.port),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        judge_delay=args.judge_delay,
+        volumes=args.volumes,
+        resubmit_interval=args.resubmit_interval,
+        verbose=True,
+    )
+    print(f"Serving HDU at {server.base_url}/hdu and SCU at {server.base_url}/scu/soj")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
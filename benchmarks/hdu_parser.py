@@ -0,0 +1,205 @@
+import argparse
+import os
+import re
+import timeit
+import tracemalloc
+from urllib.parse import urljoin
+
+import lxml.html
+from bs4 import BeautifulSoup
+from bs4.element import NavigableString
+from lxml import etree
+
+from core.site.hdu import parser
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages", "hdu")
+PROBLEM_URL = "https://acm.hdu.edu.cn/showproblem.php?pid="
+
+
+# The functions below are the BeautifulSoup implementations that
+# core.site.hdu.parser replaced. They are kept here as the baseline.
+
+
+def legacy_find_verdicts(text):
+    result = {}
+    soup = BeautifulSoup(text, "lxml")
+    tables = soup.find_all("table")
+    tables.reverse()
+    try:
+        pattern = re.compile(r"Run ID.*Judge Status.*Author", re.DOTALL)
+        table = next(filter(lambda x: re.search(pattern, str(x)), tables))
+    except StopIteration:
+        return result
+    for tag in table.find_all("tr", align="center"):
+        row = [x.text.strip() for x in tag.find_all("td")]
+        if len(row) < 6:
+            continue
+        verdict = row[2]
+        try:
+            exe_time = int(row[4].replace("MS", ""))
+            exe_mem = int(row[5].replace("K", ""))
+        except ValueError:
+            continue
+        if re.search("Runtime Error", verdict):
+            verdict = "Runtime Error"
+        result[row[0]] = (verdict, exe_time, exe_mem)
+    return result
+
+
+def legacy_parse_problem(text):
+    result = {}
+    pattern = re.compile(
+        (
+            r"Time Limit:.*?[0-9]*/([0-9]*).*?MS.*?\(Java/Others\).*?"
+            r"Memory Limit:.*?[0-9]*/([0-9]*).*?K.*?\(Java/Others\)"
+        )
+    )
+    limit = re.search(pattern, text)
+    if limit:
+        result["time_limit"] = limit.group(1)
+        result["mem_limit"] = limit.group(2)
+    soup = BeautifulSoup(text, "lxml")
+    for tag in soup.find_all("img"):
+        tag["src"] = urljoin(PROBLEM_URL, tag["src"])
+    if soup.h1:
+        result["title"] = soup.h1.text
+        if result["title"] == "System Message":
+            return
+    for t in soup.find_all("div", "panel_title", align="left"):
+        title = t.string
+        if title in parser.PAGE_TITLES:
+            tag = t.next_sibling
+            limit = 0
+            while tag and type(tag) is NavigableString and limit < 3:
+                tag = tag.next_sibling
+                limit += 1
+            if tag is None or type(tag) is NavigableString:
+                continue
+            res = re.match("<div.*?>(.*)</div>$", str(tag), re.DOTALL)
+            if res:
+                result[parser.PAGE_TITLES[title]] = res.group(1)
+    return result
+
+
+def legacy_parse_contest_problem_ids(text):
+    res = []
+    soup = BeautifulSoup(text, "lxml")
+    tables = soup.find_all("table")
+    try:
+        pattern = re.compile(r"Solved.*Title.*Ratio", re.DOTALL)
+        table = next(filter(lambda x: re.search(pattern, str(x)), tables))
+    except StopIteration:
+        return res
+    for tag in table.find_all("tr", align="center"):
+        tds = [x.text for x in tag.find_all("td")]
+        if len(tds) >= 2:
+            res.append(tds[1])
+    return res
+
+
+def legacy_parse_contest_info(text):
+    problem_list = legacy_parse_contest_problem_ids(text)
+    soup = BeautifulSoup(text, "lxml")
+    title = soup.h1.get_text() if soup.h1 else None
+    divs = soup.find_all("div")
+    divs.reverse()
+    try:
+        pattern = re.compile(r"Start.*Time.*Contest.*Type.*Contest.*Status", re.DOTALL)
+        div = next(filter(lambda x: re.search(pattern, str(x)), divs))
+    except StopIteration:
+        return title, problem_list, None
+    res = re.search(parser._CONTEST_PATTERN, div.get_text())
+    if not res:
+        return title, problem_list, None
+    groups = [x.strip() for x in res.groups()]
+    return title, problem_list, (groups[0:6], groups[6:12], *groups[12:])
+
+
+def legacy_parse_language_ids(text):
+    select = BeautifulSoup(text, "lxml").find("select", attrs={"name": "language"})
+    if select is None:
+        return None
+    langs = {}
+    for option in select.find_all("option"):
+        try:
+            langs[option.text.strip().lower()] = option["value"]
+        except KeyError:
+            continue
+    return langs
+
+
+CASES = [
+    (
+        "status",
+        "status.html",
+        legacy_find_verdicts,
+        parser.find_verdicts,
+    ),
+    (
+        "problem",
+        "problem.html",
+        legacy_parse_problem,
+        lambda text: parser.parse_problem(text, PROBLEM_URL),
+    ),
+    (
+        "contest",
+        "contest_show.html",
+        legacy_parse_contest_info,
+        parser.parse_contest_info,
+    ),
+    (
+        "language",
+        "submit.html",
+        legacy_parse_language_ids,
+        parser.parse_language_ids,
+    ),
+]
+
+
+def _normalize(result):
+    # The two serializers differ in void-tag style ("<br/>" vs "<br>") and
+    # attribute order, so markup is compared after a canonical re-serialization.
+    if isinstance(result, dict):
+        return {k: _normalize(v) for k, v in result.items()}
+    if isinstance(result, str) and "<" in result:
+        root = lxml.html.fragment_fromstring(result, create_parent="div")
+        for element in root.iter():
+            attrs = sorted(element.attrib.items())
+            element.attrib.clear()
+            element.attrib.update(attrs)
+        return etree.tostring(root, encoding="unicode", method="html")
+    return result
+
+
+def measure(func, text, number):
+    seconds = min(timeit.repeat(lambda: func(text), number=number, repeat=3))
+    # tracemalloc only sees Python-level allocations, not libxml2's.
+    tracemalloc.start()
+    func(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds / number * 1000, peak / 1024
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-n", dest="number", type=int, default=200)
+    args = arg_parser.parse_args()
+    print(
+        f"{'page':<10}{'impl':<8}{'ms/page':>10}{'peak KiB':>12}{'speedup':>10}  same"
+    )
+    for name, filename, legacy, current in CASES:
+        with open(os.path.join(PAGES_DIR, filename), encoding="utf-8") as f:
+            text = f.read()
+        same = _normalize(legacy(text)) == _normalize(current(text))
+        old_ms, old_peak = measure(legacy, text, args.number)
+        new_ms, new_peak = measure(current, text, args.number)
+        print(f"{name:<10}{'bs4':<8}{old_ms:>10.3f}{old_peak:>12.1f}")
+        print(
+            f"{name:<10}{'lxml':<8}{new_ms:>10.3f}{new_peak:>12.1f}"
+            f"{old_ms / new_ms:>9.1f}x  {same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+from benchmarks import fakeoj
+from core.site import exceptions, get_async_normal_client, get_normal_client, pool
+
+# Drives the site clients against benchmarks/fakeoj.py: how fast the pool of
+# accounts gets submissions to a verdict, and how fast problems are crawled.
+# Client level only, so no database, redis or rate limits are involved.
+
+PENDING_VERDICTS = ("Queuing", "Running", "Compiling", "Being Judged")
+
+
+def _percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench_submit(base_url, site, accounts, submissions, poll_interval):
+    submitted = {}
+    failed = []
+    lock = threading.Lock()
+    counter = iter(range(submissions))
+
+    def submit_all(auth):
+        client = get_normal_client(site, auth, base_url=base_url, prefetch_captcha=True)
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            problem_id = str(fakeoj.FIRST_PROBLEM_ID + n % 100)
+            while True:
+                try:
+                    run_id = client.submit_problem(problem_id, "G++", "int main(){}")
+                    break
+                except exceptions.SubmitTooFrequently:
+                    # The fake judge only throttles with --resubmit-interval.
+                    time.sleep(0.1)
+                except (exceptions.SubmitError, exceptions.ConnectionError):
+                    # Submits are not retried, like in the Submitter.
+                    run_id = None
+                    break
+            with lock:
+                if run_id is None:
+                    failed.append(n)
+                    continue
+                submitted[run_id] = (auth[0], time.monotonic())
+
+    async def poll_all():
+        clients = {
+            auth[0]: get_async_normal_client(site, auth, base_url=base_url)
+            for auth in auths
+        }
+        detected = {}
+        try:
+            while submitters_alive() or len(detected) < len(submitted):
+                with lock:
+                    pending = [x for x in submitted if x not in detected]
+                by_user = {}
+                for run_id in pending:
+                    by_user.setdefault(submitted[run_id][0], []).append(run_id)
+                results = await asyncio.gather(
+                    *(
+                        clients[user].get_submit_statuses(run_ids, user_id=user)
+                        for user, run_ids in by_user.items()
+                    ),
+                    return_exceptions=True,
+                )
+                now = time.monotonic()
+                for result in results:
+                    if isinstance(result, Exception):
+                        continue
+                    for run_id, (verdict, _, _) in result.items():
+                        if verdict not in PENDING_VERDICTS:
+                            detected[run_id] = now
+                await asyncio.sleep(poll_interval)
+        finally:
+            for client in clients.values():
+                await client.close()
+            await pool.close_connectors()
+        return detected
+
+    auths = [(f"bench{x}", "password") for x in range(accounts)]
+    threads = [threading.Thread(target=submit_all, args=(x,)) for x in auths]
+
+    def submitters_alive():
+        return any(x.is_alive() for x in threads)
+
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    detected = asyncio.run(poll_all())
+    elapsed = time.monotonic() - start
+    latencies = [detected[x] - submitted[x][1] for x in detected]
+    print(
+        f"{site} submit: {len(detected)} verdicts in {elapsed:.2f}s, "
+        f"{len(detected) / elapsed:.2f}/s, accounts: {accounts}, "
+        f"failed submits: {len(failed)}"
+    )
+    print(
+        f"  submit->verdict p50 {_percentile(latencies, 0.5):.2f}s, "
+        f"p90 {_percentile(latencies, 0.9):.2f}s, "
+        f"p99 {_percentile(latencies, 0.99):.2f}s, "
+        f"mean {statistics.mean(latencies) if latencies else float('nan'):.2f}s"
+    )
+
+
+def bench_crawl(base_url, site, concurrency, problems):
+    client = get_normal_client(site, base_url=base_url, volume_concurrency=concurrency)
+    start = time.monotonic()
+    problem_list = client.get_problem_list()
+    list_elapsed = time.monotonic() - start
+    start = time.monotonic()
+    for problem_id in problem_list[:problems]:
+        client.get_problem(problem_id)
+    crawl_elapsed = time.monotonic() - start
+    crawled = min(problems, len(problem_list))
+    print(
+        f"{site} crawl: {len(problem_list)} ids in {list_elapsed:.2f}s "
+        f"(volume concurrency {concurrency}), "
+        f"{crawled / crawl_elapsed:.1f} problems/s"
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--url", help="use a running fake judge instead of starting one"
+    )
+    arg_parser.add_argument("--accounts", type=int, default=4)
+    arg_parser.add_argument("--submissions", type=int, default=100)
+    arg_parser.add_argument("--poll-interval", type=float, default=0.5)
+    arg_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    arg_parser.add_argument("--problems", type=int, default=100)
+    fakeoj.add_server_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    server = None
+    url = args.url
+    if url is None:
+        server = fakeoj.start_server(
+            latency=args.latency,
+            error_rate=args.error_rate,
+            judge_delay=args.judge_delay,
+            volumes=args.volumes,
+            resubmit_interval=args.resubmit_interval,
+        )
+        url = server.base_url
+    try:
+        bench_submit(
+            f"{url}/hdu", "hdu", args.accounts, args.submissions, args.poll_interval
+        )
+        for concurrency in args.concurrency:
+            bench_crawl(f"{url}/hdu", "hdu", concurrency, args.problems)
+            bench_crawl(f"{url}/scu/soj", "scu", concurrency, args.problems)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ import os
 import random
 import string
 from datetime import timedelta
-from typing import List
+from typing import Dict, List
 
 import toml
 from celery.schedules import crontab
@@ -47,6 +47,36 @@ class Config(object):
     )
     NORMAL_ACCOUNTS: List[NormalAccount] = []
     CONTEST_ACCOUNTS: List[ContestAccount] = []
+    VOLUME_CONCURRENCY: Dict[str, int] = {"hdu": 4, "scu": 2}
+    # Full crawls write problems in batches of this size, or this often.
+    CRAWL_BATCH_SIZE = 100
+    CRAWL_FLUSH_INTERVAL = 5
+    # Full crawls are split into shards of this many problems.
+    CRAWL_SHARD_SIZE = 200
+    # How many known problems an incremental crawl refreshes besides new ones.
+    CRAWL_REFRESH_COUNT = 300
+    # Where logged in cookies are kept between restarts: "redis", "file" or "none".
+    COOKIE_STORE = "redis"
+    COOKIE_FILE = "cookies.json"
+    # Overrides the judge address of a site, e.g. to use benchmarks/fakeoj.py.
+    BASE_URLS: Dict[str, str] = {}
+    # Worker groups of an oj_name idle for this many seconds are stopped, but
+    # the normal accounts of the sites in WARM_STANDBY are kept running,
+    # started with the VJudge. Contest accounts are started on demand.
+    WORKER_IDLE_TIMEOUT = 60 * 60
+    WARM_STANDBY: Dict[str, bool] = {"hdu": True, "scu": True}
+    # Requests per second, see core/ratelimit.py.
+    RATE_LIMITS: Dict[str, Dict[str, float]] = {
+        "hdu": {"submit-per-account": 0.2, "submit-per-site": 1, "crawl-per-site": 4},
+        "scu": {"submit-per-account": 0.2, "submit-per-site": 1, "crawl-per-site": 4},
+    }
+    # Address and port the VJudge process serves its metrics on, port 0 to
+    # disable.
+    METRICS_ADDR = "127.0.0.1"
+    METRICS_PORT = 9310
+    # Addresses allowed to read /metrics of the web app. Requests forwarded by
+    # a reverse proxy are refused, whatever address the proxy has.
+    METRICS_ALLOW: List[str] = ["127.0.0.1", "::1"]
 
 
 def _load_config_from_file():
@@ -76,6 +106,65 @@ def _load_config_from_file():
             del security["secret-key"]
         if len(security) == 0:
             del config["security"]
+    crawler = config.get("crawler")
+    if crawler is not None:
+        if crawler.get("volume-concurrency") is not None:
+            Config.VOLUME_CONCURRENCY.update(crawler["volume-concurrency"])
+            del crawler["volume-concurrency"]
+        if crawler.get("batch-size") is not None:
+            Config.CRAWL_BATCH_SIZE = crawler["batch-size"]
+            del crawler["batch-size"]
+        if crawler.get("flush-interval") is not None:
+            Config.CRAWL_FLUSH_INTERVAL = crawler["flush-interval"]
+            del crawler["flush-interval"]
+        if crawler.get("shard-size") is not None:
+            Config.CRAWL_SHARD_SIZE = crawler["shard-size"]
+            del crawler["shard-size"]
+        if crawler.get("refresh-count") is not None:
+            Config.CRAWL_REFRESH_COUNT = crawler["refresh-count"]
+            del crawler["refresh-count"]
+        if len(crawler) == 0:
+            del config["crawler"]
+    workers = config.get("workers")
+    if workers is not None:
+        if workers.get("idle-timeout") is not None:
+            Config.WORKER_IDLE_TIMEOUT = workers["idle-timeout"]
+            del workers["idle-timeout"]
+        if workers.get("warm-standby") is not None:
+            Config.WARM_STANDBY.update(workers["warm-standby"])
+            del workers["warm-standby"]
+        if len(workers) == 0:
+            del config["workers"]
+    sessions = config.get("sessions")
+    if sessions is not None:
+        if sessions.get("cookie-store") is not None:
+            Config.COOKIE_STORE = sessions["cookie-store"]
+            del sessions["cookie-store"]
+        if sessions.get("cookie-file") is not None:
+            Config.COOKIE_FILE = sessions["cookie-file"]
+            del sessions["cookie-file"]
+        if len(sessions) == 0:
+            del config["sessions"]
+    metrics = config.get("metrics")
+    if metrics is not None:
+        if metrics.get("addr") is not None:
+            Config.METRICS_ADDR = metrics["addr"]
+            del metrics["addr"]
+        if metrics.get("port") is not None:
+            Config.METRICS_PORT = metrics["port"]
+            del metrics["port"]
+        if metrics.get("allow") is not None:
+            Config.METRICS_ALLOW = metrics["allow"]
+            del metrics["allow"]
+        if len(metrics) == 0:
+            del config["metrics"]
+    if config.get("base-urls") is not None:
+        Config.BASE_URLS.update(config["base-urls"])
+        del config["base-urls"]
+    if config.get("rate-limit") is not None:
+        for site, limits in config["rate-limit"].items():
+            Config.RATE_LIMITS.setdefault(site, {}).update(limits)
+        del config["rate-limit"]
     accounts = config.get("accounts")
     if accounts is not None:
         normal = accounts.get("normal")
@@ -151,10 +240,15 @@ class AppConfig(object):
     ENABLE_UTC = True
     CELERY_ENABLE_UTC = True
     CELERY_BEAT_SCHEDULE = {
+        "refresh_problem_incremental": {
+            "task": "refresh_problem_incremental",
+            # Note: crontab is in UTC.
+            "schedule": crontab(hour={13, 22}, minute=13),
+        },
         "refresh_problem_all": {
             "task": "refresh_problem_all",
             # Note: crontab is in UTC.
-            "schedule": crontab(hour={13, 22}, minute=13),
+            "schedule": crontab(day_of_month=1, hour=4, minute=13),
         },
         "update_problem_all": {
             "task": "update_problem_all",
@@ -1,6 +1,6 @@
 from math import ceil
 
-from sqlalchemy import create_engine, orm
+from sqlalchemy import create_engine, inspect, orm, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
 
@@ -90,6 +90,7 @@ class SQLManager(object):
             )
         else:
             engine = create_engine(Config.DATABASE_URL, echo=False)
+        self._engine = engine
         session_factory = sessionmaker(bind=engine)
         self._session = scoped_session(session_factory)
         self.Model = declarative_base(bind=engine)
@@ -102,5 +103,25 @@ class SQLManager(object):
     def create_all(self):
         self.Model.metadata.create_all()
 
+    def upgrade(self):
+        # Creates the missing tables and adds the columns missing from the
+        # existing ones, so databases created by an older version keep working.
+        # Only nullable columns can be added this way.
+        self.create_all()
+        inspector = inspect(self._engine)
+        for table in self.Model.metadata.sorted_tables:
+            existing = {x["name"] for x in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=self._engine.dialect)
+                with self._engine.begin() as con:
+                    con.execute(
+                        text(
+                            f"ALTER TABLE {table.name} "
+                            f"ADD COLUMN {column.name} {column_type}"
+                        )
+                    )
+
     def drop_all(self):
         self.Model.metadata.drop_all()
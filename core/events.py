@@ -0,0 +1,32 @@
+import json
+
+import redis
+
+from config import Config, logger
+from .stream import add_task
+
+# Every verdict a core submission gets is published here, the web app applies
+# them in app/verdicts.py.
+VERDICT_STREAM = "vjudge-verdict-stream"
+VERDICT_GROUP = "app"
+
+_redis_con = None
+
+
+def publish_verdict(submission):
+    global _redis_con
+    if _redis_con is None:
+        _redis_con = redis.StrictRedis.from_url(Config.DEFAULT_REDIS_URL)
+    data = {
+        "submission_id": submission.id,
+        "verdict": submission.verdict,
+        "exe_time": submission.exe_time,
+        "exe_mem": submission.exe_mem,
+    }
+    try:
+        add_task(_redis_con, VERDICT_STREAM, json.dumps(data))
+    except redis.RedisError as e:
+        # The web app picks the verdict up from the database later.
+        logger.error(
+            f"Publish verdict failed, submission_id: {submission.id}, reason: {e}"
+        )
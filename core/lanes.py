@@ -0,0 +1,100 @@
+import threading
+from collections import deque
+from queue import Empty
+
+# Lane weights, from the most urgent lane down. A lane gets its share of the
+# picks as long as it has items, so lower lanes slow down but never starve.
+SUBMIT_LANES = {"contest": 4, "practice": 1}
+CRAWL_LANES = {"interactive": 4, "bulk": 1}
+
+
+class WeightedLanes(object):
+    # FIFO lanes picked by smooth weighted round robin. Items of unknown lanes
+    # go to the last, least weighted, lane.
+
+    def __init__(self, weights):
+        self._weights = dict(weights)
+        self._default = list(weights)[-1]
+        self._lanes = {x: deque() for x in weights}
+        self._current = {x: 0 for x in weights}
+
+    def __len__(self):
+        return sum(len(x) for x in self._lanes.values())
+
+    def lengths(self):
+        return {x: len(items) for x, items in self._lanes.items()}
+
+    def lane_of(self, lane):
+        return lane if lane in self._lanes else self._default
+
+    def append(self, item, lane=None):
+        self._lanes[self.lane_of(lane)].append(item)
+
+    def appendleft(self, item, lane=None):
+        self._lanes[self.lane_of(lane)].appendleft(item)
+
+    def pop_lane(self, lane):
+        # Pops from one lane only, outside of the round robin.
+        return self._lanes[self.lane_of(lane)].popleft()
+
+    def peek(self):
+        # Returns (lane, item) the next pop returns, raises IndexError if empty.
+        lane = self._pick()
+        return lane, self._lanes[lane][0]
+
+    def pop(self):
+        lane = self._pick()
+        total = 0
+        for x, items in self._lanes.items():
+            if items:
+                self._current[x] += self._weights[x]
+                total += self._weights[x]
+        self._current[lane] -= total
+        return lane, self._lanes[lane].popleft()
+
+    def _pick(self):
+        best = None
+        for x, items in self._lanes.items():
+            if not items:
+                continue
+            score = self._current[x] + self._weights[x]
+            if best is None or score > best[0]:
+                best = (score, x)
+        if best is None:
+            raise IndexError("pop from empty lanes")
+        return best[1]
+
+
+class LaneQueue(object):
+    # A thread safe WeightedLanes with the get/put interface of queue.Queue.
+
+    def __init__(self, weights):
+        self._lanes = WeightedLanes(weights)
+        self._not_empty = threading.Condition()
+
+    def put(self, item, lane=None):
+        with self._not_empty:
+            self._lanes.append(item, lane)
+            self._not_empty.notify()
+
+    def get(self, timeout=None):
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: len(self._lanes) > 0, timeout):
+                raise Empty
+            return self._lanes.pop()[1]
+
+    def get_nowait(self, lane):
+        # Takes the next item of one lane only, raises Empty if it has none.
+        with self._not_empty:
+            try:
+                return self._lanes.pop_lane(lane)
+            except IndexError:
+                raise Empty
+
+    def empty(self):
+        with self._not_empty:
+            return len(self._lanes) == 0
+
+    def lengths(self):
+        with self._not_empty:
+            return self._lanes.lengths()
@@ -0,0 +1,119 @@
+import math
+import threading
+import time
+
+import redis
+
+from config import logger
+from .stream import node_name
+
+# Every account is driven by the one VJudge node holding its lease. Nodes
+# renew their leases on a heartbeat and hold at most a fair share of the
+# accounts, so a new node gets some and the leases of a dead node expire and
+# are taken over within LEASE_TTL.
+LEASE_TTL = 10 * 1000
+HEARTBEAT_INTERVAL = LEASE_TTL / 3 / 1000
+LEASE_PREFIX = "vjudge-lease:"
+NODES_KEY = "vjudge-nodes"
+
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class AccountLeases(threading.Thread):
+    def __init__(self, redis_con, accounts, owner=None, daemon=None):
+        # accounts: (site, username) of every account this node can drive.
+        super().__init__(daemon=daemon)
+        self._redis_con = redis_con
+        self._accounts = sorted(set(accounts))
+        self._owner = owner or node_name()
+        self._held = set()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._renew = redis_con.register_script(RENEW_SCRIPT)
+        self._release = redis_con.register_script(RELEASE_SCRIPT)
+
+    def held(self, site, username):
+        with self._lock:
+            return (site, username) in self._held
+
+    def any_held(self, site, usernames):
+        with self._lock:
+            return any((site, x) in self._held for x in usernames)
+
+    def counts(self):
+        # {site: accounts held}
+        with self._lock:
+            result = {}
+            for site, _ in self._held:
+                result[site] = result.get(site, 0) + 1
+            return result
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def run(self):
+        logger.info(f"Started account leases, owner: {self._owner}")
+        while not self._stop_event.is_set():
+            try:
+                self._heartbeat()
+            except redis.RedisError as e:
+                # Leases left unrenewed expire, stop using them in time.
+                with self._lock:
+                    self._held.clear()
+                logger.error(f"Account lease heartbeat failed, reason: {e}")
+            self._ready.set()
+            self._stop_event.wait(HEARTBEAT_INTERVAL)
+        for account in list(self._held):
+            self._release(keys=[self._key(account)], args=[self._owner])
+        self._redis_con.zrem(NODES_KEY, self._owner)
+        with self._lock:
+            self._held.clear()
+        logger.info(f"Stopped account leases, owner: {self._owner}")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _key(self, account):
+        return f"{LEASE_PREFIX}{account[0]}:{account[1]}"
+
+    def _heartbeat(self):
+        now = time.time()
+        self._redis_con.zadd(NODES_KEY, {self._owner: now})
+        self._redis_con.zremrangebyscore(NODES_KEY, "-inf", now - LEASE_TTL / 1000)
+        nodes = max(1, self._redis_con.zcard(NODES_KEY))
+        share = math.ceil(len(self._accounts) / nodes)
+        held = set()
+        for account in self._held:
+            if self._renew(keys=[self._key(account)], args=[self._owner, LEASE_TTL]):
+                held.add(account)
+            else:
+                logger.warning(f"Lost account lease, account: {account}")
+        for account in sorted(held, reverse=True)[: max(0, len(held) - share)]:
+            # Hand the surplus to the nodes which joined since.
+            self._release(keys=[self._key(account)], args=[self._owner])
+            held.discard(account)
+            logger.info(f"Released account lease, account: {account}")
+        for account in self._accounts:
+            if len(held) >= share:
+                break
+            if account in held:
+                continue
+            if self._redis_con.set(
+                self._key(account), self._owner, nx=True, px=LEASE_TTL
+            ):
+                held.add(account)
+                logger.info(f"Acquired account lease, account: {account}")
+        with self._lock:
+            self._held = held
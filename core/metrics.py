@@ -0,0 +1,163 @@
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import redis
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import Config, logger
+
+# Metrics in the Prometheus text format. The VJudge process serves them on
+# Config.METRICS_PORT, the web app on /metrics.
+
+SUBMITS = Counter(
+    "vjudge_submits",
+    "Submits sent, by account and result",
+    ["site", "account", "result"],
+)
+VERDICT_SECONDS = Histogram(
+    "vjudge_verdict_seconds",
+    "Seconds from submission to the final verdict",
+    ["site"],
+    buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800),
+)
+HTTP_SECONDS = Histogram(
+    "vjudge_http_request_seconds",
+    "Latency of requests to the remote judges",
+    ["site", "endpoint"],
+)
+HTTP_ERRORS = Counter(
+    "vjudge_http_errors",
+    "Requests to the remote judges which failed or got a 5xx response",
+    ["site", "endpoint"],
+)
+PARSE_SECONDS = Histogram(
+    "vjudge_parse_seconds",
+    "Time spent parsing remote pages",
+    ["site", "page"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+DB_COMMIT_SECONDS = Histogram(
+    "vjudge_db_commit_seconds",
+    "Latency of database commits",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class _Gauges(object):
+    # Gauges read from callbacks when scraped. A callback returns
+    # {label values: value}.
+
+    def __init__(self):
+        self._gauges = {}
+
+    def add(self, name, documentation, labels, callback):
+        # Adding a gauge again replaces it.
+        self._gauges[name] = (documentation, labels, callback)
+
+    def collect(self):
+        for name, (documentation, labels, callback) in list(self._gauges.items()):
+            family = GaugeMetricFamily(name, documentation, labels=labels)
+            try:
+                values = callback()
+            except (redis.RedisError, RuntimeError) as e:
+                logger.error(f"Collect metric {name} failed, reason: {e}")
+                continue
+            for label_values, value in values.items():
+                family.add_metric(label_values, value)
+            yield family
+
+
+gauges = _Gauges()
+REGISTRY.register(gauges)
+
+
+def watch_streams(redis_con, streams):
+    # streams: {stream: consumer group}
+    def lengths():
+        return {(x,): redis_con.xlen(x) for x in streams}
+
+    def pending():
+        result = {}
+        for x, group in streams.items():
+            try:
+                result[(x,)] = redis_con.xpending(x, group)["pending"]
+            except redis.ResponseError:
+                # The stream or its group does not exist yet.
+                result[(x,)] = 0
+        return result
+
+    gauges.add(
+        "vjudge_stream_length", "Entries in the task streams", ["stream"], lengths
+    )
+    gauges.add(
+        "vjudge_stream_pending",
+        "Delivered but unacked entries of the task streams",
+        ["stream"],
+        pending,
+    )
+
+
+class _Request(object):
+    def __init__(self):
+        self.status = None
+
+    def set_status(self, status):
+        self.status = status
+
+
+@contextmanager
+def track_request(site, url):
+    # Endpoints are the last part of the path, like "status.php". The caller
+    # sets the response status on the yielded object, 5xx responses left after
+    # the retries are returned, not raised.
+    endpoint = urlsplit(url).path.rsplit("/", 1)[-1]
+    start = time.perf_counter()
+    request = _Request()
+    try:
+        yield request
+    except Exception:
+        HTTP_ERRORS.labels(site, endpoint).inc()
+        raise
+    else:
+        if request.status is not None and request.status >= 500:
+            HTTP_ERRORS.labels(site, endpoint).inc()
+    finally:
+        HTTP_SECONDS.labels(site, endpoint).observe(time.perf_counter() - start)
+
+
+def track_parse(site, page):
+    return PARSE_SECONDS.labels(site, page).time()
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def serve():
+    if Config.METRICS_PORT:
+        start_http_server(Config.METRICS_PORT, addr=Config.METRICS_ADDR)
+        logger.info(
+            f"Serving metrics on {Config.METRICS_ADDR} port {Config.METRICS_PORT}"
+        )
+
+
+def render():
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
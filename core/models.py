@@ -1,4 +1,7 @@
+import hashlib
+import json
 from datetime import datetime, timezone
+
 from sqlalchemy import Column, Integer, Boolean, String, DateTime, UniqueConstraint
 
 from . import db
@@ -49,6 +52,26 @@ class Problem(db.Model):
     sample_output = Column(String)
     time_limit = Column(Integer)
     mem_limit = Column(Integer)
+    # md5 of the parsed statement, used to skip rewriting unchanged pages.
+    digest = Column(String(32))
+
+    content_fields = (
+        "title",
+        "description",
+        "input",
+        "output",
+        "sample_input",
+        "sample_output",
+        "time_limit",
+        "mem_limit",
+    )
+
+    @classmethod
+    def compute_digest(cls, content):
+        values = [content.get(x) for x in cls.content_fields]
+        # Limits are scraped as strings but stored as integers.
+        data = json.dumps([str(x) if x is not None else None for x in values])
+        return hashlib.md5(data.encode("utf-8")).hexdigest()
 
     def to_json(self):
         problem_json = {
@@ -137,3 +160,32 @@ class Contest(db.Model):
             f'<Contest(site={self.site} contest_id={self.contest_id}, title="{self.title}", '
             f"public={self.public}, status={self.status})>"
         )
+
+
+class SubmissionTimeline(db.Model):
+    # When a submission reached each stage of its way to a verdict, one row
+    # per submission, see core/timeline.py.
+    __tablename__ = "core_submission_timelines"
+    submission_id = Column(Integer, primary_key=True)
+    created = Column(DateTime, index=True)
+    enqueued = Column(DateTime)
+    received = Column(DateTime)
+    dequeued = Column(DateTime)
+    submitted = Column(DateTime)
+    first_poll = Column(DateTime)
+    verdict = Column(DateTime)
+    propagated = Column(DateTime)
+
+    stages = (
+        "created",
+        "enqueued",
+        "received",
+        "dequeued",
+        "submitted",
+        "first_poll",
+        "verdict",
+        "propagated",
+    )
+
+    def __repr__(self):
+        return f"<SubmissionTimeline(submission_id={self.submission_id})>"
@@ -0,0 +1,122 @@
+import bisect
+import statistics
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Status polls of a run are planned around the judge time distribution of its
+# site and language: dense around the expected quantiles, then backing off.
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+# Used until a site and language has enough samples.
+DEFAULT_SCHEDULE = (1, 2, 3, 4, 6, 8, 11, 15, 20, 30)
+MIN_SAMPLES = 20
+MAX_SAMPLES = 500
+# Polls of one account are never closer than this.
+MIN_INTERVAL = 0.5
+MAX_INTERVAL = 60
+# Past the schedule, a run waits this fraction of its age between polls.
+BACKOFF_FACTOR = 0.5
+
+
+class JudgeTimes(object):
+    # Recent judge times, i.e. submit to verdict on the judge side, of every
+    # site and language, and the lag until the verdicts were noticed.
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self._max_samples = max_samples
+        self._samples = {}
+        self._schedules = {}
+        self._lags = {}
+        self._lock = threading.Lock()
+
+    def add_sample(self, site, language, judge_time, lag):
+        key = (site, language)
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self._max_samples)
+            self._samples[key].append(judge_time)
+            self._schedules.pop(key, None)
+            if site not in self._lags:
+                self._lags[site] = deque(maxlen=self._max_samples)
+            self._lags[site].append(lag)
+
+    def schedule(self, site, language):
+        key = (site, language)
+        with self._lock:
+            schedule = self._schedules.get(key)
+            if schedule is None:
+                schedule = self._build_schedule(self._samples.get(key, ()))
+                self._schedules[key] = schedule
+            return schedule
+
+    @staticmethod
+    def _build_schedule(samples):
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_SCHEDULE
+        samples = sorted(samples)
+        schedule = []
+        for q in QUANTILES:
+            offset = samples[min(len(samples) - 1, int(q * len(samples)))]
+            if not schedule or offset - schedule[-1] >= MIN_INTERVAL:
+                schedule.append(offset)
+        return tuple(schedule)
+
+    def median_lag(self, site=None):
+        with self._lock:
+            if site is None:
+                lags = [x for v in self._lags.values() for x in v]
+            else:
+                lags = list(self._lags.get(site, ()))
+        return statistics.median(lags) if lags else None
+
+    def sites(self):
+        with self._lock:
+            return list(self._lags)
+
+
+judge_times = JudgeTimes()
+
+
+class PollPlan(object):
+    # When to poll one run next, relative to the time it was submitted.
+
+    def __init__(self, site, language, schedule, learn=True):
+        self.site = site
+        self.language = language
+        # Runs resumed after a restart were submitted at an unknown time, so
+        # their judge times are not learned from.
+        self.learn = learn
+        self.submitted_at = time.monotonic()
+        self.last_poll = self.submitted_at
+        # Wall clock time of the first poll, for core/timeline.py.
+        self.first_polled = None
+        self._schedule = schedule
+
+    def next_poll(self):
+        age = self.last_poll - self.submitted_at
+        i = bisect.bisect_right(self._schedule, age)
+        if i < len(self._schedule):
+            due = self.submitted_at + self._schedule[i]
+        else:
+            due = self.last_poll + min(MAX_INTERVAL, age * BACKOFF_FACTOR)
+        return max(due, self.last_poll + MIN_INTERVAL)
+
+    def polled(self, now, finished):
+        # The verdict came out somewhere between the last poll and this one,
+        # so the middle of that window is the best guess of the judge time.
+        if finished and self.learn:
+            finished_at = (self.last_poll + now) / 2
+            judge_times.add_sample(
+                self.site,
+                self.language,
+                finished_at - self.submitted_at,
+                now - finished_at,
+            )
+        if self.first_polled is None:
+            self.first_polled = datetime.utcnow()
+        self.last_poll = now
+
+
+def new_plan(site, language, learn=True):
+    return PollPlan(site, language, judge_times.schedule(site, language), learn)
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from config import Config
+
+# A throttled bucket drops to half its rate and climbs back by this fraction
+# of the configured rate after every request that went through.
+RECOVER_STEP = 0.1
+MIN_RATE_FACTOR = 1 / 8
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def delay(self):
+        # Seconds until a token is available, without taking it.
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0, (1 - self._tokens) / self.rate)
+            return max(wait, self._blocked_until - now)
+
+    def reserve(self):
+        # Takes a token and returns how long the caller must wait before using
+        # it. Tokens may go negative, which queues callers behind each other.
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = max(0, -self._tokens / self.rate)
+            return max(wait, self._blocked_until - now)
+
+    def backoff(self, retry_after):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.max_rate * MIN_RATE_FACTOR, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+
+    def recover(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                now = time.monotonic()
+                self._refill(now)
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVER_STEP)
+
+
+class RateLimiter(object):
+    # Combines the site wide bucket with the bucket of one account.
+
+    def __init__(self, site_buckets, account_buckets=()):
+        self._site_buckets = list(site_buckets)
+        self._account_buckets = list(account_buckets)
+        self._buckets = self._site_buckets + self._account_buckets
+
+    def delay(self):
+        return max((x.delay() for x in self._buckets), default=0)
+
+    def reserve(self):
+        return max((x.reserve() for x in self._buckets), default=0)
+
+    def acquire(self, stop_event=None):
+        delay = self.reserve()
+        if delay <= 0:
+            return True
+        if stop_event is None:
+            time.sleep(delay)
+            return True
+        return not stop_event.wait(delay)
+
+    def backoff(self, retry_after, site_wide=False):
+        # An account throttled on its own only slows down itself, site_wide
+        # signals like connection errors slow down every account of the site.
+        buckets = self._buckets if site_wide else self._account_buckets
+        for bucket in buckets:
+            bucket.backoff(retry_after)
+
+    def recover(self):
+        for bucket in self._buckets:
+            bucket.recover()
+
+
+_lock = threading.Lock()
+_buckets = {}
+
+
+def _get_bucket(key, rate):
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate)
+            _buckets[key] = bucket
+        return bucket
+
+
+def get_limiter(site, action, account=None):
+    # Rates come from Config.RATE_LIMITS, e.g. "submit-per-site" or
+    # "crawl-per-account", in requests per second. A missing rate means the
+    # action is not limited on that level.
+    limits = Config.RATE_LIMITS.get(site, {})
+    site_buckets = []
+    account_buckets = []
+    rate = limits.get(f"{action}-per-site")
+    if rate:
+        site_buckets.append(_get_bucket((site, action), rate))
+    rate = limits.get(f"{action}-per-account")
+    if rate and account is not None:
+        account_buckets.append(_get_bucket((site, action, account), rate))
+    return RateLimiter(site_buckets, account_buckets)
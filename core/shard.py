@@ -0,0 +1,195 @@
+import heapq
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+
+from config import Config, logger
+from .models import db, Problem, Submission
+from .stream import add_task, CRAWLER_STREAM
+
+# A full or incremental crawl of an oj_name is split into shards of problem
+# ids, each one a crawl task of its own, so every crawler of the site takes
+# part. The progress of the latest run of each kind is kept in a redis hash
+# per kind and oj_name, so a full and an incremental run never block each other.
+PROGRESS_PREFIX = "vjudge-crawl-progress:"
+KINDS = ("full", "incremental")
+PROGRESS_TTL = 7 * 24 * 60 * 60
+# An unfinished run younger than this is resumed instead of starting over.
+RESUME_WINDOW = 24 * 60 * 60
+# A run whose list was not read to the end is only resumed while its shards
+# are still being queued, i.e. one was queued less than this many seconds ago.
+LISTING_TIMEOUT = 10 * 60
+# When each problem was last crawled, a sorted set per oj_name. Incremental
+# crawls refresh the problems which are stale the longest, weighted by traffic.
+CHECKED_PREFIX = "vjudge-crawl-checked:"
+TRAFFIC_WINDOW = timedelta(days=30)
+
+
+class FullCrawls(object):
+    def __init__(self, redis_con, shard_size=None):
+        self._redis_con = redis_con
+        self._shard_size = shard_size or Config.CRAWL_SHARD_SIZE
+
+    @staticmethod
+    def _key(kind, oj_name):
+        return f"{PROGRESS_PREFIX}{kind}:{oj_name}"
+
+    def progress(self, oj_name, kind="full"):
+        data = self._redis_con.hgetall(self._key(kind, oj_name))
+        return {k.decode(): v.decode() for k, v in data.items()}
+
+    def start(self, oj_name, problem_ids, lane=None, kind="full"):
+        # Queues the shards of a new run while problem_ids is iterated, so the
+        # first volumes are crawled while the others are still listed. Returns
+        # the number of shards, or None when the last run is unfinished and
+        # its shards are still queued.
+        progress = self.progress(oj_name, kind)
+        if self._resumable(progress):
+            logger.info(
+                f"Resuming {kind} crawl, name: {oj_name}, run: {progress['run']}, "
+                f"shards done: {progress['done']}/{progress.get('shards', '?')}"
+            )
+            return None
+        run = uuid.uuid4().hex
+        key = self._key(kind, oj_name)
+        with self._redis_con.pipeline() as pipe:
+            pipe.delete(key)
+            pipe.hset(
+                key,
+                mapping={
+                    "run": run,
+                    "done": 0,
+                    "started": time.time(),
+                    "listed": time.time(),
+                },
+            )
+            pipe.expire(key, PROGRESS_TTL)
+            pipe.execute()
+        logger.info(f"Started {kind} crawl, name: {oj_name}, run: {run}")
+        shards = 0
+        problems = 0
+        ids = []
+        try:
+            for problem_id in problem_ids:
+                ids.append(problem_id)
+                if len(ids) == self._shard_size:
+                    self._add_shard(oj_name, kind, run, shards, ids, lane)
+                    shards += 1
+                    problems += len(ids)
+                    ids = []
+            if ids:
+                self._add_shard(oj_name, kind, run, shards, ids, lane)
+                shards += 1
+                problems += len(ids)
+        except Exception:
+            # The next try starts a new run instead of resuming a partial one.
+            self._redis_con.delete(key)
+            raise
+        # The number of shards is known once the whole list is read, shards
+        # finished before that are counted in "done" already.
+        self._redis_con.hset(key, "shards", shards)
+        if int(self._redis_con.hget(key, "done")) >= shards:
+            self._finish(oj_name, kind, run)
+        logger.info(
+            f"Queued {kind} crawl, name: {oj_name}, run: {run}, "
+            f"problems: {problems}, shards: {shards}"
+        )
+        return shards
+
+    @staticmethod
+    def _resumable(progress):
+        if not progress or "finished" in progress:
+            return False
+        if time.time() - float(progress["started"]) >= RESUME_WINDOW:
+            return False
+        if "shards" in progress:
+            return True
+        # The node reading the list died before queueing all of it, the rest
+        # of the problems were never queued.
+        listed = float(progress.get("listed", progress["started"]))
+        return time.time() - listed < LISTING_TIMEOUT
+
+    def _add_shard(self, oj_name, kind, run, shard, problem_ids, lane):
+        self._redis_con.hset(self._key(kind, oj_name), "listed", time.time())
+        data = {
+            "oj_name": oj_name,
+            "type": "problem",
+            "kind": kind,
+            "run": run,
+            "shard": shard,
+            "problem_ids": problem_ids,
+        }
+        add_task(self._redis_con, CRAWLER_STREAM, json.dumps(data), lane)
+
+    def plan_incremental(self, oj_name, problem_ids, refresh_count=None):
+        # Yields the problems an incremental crawl visits: the ones missing
+        # from core_problems as problem_ids come in, then the refresh_count
+        # known ones which have gone unchecked the longest, times (1 + recent
+        # submissions).
+        refresh_count = refresh_count or Config.CRAWL_REFRESH_COUNT
+        known = dict(
+            db.session.query(Problem.problem_id, Problem.last_update).filter(
+                Problem.oj_name == oj_name
+            )
+        )
+        traffic = dict(
+            db.session.query(Submission.problem_id, func.count(Submission.id))
+            .filter(
+                Submission.oj_name == oj_name,
+                Submission.time_stamp >= datetime.utcnow() - TRAFFIC_WINDOW,
+            )
+            .group_by(Submission.problem_id)
+        )
+        checked = {
+            k.decode(): v
+            for k, v in self._redis_con.zrange(
+                CHECKED_PREFIX + oj_name, 0, -1, withscores=True
+            )
+        }
+        now = time.time()
+
+        def weight(problem_id):
+            last_check = checked.get(problem_id)
+            if last_check is None:
+                last_update = known[problem_id].replace(tzinfo=timezone.utc)
+                last_check = last_update.timestamp()
+            return (now - last_check) * (1 + traffic.get(problem_id, 0))
+
+        new = 0
+        listed = []
+        for problem_id in problem_ids:
+            if problem_id in known:
+                listed.append(problem_id)
+            else:
+                new += 1
+                yield problem_id
+        stale = heapq.nlargest(refresh_count, listed, key=weight)
+        logger.info(
+            f"Planned incremental crawl, name: {oj_name}, "
+            f"new: {new}, refreshed: {len(stale)}, known: {len(known)}"
+        )
+        yield from stale
+
+    def finish_shard(self, oj_name, run, shard, problem_ids, kind="full"):
+        if problem_ids:
+            self._redis_con.zadd(
+                CHECKED_PREFIX + oj_name, {x: time.time() for x in problem_ids}
+            )
+        key = self._key(kind, oj_name)
+        if self._redis_con.hget(key, "run") != run.encode():
+            # A shard of an older run, the progress belongs to a newer one.
+            return
+        if not self._redis_con.hsetnx(key, f"shard:{shard}", 1):
+            return
+        done = self._redis_con.hincrby(key, "done", 1)
+        shards = self._redis_con.hget(key, "shards")
+        # Without "shards" the list is still being read, see start.
+        if shards is not None and done >= int(shards):
+            self._finish(oj_name, kind, run)
+
+    def _finish(self, oj_name, kind, run):
+        if self._redis_con.hsetnx(self._key(kind, oj_name), "finished", time.time()):
+            logger.info(f"Finished {kind} crawl, name: {oj_name}, run: {run}")
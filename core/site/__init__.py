@@ -12,23 +12,54 @@ supported_contest_sites = ("hdu",)
 normal_clients = {"scu": SOJClient, "hdu": HDUClient}
 contest_clients = {"hdu": HDUContestClient}
 
+async_normal_clients = {"scu": AsyncSOJClient, "hdu": AsyncHDUClient}
+async_contest_clients = {"hdu": AsyncHDUContestClient}
 
-def get_normal_client(site, auth=None):
+
+def get_normal_client(site, auth=None, **kwargs):
     if site not in supported_sites:
         raise exceptions.JudgeException(f'Site "{site}" is not supported')
-    return normal_clients[site](auth)
+    return normal_clients[site](auth, **kwargs)
 
 
-def get_contest_client(site, auth=None, contest_id=None):
+def get_contest_client(site, auth=None, contest_id=None, **kwargs):
     if site not in supported_contest_sites:
         raise exceptions.JudgeException(f'Site "{site}" is not supported')
-    return contest_clients[site](auth, contest_id)
+    return contest_clients[site](auth, contest_id, **kwargs)
 
 
-def get_client_by_oj_name(name, auth=None):
+def get_client_by_oj_name(name, auth=None, **kwargs):
     res = re.match(r"^(.*?)_ct_([0-9]+)$", name)
     if res:
         site, contest_id = res.groups()
-        return get_contest_client(site, auth, contest_id)
+        return get_contest_client(site, auth, contest_id, **kwargs)
     else:
-        return get_normal_client(name, auth)
+        return get_normal_client(name, auth, **kwargs)
+
+
+def get_async_normal_client(site, auth=None, **kwargs):
+    if site not in supported_sites:
+        raise exceptions.JudgeException(f'Site "{site}" is not supported')
+    return async_normal_clients[site](auth, **kwargs)
+
+
+def get_async_contest_client(site, auth=None, contest_id=None, **kwargs):
+    if site not in supported_contest_sites:
+        raise exceptions.JudgeException(f'Site "{site}" is not supported')
+    return async_contest_clients[site](auth, contest_id, **kwargs)
+
+
+def get_async_client_by_oj_name(name, auth=None, **kwargs):
+    res = re.match(r"^(.*?)_ct_([0-9]+)$", name)
+    if res:
+        site, contest_id = res.groups()
+        return get_async_contest_client(site, auth, contest_id, **kwargs)
+    else:
+        return get_async_normal_client(name, auth, **kwargs)
+
+
+def get_site_by_oj_name(name):
+    res = re.match(r"^(.*?)_ct_([0-9]+)$", name)
+    if res:
+        return res.group(1)
+    return name
@@ -1,17 +1,38 @@
 import logging
 from abc import abstractmethod, ABC
 
-import requests
+import aiohttp
+from requests.utils import dict_from_cookiejar
+from yarl import URL
 
+from . import pool
 from .masquerade import get_header
 
 logging.basicConfig(level=logging.INFO)
 
 
 class BaseClient(ABC):
-    def __init__(self):
-        self._session = requests.session()
-        self._session.headers.update(get_header())
+    def __init__(self, site, base_url, cookie_store=None):
+        # Connections are pooled per site, cookies stay per client.
+        self._session = pool.new_session(site, base_url)
+        self._cookie_store = cookie_store
+
+    def _get_cookie_key(self):
+        raise NotImplementedError
+
+    def _restore_cookies(self):
+        if self._cookie_store is None:
+            return False
+        cookies = self._cookie_store.load(self._get_cookie_key())
+        if not cookies:
+            return False
+        self._session.cookies.update(cookies)
+        return True
+
+    def _save_cookies(self):
+        if self._cookie_store is not None:
+            cookies = dict_from_cookiejar(self._session.cookies)
+            self._cookie_store.save(self._get_cookie_key(), cookies)
 
     @abstractmethod
     def get_name(self):
@@ -45,6 +66,10 @@ class BaseClient(ABC):
     def get_problem_list(self):
         pass
 
+    @abstractmethod
+    def iter_problem_list(self):
+        pass
+
     @abstractmethod
     def submit_problem(self, problem_id, language, source_code):
         pass
@@ -53,6 +78,102 @@ class BaseClient(ABC):
     def get_submit_status(self, run_id, **kwargs):
         pass
 
+    @abstractmethod
+    def get_submit_statuses(self, run_ids, **kwargs):
+        pass
+
+
+class AsyncBaseClient(ABC):
+    def __init__(self, site, base_url, cookie_store=None):
+        self._session = None
+        self._site = site
+        self._base_url = base_url
+        self._cookie_store = cookie_store
+        self._headers = get_header()
+        self.auth = None
+
+    def _get_session(self):
+        # aiohttp sessions must be created inside a running event loop,
+        # so the session is built lazily on the first request.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=pool.get_connector(self._site),
+                connector_owner=False,
+                headers=self._headers,
+            )
+            self._restore_cookies()
+        return self._session
+
+    def _get_cookie_key(self):
+        raise NotImplementedError
+
+    def _restore_cookies(self):
+        if self._cookie_store is None or self.auth is None:
+            return False
+        cookies = self._cookie_store.load(self._get_cookie_key())
+        if not cookies:
+            return False
+        self._session.cookie_jar.update_cookies(cookies, URL(self._base_url))
+        return True
+
+    def _save_cookies(self):
+        if self._cookie_store is not None:
+            cookies = {x.key: x.value for x in self._get_session().cookie_jar}
+            self._cookie_store.save(self._get_cookie_key(), cookies)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @abstractmethod
+    def get_name(self):
+        pass
+
+    @abstractmethod
+    def get_user_id(self):
+        pass
+
+    @abstractmethod
+    def get_client_type(self):
+        pass
+
+    @abstractmethod
+    async def login(self, username, password):
+        pass
+
+    @abstractmethod
+    async def check_login(self):
+        pass
+
+    @abstractmethod
+    async def update_cookies(self):
+        pass
+
+    @abstractmethod
+    async def get_problem(self, problem_id):
+        pass
+
+    @abstractmethod
+    async def get_problem_list(self):
+        pass
+
+    @abstractmethod
+    def iter_problem_list(self):
+        pass
+
+    @abstractmethod
+    async def submit_problem(self, problem_id, language, source_code):
+        pass
+
+    @abstractmethod
+    async def get_submit_status(self, run_id, **kwargs):
+        pass
+
+    @abstractmethod
+    async def get_submit_statuses(self, run_ids, **kwargs):
+        pass
+
 
 class ContestInfo(object):
     def __init__(
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import redis
+
+
+class CookieStore(ABC):
+    # Keeps the cookies of logged in clients, so new clients of the same
+    # account (in any process) can skip the login.
+
+    @abstractmethod
+    def load(self, key):
+        pass
+
+    @abstractmethod
+    def save(self, key, cookies):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+
+class FileCookieStore(CookieStore):
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self._path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data):
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path)
+
+    def load(self, key):
+        with self._lock:
+            return self._read().get(key)
+
+    def save(self, key, cookies):
+        with self._lock:
+            data = self._read()
+            data[key] = cookies
+            self._write(data)
+
+    def delete(self, key):
+        with self._lock:
+            data = self._read()
+            if data.pop(key, None) is not None:
+                self._write(data)
+
+
+class RedisCookieStore(CookieStore):
+    def __init__(self, redis_con, prefix="vjudge-cookies:", ttl=24 * 60 * 60):
+        self._redis_con = redis_con
+        self._prefix = prefix
+        self._ttl = ttl
+
+    def load(self, key):
+        try:
+            data = self._redis_con.get(self._prefix + key)
+        except redis.RedisError:
+            return None
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def save(self, key, cookies):
+        try:
+            self._redis_con.set(self._prefix + key, json.dumps(cookies), ex=self._ttl)
+        except redis.RedisError:
+            pass
+
+    def delete(self, key):
+        try:
+            self._redis_con.delete(self._prefix + key)
+        except redis.RedisError:
+            pass
@@ -24,3 +24,11 @@ class LoginRequired(JudgeException):
 
 class SubmitError(JudgeException):
     pass
+
+
+class SubmitTooFrequently(SubmitError):
+    # site_wide: the whole site is throttled, not only the account.
+    def __init__(self, message, retry_after=5, site_wide=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.site_wide = site_wide
@@ -1,38 +1,249 @@
+import asyncio
 import re
+import threading
+import time
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
-from urllib.parse import urljoin
 
+import aiohttp
 import requests
 from bs4 import BeautifulSoup
-from bs4.element import NavigableString
 
-from .. import exceptions
-from ..base import BaseClient, ContestClient, ContestInfo
+from config import logger
+from . import parser
+from ... import metrics
+from .. import exceptions, pool
+from ..base import AsyncBaseClient, BaseClient, ContestClient, ContestInfo
 
-__all__ = ("HDUClient", "HDUContestClient")
+__all__ = ("HDUClient", "HDUContestClient", "AsyncHDUClient", "AsyncHDUContestClient")
 
 BASE_URL = "https://acm.hdu.edu.cn"
 
-PAGE_TITLES = {
-    "Problem Description": "description",
-    "Input": "input",
-    "Output": "output",
-    "Sample Input": "sample_input",
-    "Sample Output": "sample_output",
-}
+# Default number of problem volumes fetched in parallel.
+VOLUME_CONCURRENCY = 4
 
+# How long a scraped language table is trusted before the submit page is
+# fetched again.
+LANGUAGE_CACHE_TTL = 60 * 60
 
-class _UniClient(BaseClient):
-    def __init__(self, auth=None, client_type="practice", contest_id="0", timeout=5):
-        super().__init__()
+
+class _LanguageCache(object):
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            langs, expire_at = entry
+            if time.monotonic() >= expire_at:
+                del self._entries[key]
+                return None
+            return langs
+
+    def set(self, key, langs):
+        with self._lock:
+            self._entries[key] = (langs, time.monotonic() + self._ttl)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# Language tables are per site/contest, so they are shared by every client.
+_language_cache = _LanguageCache(LANGUAGE_CACHE_TTL)
+
+
+def _volume_failed(oj_name, vol, e):
+    # The volume is left out of the problem list, its problems are crawled
+    # by the next full or incremental crawl.
+    logger.warning(f"Skipped problem volume, name: {oj_name}, vol: {vol}, reason: {e}")
+
+
+def _run_id_key(run_id):
+    try:
+        return int(run_id)
+    except ValueError:
+        return 0
+
+
+class _UniPages(object):
+    # URL builders and page parsers shared by the sync and async clients.
+    # Subclasses must set `base_url`, `client_type` and `contest_id`.
+
+    def _get_login_url(self):
+        login_url = f"{self.base_url}/userloginex.php?action=login"
+        if self.client_type == "contest":
+            login_url += f"&cid={self.contest_id}&notice=0"
+        return login_url
+
+    def _get_submit_url(self):
+        if self.client_type == "contest":
+            return f"{self.base_url}/contests/contest_submit.php?action=submit&cid={self.contest_id}"
+        else:
+            return f"{self.base_url}/submit.php?action=submit"
+
+    def _get_submit_page_url(self, problem_id):
+        if self.client_type == "contest":
+            return f"{self.base_url}/contests/contest_submit.php?cid={self.contest_id}&pid={problem_id}"
+        else:
+            return f"{self.base_url}/submit.php?pid={problem_id}"
+
+    def _get_status_url(self, run_id="", problem_id="", user_id=""):
+        if self.client_type == "contest":
+            return (
+                f"{self.base_url}/contests/contest_status.php?"
+                f"cid={self.contest_id}&pid={problem_id}&user={user_id}&lang=0&status=0"
+            )
+        else:
+            return f"{self.base_url}/status.php?first={run_id}&pid={problem_id}&user={user_id}&lang=0&status=0"
+
+    def _get_problem_url(self, problem_id):
+        if self.client_type == "contest":
+            return f"{self.base_url}/contests/contest_showproblem.php?pid={problem_id}&cid={self.contest_id}"
+        else:
+            return f"{self.base_url}/showproblem.php?pid={problem_id}"
+
+    def _get_language_cache_key(self):
+        return self.client_type, self.contest_id
+
+    def _get_cookie_key(self):
+        # Contest logins are separate sessions on HDU.
+        if self.client_type == "contest":
+            return f"hdu_ct_{self.contest_id}:{self.username}"
+        return f"hdu:{self.username}"
+
+    def _build_submit_data(self, problem_id, lang_id, source_code):
+        if self.client_type == "contest":
+            source_code = _UniPages._encode_source_code(source_code)
+        data = {
+            "problemid": problem_id,
+            "language": lang_id,
+            "usercode": source_code,
+        }
+        if self.client_type == "contest":
+            data["submit"] = "Submit"
+        else:
+            data["check"] = "0"
+        return data
+
+    @metrics.track_parse("hdu", "problem")
+    def _parse_problem(self, text):
+        return parser.parse_problem(text, self._get_problem_url(""))
+
+    @staticmethod
+    def _check_response(text):
+        if re.search("Sign In Your Account", text):
+            raise exceptions.LoginRequired("Login is required")
+        if re.search("Account Verification", text):
+            raise exceptions.LoginError("Account verification is required")
+        if re.search("Waiting account to be approved", text):
+            raise exceptions.LoginError("Account is not approved")
+
+    def _check_submit_result(self, text):
+        try:
+            self._check_submit_response(text)
+        except exceptions.SubmitTooFrequently:
+            raise
+        except exceptions.SubmitError:
+            # HDU answers a language id it does not take like any other failed
+            # submit, so the cached language table may be stale. Scrape it
+            # again next time.
+            _language_cache.invalidate(self._get_language_cache_key())
+            raise
+
+    @staticmethod
+    def _check_submit_response(text):
+        if re.search("Code length is improper", text):
+            raise exceptions.SubmitError("Code length is too short")
+        if re.search("Please don't re-submit in 5 seconds, thank you.", text):
+            raise exceptions.SubmitTooFrequently("Submit too frequently", retry_after=5)
+        if not re.search("Realtime Status", text):
+            raise exceptions.SubmitError("Submit failed unexpectedly")
+
+    @staticmethod
+    def _find_run_id(text):
+        run_id = parser.find_run_id(text)
+        if run_id is None:
+            raise exceptions.SubmitError("Submit failed unexpectedly")
+        return run_id
+
+    @staticmethod
+    def _parse_language_ids(text):
+        return parser.parse_language_ids(text)
+
+    @staticmethod
+    def _select_language(langs, language):
+        target = language.lower()
+
+        # Hack: Force to use 'G++' or 'GCC' if possible. Our frontend only support 'C++' and 'C'.
+        # But 'G++' and 'GCC' are the default languages for real competition.
+        if target == "c++" or target == "g++":
+            if "g++" in langs:
+                return langs["g++"]
+            elif "c++" in langs:
+                return langs["c++"]
+            return None
+        if target == "c" or target == "gcc":
+            if "gcc" in langs:
+                return langs["gcc"]
+            elif "c" in langs:
+                return langs["c"]
+            return None
+        return langs.get(target)
+
+    @staticmethod
+    def _find_verdict(text, run_id):
+        return _UniPages._find_verdicts(text).get(run_id)
+
+    @staticmethod
+    @metrics.track_parse("hdu", "status")
+    def _find_verdicts(text):
+        return parser.find_verdicts(text)
+
+    @staticmethod
+    def _older_runs(run_ids, verdicts):
+        # The practice status page lists runs in descending order starting at
+        # `first`, so runs below the last row need another page.
+        try:
+            lowest = min(int(x) for x in verdicts)
+            return [x for x in run_ids if x not in verdicts and int(x) < lowest]
+        except ValueError:
+            return []
+
+    @staticmethod
+    def _encode_source_code(code):
+        from urllib import parse
+        import base64
+
+        return base64.b64encode(parse.quote(code).encode("utf-8")).decode("utf-8")
+
+
+class _UniClient(_UniPages, BaseClient):
+    def __init__(
+        self,
+        auth=None,
+        client_type="practice",
+        contest_id="0",
+        timeout=5,
+        base_url=None,
+        cookie_store=None,
+    ):
+        self.base_url = base_url or BASE_URL
+        super().__init__("hdu", self.base_url, cookie_store)
         self.auth = auth
         self.client_type = client_type
         self.contest_id = contest_id
         self.timeout = timeout
         if auth is not None:
             self.username, self.password = auth
-            self.login(self.username, self.password)
+            # Stored cookies are trusted until a page asks to sign in again.
+            if not self._restore_cookies():
+                self.login(self.username, self.password)
 
     @abstractmethod
     def get_name(self):
@@ -56,6 +267,7 @@ class _UniClient(BaseClient):
         self.auth = (username, password)
         self.username = username
         self.password = password
+        self._save_cookies()
 
     @abstractmethod
     def check_login(self):
@@ -75,75 +287,38 @@ class _UniClient(BaseClient):
     def get_problem_list(self):
         pass
 
+    @abstractmethod
+    def iter_problem_list(self):
+        pass
+
     def submit_problem(self, problem_id, language, source_code):
         if self.auth is None:
             raise exceptions.LoginRequired("Login is required")
         lang_id = self._find_language_id(problem_id, language)
         if lang_id is None:
             raise exceptions.SubmitError(f'Language "{language}" is not supported')
-        if self.client_type == "contest":
-            source_code = self.__class__._encode_source_code(source_code)
-        data = {
-            "problemid": problem_id,
-            "language": lang_id,
-            "usercode": source_code,
-        }
-        if self.client_type == "contest":
-            data["submit"] = "Submit"
-        else:
-            data["check"] = "0"
+        data = self._build_submit_data(problem_id, lang_id, source_code)
         url = self._get_submit_url()
         resp = self._request_url("post", url, data=data)
-        if re.search("Code length is improper", resp):
-            raise exceptions.SubmitError("Code length is too short")
-        if re.search("Please don't re-submit in 5 seconds, thank you.", resp):
-            raise exceptions.SubmitError("Submit too frequently")
-        if not re.search("Realtime Status", resp):
-            raise exceptions.SubmitError("Submit failed unexpectedly")
+        self._check_submit_result(resp)
         url = self._get_status_url(problem_id=problem_id, user_id=self.username)
         resp = self._request_url("get", url)
-        try:
-            tables = BeautifulSoup(resp, "lxml").find_all("table")
-            tables.reverse()
-            pattern = re.compile(r"Run ID.*Judge Status.*Author", re.DOTALL)
-            table = next(filter(lambda x: re.search(pattern, str(x)), tables))
-            tag = table.find("tr", align="center")
-            run_id = tag.find("td").text.strip()
-        except (AttributeError, StopIteration):
-            raise exceptions.SubmitError("Submit failed unexpectedly")
-        return run_id
+        return self._find_run_id(resp)
 
     def _find_language_id(self, problem_id, language):
-        url = self._get_submit_page_url(problem_id)
-        resp = self._request_url("get", url)
-        select = BeautifulSoup(resp, "lxml").find("select", attrs={"name": "language"})
-        if select is None:
-            return None
-        options = select.find_all("option")
-        langs = {}
-        for option in options:
-            try:
-                lang_id = option["value"]
-            except KeyError:
-                continue
-            langs[option.text.strip().lower()] = lang_id
-        target = language.lower()
-
-        # Hack: Force to use 'G++' or 'GCC' if possible. Our frontend only support 'C++' and 'C'.
-        # But 'G++' and 'GCC' are the default languages for real competition.
-        if target == "c++" or target == "g++":
-            if "g++" in langs:
-                return langs["g++"]
-            elif "c++" in langs:
-                return langs["c++"]
-            return None
-        if target == "c" or target == "gcc":
-            if "gcc" in langs:
-                return langs["gcc"]
-            elif "c" in langs:
-                return langs["c"]
-            return None
-        return langs.get(target)
+        key = self._get_language_cache_key()
+        langs = _language_cache.get(key)
+        if langs is None:
+            url = self._get_submit_page_url(problem_id)
+            resp = self._request_url("get", url)
+            langs = self._parse_language_ids(resp)
+            if not langs:
+                return None
+            _language_cache.set(key, langs)
+        lang_id = self._select_language(langs, language)
+        if lang_id is None:
+            _language_cache.invalidate(key)
+        return lang_id
 
     def get_submit_status(self, run_id, **kwargs):
         user_id = kwargs.get("user_id", "")
@@ -163,130 +338,48 @@ class _UniClient(BaseClient):
                 if result is not None:
                     return result
 
+    def get_submit_statuses(self, run_ids, **kwargs):
+        user_id = kwargs.get("user_id", "")
+        run_ids = sorted(set(run_ids), key=_run_id_key, reverse=True)
+        result = {}
+        if self.client_type == "contest":
+            url = self._get_status_url(user_id=user_id)
+            for page in range(1, 5):
+                resp = self._request_url("get", url + f"&page={page}")
+                verdicts = self._find_verdicts(resp)
+                result.update((x, verdicts[x]) for x in run_ids if x in verdicts)
+                if not verdicts or len(result) == len(run_ids):
+                    break
+            return result
+        pending = run_ids
+        while pending:
+            url = self._get_status_url(run_id=pending[0], user_id=user_id)
+            resp = self._request_url("get", url)
+            verdicts = self._find_verdicts(resp)
+            if not verdicts:
+                break
+            result.update((x, verdicts[x]) for x in pending if x in verdicts)
+            pending = self._older_runs(pending, verdicts)
+        return result
+
     def _request_url(self, method, url, data=None, timeout=None):
         if timeout is None:
             timeout = self.timeout
         try:
-            r = self._session.request(method, url, data=data, timeout=timeout)
+            with metrics.track_request("hdu", url) as tracked:
+                r = self._session.request(method, url, data=data, timeout=timeout)
+                tracked.set_status(r.status_code)
         except requests.exceptions.RequestException:
             raise exceptions.ConnectionError(f'Request "{url}" failed')
-        if re.search("Sign In Your Account", r.text):
-            raise exceptions.LoginRequired("Login is required")
-        if re.search("Account Verification", r.text):
-            raise exceptions.LoginError("Account verification is required")
-        if re.search("Waiting account to be approved", r.text):
-            raise exceptions.LoginError("Account is not approved")
+        self._check_response(r.text)
         return r.text
 
-    def _get_login_url(self):
-        login_url = f"{BASE_URL}/userloginex.php?action=login"
-        if self.client_type == "contest":
-            login_url += f"&cid={self.contest_id}&notice=0"
-        return login_url
-
-    def _get_submit_url(self):
-        if self.client_type == "contest":
-            return f"{BASE_URL}/contests/contest_submit.php?action=submit&cid={self.contest_id}"
-        else:
-            return f"{BASE_URL}/submit.php?action=submit"
-
-    def _get_submit_page_url(self, problem_id):
-        if self.client_type == "contest":
-            return f"{BASE_URL}/contests/contest_submit.php?cid={self.contest_id}&pid={problem_id}"
-        else:
-            return f"{BASE_URL}/submit.php?pid={problem_id}"
-
-    def _get_status_url(self, run_id="", problem_id="", user_id=""):
-        if self.client_type == "contest":
-            return (
-                f"{BASE_URL}/contests/contest_status.php?"
-                f"cid={self.contest_id}&pid={problem_id}&user={user_id}&lang=0&status=0"
-            )
-        else:
-            return f"{BASE_URL}/status.php?first={run_id}&pid={problem_id}&user={user_id}&lang=0&status=0"
-
-    def _get_problem_url(self, problem_id):
-        if self.client_type == "contest":
-            return f"{BASE_URL}/contests/contest_showproblem.php?pid={problem_id}&cid={self.contest_id}"
-        else:
-            return f"{BASE_URL}/showproblem.php?pid={problem_id}"
-
-    def _parse_problem(self, text):
-        result = {}
-        pattern = re.compile(
-            (
-                r"Time Limit:.*?[0-9]*/([0-9]*).*?MS.*?\(Java/Others\).*?"
-                "Memory Limit:.*?[0-9]*/([0-9]*).*?K.*?\(Java/Others\)"
-            )
-        )
-        # find time limit and mem limit
-        limit = re.search(pattern, text)
-        if limit:
-            result["time_limit"] = limit.group(1)
-            result["mem_limit"] = limit.group(2)
-        soup = BeautifulSoup(text, "lxml")
-        # replace relative url
-        img_tags = soup.find_all("img")
-        for tag in img_tags:
-            if hasattr(tag, "src"):
-                img_url = urljoin(self._get_problem_url(""), tag["src"])
-                tag["src"] = img_url
-        if soup.h1:
-            result["title"] = soup.h1.text
-            if result["title"] == "System Message":
-                return
-        tags = soup.find_all("div", "panel_title", align="left")
-        for t in tags:
-            title = t.string
-            if title in PAGE_TITLES:
-                tag = t.next_sibling
-                limit = 0
-                while tag and type(tag) is NavigableString and limit < 3:
-                    tag = tag.next_sibling
-                    limit += 1
-                if tag is None or type(tag) is NavigableString:
-                    continue
-                res = re.match("<div.*?>(.*)</div>$", str(tag), re.DOTALL)
-                if res:
-                    result[PAGE_TITLES[title]] = res.group(1)
-        return result
-
-    @staticmethod
-    def _find_verdict(text, run_id):
-        soup = BeautifulSoup(text, "lxml")
-        tables = soup.find_all("table")
-        tables.reverse()
-        try:
-            pattern = re.compile(r"Run ID.*Judge Status.*Author", re.DOTALL)
-            table = next(filter(lambda x: re.search(pattern, str(x)), tables))
-        except StopIteration:
-            return
-        tags = table.find_all("tr", align="center")
-        for tag in tags:
-            result = [x.text.strip() for x in tag.find_all("td")]
-            if len(result) < 6:
-                continue
-            if result[0] == run_id:
-                verdict = result[2]
-                try:
-                    exe_time = int(result[4].replace("MS", ""))
-                    exe_mem = int(result[5].replace("K", ""))
-                except ValueError:
-                    continue
-                if re.search("Runtime Error", verdict):
-                    verdict = "Runtime Error"
-                return verdict, exe_time, exe_mem
-
-    @staticmethod
-    def _encode_source_code(code):
-        from urllib import parse
-        import base64
-
-        return base64.b64encode(parse.quote(code).encode("utf-8")).decode("utf-8")
-
 
 class HDUClient(_UniClient):
     def __init__(self, auth=None, **kwargs):
+        self.volume_concurrency = kwargs.pop("volume_concurrency", VOLUME_CONCURRENCY)
+        # HDU has no submit captcha.
+        kwargs.pop("prefetch_captcha", None)
         super().__init__(auth, **kwargs)
         self.name = "hdu"
 
@@ -294,7 +387,7 @@ class HDUClient(_UniClient):
         return self.name
 
     def check_login(self):
-        url = BASE_URL + "/control_panel.php"
+        url = self.base_url + "/control_panel.php"
         try:
             self._request_url("get", url)
         except exceptions.LoginRequired:
@@ -302,25 +395,39 @@ class HDUClient(_UniClient):
         return True
 
     def get_problem_list(self):
-        url = f"{BASE_URL}/listproblem.php"
+        return sorted(self.iter_problem_list())
+
+    def iter_problem_list(self):
+        url = f"{self.base_url}/listproblem.php"
         resp = self._request_url("get", url)
-        vols = set(re.findall(r"listproblem.php\?vol=([0-9]+)", resp))
+        vols = self.__class__._parse_volumes(resp)
+        executor = ThreadPoolExecutor(max_workers=self.volume_concurrency)
+        futures = {
+            executor.submit(self._request_url, "get", url + f"?vol={vol}"): vol
+            for vol in vols
+        }
+        try:
+            for future in as_completed(futures):
+                try:
+                    resp = future.result()
+                except exceptions.ConnectionError as e:
+                    _volume_failed(self.get_name(), futures[future], e)
+                    continue
+                yield from self.__class__._parse_problem_id(resp)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _parse_volumes(text):
+        vols = set(re.findall(r"listproblem.php\?vol=([0-9]+)", text))
         vols = [int(x) for x in vols]
         vols.sort()
-        result = []
-        for vol in vols:
-            ex_url = url + f"?vol={vol}"
-            vol += 1
-            try:
-                resp = self._request_url("get", ex_url)
-            except exceptions.ConnectionError:
-                break
-            ids = self.__class__._parse_problem_id(resp)
-            result += ids
-        result.sort()
-        return result
+        return vols
 
     @staticmethod
+    @metrics.track_parse("hdu", "problem_list")
     def _parse_problem_id(text):
         pattern = re.compile(r"p\([^,()]+?,([^,()]+?)(,[^,()]+?){4}\);", re.DOTALL)
         res = re.findall(pattern, text)
@@ -330,12 +437,21 @@ class HDUClient(_UniClient):
 class HDUContestClient(_UniClient, ContestClient):
     def __init__(self, auth=None, contest_id=None, **kwargs):
         timeout = kwargs.get("timeout", 5)
+        base_url = kwargs.get("base_url")
+        cookie_store = kwargs.get("cookie_store")
         if contest_id is None:
             raise exceptions.JudgeException("You must specific a contest id")
-        super().__init__(auth, "contest", str(contest_id), timeout)
+        super().__init__(
+            auth, "contest", str(contest_id), timeout, base_url, cookie_store
+        )
         self.name = f"hdu_ct_{contest_id}"
         self._contest_info = ContestInfo("hdu", self.contest_id)
-        self.refresh_contest_info()
+        try:
+            self.refresh_contest_info()
+        except exceptions.LoginRequired:
+            # The stored cookies of a private contest have expired.
+            self.update_cookies()
+            self.refresh_contest_info()
 
     def get_name(self):
         return self.name
@@ -344,7 +460,13 @@ class HDUContestClient(_UniClient, ContestClient):
         return self.contest_id
 
     def check_login(self):
-        raise NotImplementedError
+        # The submit page of a contest is only shown to a logged in account.
+        url = self._get_submit_page_url("")
+        try:
+            self._request_url("get", url)
+        except exceptions.LoginRequired:
+            return False
+        return True
 
     def get_contest_info(self):
         return self._contest_info
@@ -352,6 +474,9 @@ class HDUContestClient(_UniClient, ContestClient):
     def get_problem_list(self):
         return self._contest_info.problem_list
 
+    def iter_problem_list(self):
+        yield from self._contest_info.problem_list
+
     def get_problem(self, problem_id):
         if not self._contest_info.public and self.auth is None:
             raise exceptions.LoginRequired("Login is required")
@@ -370,46 +495,36 @@ class HDUContestClient(_UniClient, ContestClient):
             raise exceptions.LoginRequired("Login is required")
         return super().get_submit_status(run_id, **kwargs)
 
+    def get_submit_statuses(self, run_ids, **kwargs):
+        if not self._contest_info.public and self.auth is None:
+            raise exceptions.LoginRequired("Login is required")
+        return super().get_submit_statuses(run_ids, **kwargs)
+
     def refresh_contest_info(self):
-        url = f"{BASE_URL}/contests/contest_show.php?cid={self.contest_id}"
+        url = f"{self.base_url}/contests/contest_show.php?cid={self.contest_id}"
         resp = self._request_url("get", url)
         if re.search(r"System Message", resp):
             raise exceptions.ConnectionError(f"Contest {self.contest_id} not exists")
-        self._contest_info.problem_list = self.__class__._parse_problem_id(resp)
-        soup = BeautifulSoup(resp, "lxml")
-        h1 = self._contest_info.title = soup.h1
-        if h1:
-            self._contest_info.title = h1.get_text()
-        divs = soup.find_all("div")
-        divs.reverse()
-        try:
-            pattern = re.compile(
-                r"Start.*Time.*Contest.*Type.*Contest.*Status", re.DOTALL
-            )
-            div = next(filter(lambda x: re.search(pattern, str(x)), divs))
-        except StopIteration:
-            return
-        pattern = re.compile(
-            r"Start *?Time *?: *?([0-9]{4})-([0-9]{2})-([0-9]{2}) *?([0-9]{2}):([0-9]{2}):([0-9]{2}).*?"
-            r"End *?Time *?: *?([0-9]{4})-([0-9]{2})-([0-9]{2}) *?([0-9]{2}):([0-9]{2}):([0-9]{2}).*?"
-            r"Contest *?Type *?:(.*?)Contest *?Status.*?:(.*?)Current.*?Server.*?Time",
-            re.DOTALL,
-        )
-        res = re.search(pattern, div.get_text())
-        if res:
-            res = [x.strip() for x in res.groups()]
-            self._contest_info.start_time = self._to_timestamp(res[0:6])
-            self._contest_info.end_time = self._to_timestamp(res[6:12])
-            self._contest_info.public = res[12] == "Public"
-            self._contest_info.status = res[13]
+        self.__class__._parse_contest_info(resp, self._contest_info)
 
     @classmethod
-    def get_recent_contest(cls):
-        from ..base import get_header
+    def _parse_contest_info(cls, text, contest_info):
+        title, problem_list, times = parser.parse_contest_info(text)
+        contest_info.problem_list = problem_list
+        contest_info.title = title
+        if times is None:
+            return
+        start_time, end_time, contest_type, status = times
+        contest_info.start_time = cls._to_timestamp(start_time)
+        contest_info.end_time = cls._to_timestamp(end_time)
+        contest_info.public = contest_type == "Public"
+        contest_info.status = status
 
-        session = requests.session()
-        session.headers.update(get_header())
-        url = f"{BASE_URL}/contests/contest_list.php"
+    @classmethod
+    def get_recent_contest(cls, base_url=None):
+        base_url = base_url or BASE_URL
+        session = pool.new_session("hdu", base_url)
+        url = f"{base_url}/contests/contest_list.php"
         try:
             r = session.get(url, timeout=5)
         except requests.exceptions.RequestException:
@@ -434,7 +549,7 @@ class HDUContestClient(_UniClient, ContestClient):
             )
             if res:
                 contest_info.start_time = cls._to_timestamp(res.groups())
-            end_time = cls._find_contest_end_time(tds[0])
+            end_time = cls._find_contest_end_time(tds[0], base_url)
             if end_time:
                 contest_info.end_time = end_time
             if tds[3] != "Public":
@@ -443,12 +558,9 @@ class HDUContestClient(_UniClient, ContestClient):
         return result
 
     @classmethod
-    def _find_contest_end_time(cls, contest_id):
-        from ..base import get_header
-
-        session = requests.session()
-        session.headers.update(get_header())
-        url = f"{BASE_URL}/userloginex.php?cid={contest_id}"
+    def _find_contest_end_time(cls, contest_id, base_url=BASE_URL):
+        session = pool.new_session("hdu", base_url)
+        url = f"{base_url}/userloginex.php?cid={contest_id}"
         try:
             r = session.get(url, timeout=5)
         except requests.exceptions.RequestException:
@@ -463,20 +575,7 @@ class HDUContestClient(_UniClient, ContestClient):
 
     @staticmethod
     def _parse_problem_id(text):
-        res = []
-        soup = BeautifulSoup(text, "lxml")
-        tables = soup.find_all("table")
-        try:
-            pattern = re.compile(r"Solved.*Title.*Ratio", re.DOTALL)
-            table = next(filter(lambda x: re.search(pattern, str(x)), tables))
-        except StopIteration:
-            return res
-        tags = table.find_all("tr", align="center")
-        for tag in tags:
-            tds = [x.text for x in tag.find_all("td")]
-            if len(tds) >= 2:
-                res.append(tds[1])
-        return res
+        return parser.parse_contest_problem_ids(text)
 
     @staticmethod
     def _to_timestamp(d):
@@ -487,3 +586,293 @@ class HDUContestClient(_UniClient, ContestClient):
 
         utc = datetime(*d, tzinfo=timezone.utc) - timedelta(hours=8)
         return utc.timestamp()
+
+
+class _AsyncUniClient(_UniPages, AsyncBaseClient):
+    def __init__(
+        self,
+        auth=None,
+        client_type="practice",
+        contest_id="0",
+        timeout=5,
+        base_url=None,
+        cookie_store=None,
+    ):
+        self.base_url = base_url or BASE_URL
+        super().__init__("hdu", self.base_url, cookie_store)
+        self.auth = auth
+        self.client_type = client_type
+        self.contest_id = contest_id
+        self.timeout = timeout
+        # Unlike the sync clients, login is deferred: it needs a running loop.
+        # Callers log in explicitly or on the first LoginRequired.
+        if auth is not None:
+            self.username, self.password = auth
+
+    @abstractmethod
+    def get_name(self):
+        pass
+
+    def get_user_id(self):
+        if self.auth is None:
+            raise exceptions.LoginRequired("Login is required")
+        return self.username
+
+    def get_client_type(self):
+        return self.client_type
+
+    async def login(self, username, password):
+        url = self._get_login_url()
+        data = {"login": "Sign in", "username": username, "userpass": password}
+        try:
+            await self._request_url("post", url, data=data)
+        except exceptions.LoginRequired:
+            raise exceptions.LoginError("User not exist or wrong password")
+        self.auth = (username, password)
+        self.username = username
+        self.password = password
+        self._save_cookies()
+
+    @abstractmethod
+    async def check_login(self):
+        pass
+
+    async def update_cookies(self):
+        if self.auth is None:
+            raise exceptions.LoginRequired("Login is required")
+        await self.login(self.username, self.password)
+
+    async def get_problem(self, problem_id):
+        url = self._get_problem_url(problem_id)
+        resp = await self._request_url("get", url)
+        return self._parse_problem(resp)
+
+    @abstractmethod
+    async def get_problem_list(self):
+        pass
+
+    @abstractmethod
+    def iter_problem_list(self):
+        pass
+
+    async def submit_problem(self, problem_id, language, source_code):
+        if self.auth is None:
+            raise exceptions.LoginRequired("Login is required")
+        lang_id = await self._find_language_id(problem_id, language)
+        if lang_id is None:
+            raise exceptions.SubmitError(f'Language "{language}" is not supported')
+        data = self._build_submit_data(problem_id, lang_id, source_code)
+        url = self._get_submit_url()
+        resp = await self._request_url("post", url, data=data)
+        self._check_submit_result(resp)
+        url = self._get_status_url(problem_id=problem_id, user_id=self.username)
+        resp = await self._request_url("get", url)
+        return self._find_run_id(resp)
+
+    async def _find_language_id(self, problem_id, language):
+        key = self._get_language_cache_key()
+        langs = _language_cache.get(key)
+        if langs is None:
+            url = self._get_submit_page_url(problem_id)
+            resp = await self._request_url("get", url)
+            langs = self._parse_language_ids(resp)
+            if not langs:
+                return None
+            _language_cache.set(key, langs)
+        lang_id = self._select_language(langs, language)
+        if lang_id is None:
+            _language_cache.invalidate(key)
+        return lang_id
+
+    async def get_submit_status(self, run_id, **kwargs):
+        user_id = kwargs.get("user_id", "")
+        problem_id = kwargs.get("problem_id", "")
+        url = self._get_status_url(
+            run_id=run_id, problem_id=problem_id, user_id=user_id
+        )
+        resp = await self._request_url("get", url)
+        result = self._find_verdict(resp, run_id)
+        if result is not None:
+            return result
+        if self.client_type == "contest":
+            for page in range(2, 5):
+                status_url = url + f"&page={page}"
+                resp = await self._request_url("get", status_url)
+                result = self._find_verdict(resp, run_id)
+                if result is not None:
+                    return result
+
+    async def get_submit_statuses(self, run_ids, **kwargs):
+        user_id = kwargs.get("user_id", "")
+        run_ids = sorted(set(run_ids), key=_run_id_key, reverse=True)
+        result = {}
+        if self.client_type == "contest":
+            url = self._get_status_url(user_id=user_id)
+            for page in range(1, 5):
+                resp = await self._request_url("get", url + f"&page={page}")
+                verdicts = self._find_verdicts(resp)
+                result.update((x, verdicts[x]) for x in run_ids if x in verdicts)
+                if not verdicts or len(result) == len(run_ids):
+                    break
+            return result
+        pending = run_ids
+        while pending:
+            url = self._get_status_url(run_id=pending[0], user_id=user_id)
+            resp = await self._request_url("get", url)
+            verdicts = self._find_verdicts(resp)
+            if not verdicts:
+                break
+            result.update((x, verdicts[x]) for x in pending if x in verdicts)
+            pending = self._older_runs(pending, verdicts)
+        return result
+
+    async def _request_url(self, method, url, data=None, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            with metrics.track_request("hdu", url) as tracked:
+                text = await pool.request(
+                    self._get_session(),
+                    method,
+                    url,
+                    data=data,
+                    timeout=timeout,
+                    on_status=tracked.set_status,
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            raise exceptions.ConnectionError(f'Request "{url}" failed')
+        self._check_response(text)
+        return text
+
+
+class AsyncHDUClient(_AsyncUniClient):
+    def __init__(self, auth=None, **kwargs):
+        self.volume_concurrency = kwargs.pop("volume_concurrency", VOLUME_CONCURRENCY)
+        # HDU has no submit captcha.
+        kwargs.pop("prefetch_captcha", None)
+        super().__init__(auth, **kwargs)
+        self.name = "hdu"
+
+    def get_name(self):
+        return self.name
+
+    async def check_login(self):
+        url = self.base_url + "/control_panel.php"
+        try:
+            await self._request_url("get", url)
+        except exceptions.LoginRequired:
+            return False
+        return True
+
+    async def get_problem_list(self):
+        return sorted([x async for x in self.iter_problem_list()])
+
+    async def iter_problem_list(self):
+        url = f"{self.base_url}/listproblem.php"
+        resp = await self._request_url("get", url)
+        vols = HDUClient._parse_volumes(resp)
+        semaphore = asyncio.Semaphore(self.volume_concurrency)
+
+        async def fetch(vol):
+            async with semaphore:
+                try:
+                    return await self._request_url("get", url + f"?vol={vol}")
+                except exceptions.ConnectionError as e:
+                    _volume_failed(self.get_name(), vol, e)
+                    return ""
+
+        tasks = [asyncio.ensure_future(fetch(vol)) for vol in vols]
+        try:
+            for future in asyncio.as_completed(tasks):
+                resp = await future
+                for problem_id in HDUClient._parse_problem_id(resp):
+                    yield problem_id
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class AsyncHDUContestClient(_AsyncUniClient, ContestClient):
+    def __init__(self, auth=None, contest_id=None, **kwargs):
+        timeout = kwargs.get("timeout", 5)
+        base_url = kwargs.get("base_url")
+        cookie_store = kwargs.get("cookie_store")
+        if contest_id is None:
+            raise exceptions.JudgeException("You must specific a contest id")
+        super().__init__(
+            auth, "contest", str(contest_id), timeout, base_url, cookie_store
+        )
+        self.name = f"hdu_ct_{contest_id}"
+        self._contest_info = ContestInfo("hdu", self.contest_id)
+        self._contest_info_loaded = False
+
+    def get_name(self):
+        return self.name
+
+    def get_contest_id(self):
+        return self.contest_id
+
+    async def check_login(self):
+        # The submit page of a contest is only shown to a logged in account.
+        url = self._get_submit_page_url("")
+        try:
+            await self._request_url("get", url)
+        except exceptions.LoginRequired:
+            return False
+        return True
+
+    def get_contest_info(self):
+        return self._contest_info
+
+    async def get_problem_list(self):
+        await self._ensure_contest_info()
+        return self._contest_info.problem_list
+
+    async def iter_problem_list(self):
+        for problem_id in await self.get_problem_list():
+            yield problem_id
+
+    async def get_problem(self, problem_id):
+        await self._ensure_contest_info()
+        if not self._contest_info.public and self.auth is None:
+            raise exceptions.LoginRequired("Login is required")
+        return await super().get_problem(problem_id)
+
+    async def submit_problem(self, problem_id, language, source_code):
+        await self.refresh_contest_info()
+        if self._contest_info.status == "Pending":
+            raise exceptions.SubmitError("Contest has not begun")
+        if self._contest_info.status == "Ended":
+            raise exceptions.SubmitError("Contest is ended")
+        return await super().submit_problem(problem_id, language, source_code)
+
+    async def get_submit_status(self, run_id, **kwargs):
+        await self._ensure_contest_info()
+        if not self._contest_info.public and self.auth is None:
+            raise exceptions.LoginRequired("Login is required")
+        return await super().get_submit_status(run_id, **kwargs)
+
+    async def get_submit_statuses(self, run_ids, **kwargs):
+        await self._ensure_contest_info()
+        if not self._contest_info.public and self.auth is None:
+            raise exceptions.LoginRequired("Login is required")
+        return await super().get_submit_statuses(run_ids, **kwargs)
+
+    async def refresh_contest_info(self):
+        url = f"{self.base_url}/contests/contest_show.php?cid={self.contest_id}"
+        resp = await self._request_url("get", url)
+        if re.search(r"System Message", resp):
+            raise exceptions.ConnectionError(f"Contest {self.contest_id} not exists")
+        HDUContestClient._parse_contest_info(resp, self._contest_info)
+        self._contest_info_loaded = True
+
+    async def _ensure_contest_info(self):
+        if not self._contest_info_loaded:
+            await self.refresh_contest_info()
+
+    @classmethod
+    async def get_recent_contest(cls, base_url=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, HDUContestClient.get_recent_contest, base_url
+        )
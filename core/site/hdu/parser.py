@@ -0,0 +1,184 @@
+import html
+import re
+from urllib.parse import urljoin
+
+import lxml.html
+from lxml import etree
+
+PAGE_TITLES = {
+    "Problem Description": "description",
+    "Input": "input",
+    "Output": "output",
+    "Sample Input": "sample_input",
+    "Sample Output": "sample_output",
+}
+
+_LIMIT_PATTERN = re.compile(
+    r"Time Limit:.*?[0-9]*/([0-9]*).*?MS.*?\(Java/Others\).*?"
+    r"Memory Limit:.*?[0-9]*/([0-9]*).*?K.*?\(Java/Others\)"
+)
+_CONTEST_PATTERN = re.compile(
+    r"Start *?Time *?: *?([0-9]{4})-([0-9]{2})-([0-9]{2}) *?([0-9]{2}):([0-9]{2}):([0-9]{2}).*?"
+    r"End *?Time *?: *?([0-9]{4})-([0-9]{2})-([0-9]{2}) *?([0-9]{2}):([0-9]{2}):([0-9]{2}).*?"
+    r"Contest *?Type *?:(.*?)Contest *?Status.*?:(.*?)Current.*?Server.*?Time",
+    re.DOTALL,
+)
+
+
+def _table_with(*headers):
+    conditions = "".join(f"[.//text()[contains(., '{x}')]]" for x in headers)
+    return etree.XPath(f"//table{conditions}")
+
+
+# Tables are returned in document order, so nested tables come after the
+# layout tables that wrap them.
+_status_tables = _table_with("Run ID", "Judge Status", "Author")
+_contest_problem_tables = _table_with("Solved", "Title", "Ratio")
+_center_rows = etree.XPath(".//tr[@align='center']")
+_cells = etree.XPath(".//td")
+_first_h1 = etree.XPath("(//h1)[1]")
+_panel_titles = etree.XPath(
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' panel_title ')]"
+    "[@align='left']"
+)
+_images = etree.XPath("//img[@src]")
+_contest_divs = etree.XPath("//div[contains(., 'Start') and contains(., 'Status')]")
+_language_options = etree.XPath("//select[@name='language']//option")
+_language_select = etree.XPath("//select[@name='language']")
+
+
+def _parse(text):
+    try:
+        return lxml.html.document_fromstring(text)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration.
+        return lxml.html.document_fromstring(text.encode("utf-8"))
+    except etree.ParserError:
+        return None
+
+
+def _cell_texts(row):
+    return [x.text_content().strip() for x in _cells(row)]
+
+
+def _inner_html(element):
+    parts = [html.escape(element.text, quote=False)] if element.text else []
+    for child in element:
+        parts.append(etree.tostring(child, encoding="unicode", method="html"))
+    return "".join(parts)
+
+
+def find_verdicts(text):
+    result = {}
+    doc = _parse(text)
+    if doc is None:
+        return result
+    tables = _status_tables(doc)
+    if not tables:
+        return result
+    for row in _center_rows(tables[-1]):
+        cols = _cell_texts(row)
+        if len(cols) < 6:
+            continue
+        verdict = cols[2]
+        try:
+            exe_time = int(cols[4].replace("MS", ""))
+            exe_mem = int(cols[5].replace("K", ""))
+        except ValueError:
+            continue
+        if "Runtime Error" in verdict:
+            verdict = "Runtime Error"
+        result[cols[0]] = (verdict, exe_time, exe_mem)
+    return result
+
+
+def find_run_id(text):
+    doc = _parse(text)
+    if doc is None:
+        return None
+    tables = _status_tables(doc)
+    if not tables:
+        return None
+    rows = _center_rows(tables[-1])
+    if not rows:
+        return None
+    cells = _cells(rows[0])
+    if not cells:
+        return None
+    return cells[0].text_content().strip()
+
+
+def parse_problem(text, problem_url):
+    result = {}
+    limit = _LIMIT_PATTERN.search(text)
+    if limit:
+        result["time_limit"] = limit.group(1)
+        result["mem_limit"] = limit.group(2)
+    doc = _parse(text)
+    if doc is None:
+        return result
+    for img in _images(doc):
+        img.set("src", urljoin(problem_url, img.get("src")))
+    h1 = _first_h1(doc)
+    if h1:
+        result["title"] = h1[0].text_content()
+        if result["title"] == "System Message":
+            return
+    for div in _panel_titles(doc):
+        key = PAGE_TITLES.get(div.text_content())
+        if key is None:
+            continue
+        content = div.getnext()
+        if content is None or content.tag != "div":
+            continue
+        result[key] = _inner_html(content)
+    return result
+
+
+def parse_contest_problem_ids(text):
+    doc = _parse(text)
+    if doc is None:
+        return []
+    return _contest_problem_ids(doc)
+
+
+def _contest_problem_ids(doc):
+    tables = _contest_problem_tables(doc)
+    if not tables:
+        return []
+    res = []
+    for row in _center_rows(tables[0]):
+        cells = _cells(row)
+        if len(cells) >= 2:
+            res.append(cells[1].text_content())
+    return res
+
+
+def parse_contest_info(text):
+    # Returns (title, problem_list, times) where times is None or the raw
+    # (start, end, type, status) groups of the contest header.
+    doc = _parse(text)
+    if doc is None:
+        return None, [], None
+    h1 = _first_h1(doc)
+    title = h1[0].text_content() if h1 else None
+    problem_list = _contest_problem_ids(doc)
+    for div in reversed(_contest_divs(doc)):
+        res = _CONTEST_PATTERN.search(div.text_content())
+        if res:
+            groups = [x.strip() for x in res.groups()]
+            return title, problem_list, (groups[0:6], groups[6:12], *groups[12:])
+    return title, problem_list, None
+
+
+def parse_language_ids(text):
+    doc = _parse(text)
+    if doc is None or not _language_select(doc):
+        return None
+    langs = {}
+    for option in _language_options(doc):
+        lang_id = option.get("value")
+        if lang_id is None:
+            continue
+        langs[option.text_content().strip().lower()] = lang_id
+    return langs
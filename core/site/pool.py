@@ -0,0 +1,114 @@
+import asyncio
+import random
+import threading
+import weakref
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .masquerade import get_header
+
+# Keep-alive connections kept per site. Every account of a site shares them,
+# each account still has its own session and cookie jar.
+POOL_SIZE = 32
+# Transient failures of idempotent requests are retried with jittered
+# exponential backoff. Submits (POST) are never retried.
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 8
+RETRY_STATUS = frozenset([500, 502, 503, 504])
+RETRY_METHODS = frozenset(["GET", "HEAD"])
+
+_lock = threading.Lock()
+_adapters = {}
+_connectors = weakref.WeakKeyDictionary()
+
+
+class JitteredRetry(Retry):
+    def get_backoff_time(self):
+        # "Full jitter": spread retries of many clients over the whole window
+        # so they don't hit the judge at the same instant.
+        return random.uniform(0, super().get_backoff_time())
+
+
+def backoff_time(attempt):
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2**attempt))
+
+
+def get_adapter(site):
+    with _lock:
+        adapter = _adapters.get(site)
+        if adapter is None:
+            retry = JitteredRetry(
+                total=RETRY_TOTAL,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=RETRY_STATUS,
+                allowed_methods=RETRY_METHODS,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry
+            )
+            _adapters[site] = adapter
+        return adapter
+
+
+def new_session(site, base_url):
+    # Sessions share the site adapter, so never close() them: that would
+    # close the pooled connections of every other account.
+    session = requests.session()
+    session.headers.update(get_header())
+    session.mount(base_url, get_adapter(site))
+    return session
+
+
+def get_connector(site):
+    # aiohttp connectors are bound to an event loop, so there is one pool per
+    # site and loop.
+    loop = asyncio.get_event_loop()
+    connectors = _connectors.setdefault(loop, {})
+    connector = connectors.get(site)
+    if connector is None or connector.closed:
+        connector = aiohttp.TCPConnector(
+            limit=POOL_SIZE * 4,
+            limit_per_host=POOL_SIZE,
+            keepalive_timeout=30,
+            ttl_dns_cache=300,
+        )
+        connectors[site] = connector
+    return connector
+
+
+async def close_connectors():
+    connectors = _connectors.pop(asyncio.get_event_loop(), {})
+    for connector in connectors.values():
+        await connector.close()
+
+
+async def request(
+    session, method, url, data=None, timeout=5, raw=False, on_status=None
+):
+    # on_status is called with the status of the response returned.
+    retries = RETRY_TOTAL if method.upper() in RETRY_METHODS else 0
+    attempt = 0
+    while True:
+        try:
+            async with session.request(
+                method, url, data=data, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as r:
+                if r.status in RETRY_STATUS and attempt < retries:
+                    raise aiohttp.ClientResponseError(
+                        r.request_info, r.history, status=r.status
+                    )
+                if on_status is not None:
+                    on_status(r.status)
+                if raw:
+                    return await r.read()
+                return await r.text(errors="replace")
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt >= retries:
+                raise
+        await asyncio.sleep(backoff_time(attempt))
+        attempt += 1
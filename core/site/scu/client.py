@@ -1,30 +1,200 @@
+import asyncio
+import hashlib
 import os
 import re
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import aiohttp
 import requests
 from bs4 import BeautifulSoup
 
-from .. import exceptions
-from ..base import BaseClient
+from config import logger
+from ... import metrics
+from .. import exceptions, pool
+from ..base import AsyncBaseClient, BaseClient
 
-__all__ = ("SOJClient",)
+__all__ = ("SOJClient", "AsyncSOJClient")
 
 base_url = "http://acm.scu.edu.cn/soj"
 base_dir = os.path.abspath(os.path.dirname(__file__))
-db = sqlite3.connect(os.path.join(base_dir, "captcha.db"), check_same_thread=False)
+# Default number of problem volumes fetched in parallel.
+VOLUME_CONCURRENCY = 2
 
+# Runs the captcha prefetches of the sync clients.
+_captcha_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="soj-captcha")
 
-class SOJClient(BaseClient):
+
+class _CaptchaTable(object):
+    # md5 of a captcha image -> its code. captcha.db is read once, on first use.
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._codes = None
+
+    def get(self, digest):
+        if self._codes is None:
+            with self._lock:
+                if self._codes is None:
+                    self._codes = self._load()
+        return self._codes.get(digest)
+
+    def _load(self):
+        con = sqlite3.connect(self._path)
+        try:
+            return dict(con.execute("SELECT Hash, Code FROM Captcha"))
+        finally:
+            con.close()
+
+
+_captcha_table = _CaptchaTable(os.path.join(base_dir, "captcha.db"))
+
+
+def _volume_failed(oj_name, vol, e):
+    # The volume is left out of the problem list, its problems are crawled
+    # by the next full or incremental crawl.
+    logger.warning(
+        f"Skipped problem volume, name: {oj_name}, volume: {vol}, reason: {e}"
+    )
+
+
+def _run_id_key(run_id):
+    try:
+        return int(run_id)
+    except ValueError:
+        return 0
+
+
+class _SOJPages(object):
+    # Page parsers shared by the sync and async clients.
+
+    def _get_cookie_key(self):
+        return f"scu:{self.username}"
+
+    @staticmethod
+    def _check_login_response(text):
+        if re.search("USER_NOT_EXIST", text):
+            raise exceptions.UserNotExist("User not exist")
+        elif re.search("PASSWORD_ERROR", text):
+            raise exceptions.PasswordError("Password error")
+
+    @staticmethod
+    @metrics.track_parse("scu", "problem")
+    def _parse_problem(text, problem_id):
+        if re.search("No such problem", text):
+            return
+        try:
+            title = re.findall("<title>{}: (.*?)</title>".format(problem_id), text)[0]
+        except IndexError:
+            return
+        return {"title": title}
+
+    @staticmethod
+    def _parse_volumes(text):
+        volume_list = []
+        try:
+            table = BeautifulSoup(text, "lxml").find("table")
+            tr = table.find("tr")
+            tr = tr.find_next_sibling("tr")
+            tags = tr.find_all("a")
+            for tag in tags:
+                r = re.search(r"\[(.*)\]", tag.text.strip())
+                volume_list.append(r.groups()[0])
+        except (AttributeError, IndexError):
+            pass
+        return volume_list
+
+    @staticmethod
+    @metrics.track_parse("scu", "problem_list")
+    def _parse_problem_id(text):
+        ids = []
+        table = BeautifulSoup(text, "lxml").find("table")
+        if not table:
+            return ids
+        trs = table.find_all("tr")[3:]
+        for tr in trs:
+            try:
+                tds = tr.find_all("td")
+                pid = tds[1].text.strip()
+                int(pid)
+            except (ValueError, IndexError):
+                continue
+            ids.append(pid)
+        return ids
+
+    @staticmethod
+    def _find_run_id(text):
+        soup = BeautifulSoup(text, "lxml")
+        try:
+            tag = soup.find_all("table")[1].find_all("tr")[1]
+            return next(tag.stripped_strings)
+        except IndexError:
+            raise exceptions.SubmitError
+
+    @staticmethod
+    def _find_verdict(text):
+        try:
+            soup = BeautifulSoup(text, "lxml")
+            tag = soup.find_all("table")[1].find_all("tr")[1]
+            col_tags = tag.find_all("td")
+            result = [" ".join(x.stripped_strings) for x in col_tags[5:]]
+            verdict, exe_time, exe_mem = result[0], int(result[1]), int(result[2])
+            return verdict, exe_time, exe_mem
+        except (IndexError, ValueError):
+            pass
+
+    @staticmethod
+    @metrics.track_parse("scu", "status")
+    def _find_verdicts(text):
+        result = {}
+        try:
+            soup = BeautifulSoup(text, "lxml")
+            trs = soup.find_all("table")[1].find_all("tr")[1:]
+        except IndexError:
+            return result
+        for tr in trs:
+            cols = [" ".join(x.stripped_strings) for x in tr.find_all("td")]
+            try:
+                verdict, exe_time, exe_mem = cols[5], int(cols[6]), int(cols[7])
+            except (IndexError, ValueError):
+                continue
+            result[cols[0]] = (verdict, exe_time, exe_mem)
+        return result
+
+    @staticmethod
+    def _older_runs(run_ids, verdicts):
+        # The solution list is ordered by run id descending from `from`, so
+        # anything below the last row needs another page.
+        try:
+            lowest = min(int(x) for x in verdicts)
+            return [x for x in run_ids if x not in verdicts and int(x) < lowest]
+        except ValueError:
+            return []
+
+    @staticmethod
+    def _lookup_captcha(content):
+        return _captcha_table.get(hashlib.md5(content).hexdigest())
+
+
+class SOJClient(_SOJPages, BaseClient):
     def __init__(self, auth=None, **kwargs):
-        super().__init__()
+        self.base_url = kwargs.get("base_url") or base_url
+        super().__init__("scu", self.base_url, kwargs.get("cookie_store"))
         self.auth = auth
         self.name = "scu"
         self.client_type = "practice"
         self.timeout = kwargs.get("timeout", 5)
+        self.volume_concurrency = kwargs.get("volume_concurrency", VOLUME_CONCURRENCY)
+        # Only clients which submit keep a solved captcha ready from login on.
+        self._keep_captcha = kwargs.get("prefetch_captcha", False)
+        self._captcha_future = None
         if auth is not None:
             self.username, self.password = auth
-            self.login(self.username, self.password)
+            # Stored cookies are trusted until a submit finds them expired.
+            if not self._restore_cookies():
+                self.login(self.username, self.password)
 
     def get_name(self):
         return self.name
@@ -38,19 +208,19 @@ class SOJClient(BaseClient):
         return self.client_type
 
     def login(self, username, password):
-        url = base_url + "/login.action"
+        url = self.base_url + "/login.action"
         data = {"back": 2, "id": username, "password": password, "submit": "login"}
         resp = self._request_url("post", url, data=data)
-        if re.search("USER_NOT_EXIST", resp):
-            raise exceptions.UserNotExist("User not exist")
-        elif re.search("PASSWORD_ERROR", resp):
-            raise exceptions.PasswordError("Password error")
+        self._check_login_response(resp)
         self.auth = (username, password)
         self.username = username
         self.password = password
+        self._save_cookies()
+        if self._keep_captcha:
+            self._prefetch_captcha()
 
     def check_login(self):
-        url = f"{base_url}/update_user_form.action"
+        url = f"{self.base_url}/update_user_form.action"
         resp = self._request_url("get", url)
         if re.search("Please login first", resp):
             return False
@@ -62,46 +232,41 @@ class SOJClient(BaseClient):
         self.login(self.username, self.password)
 
     def get_problem(self, problem_id):
-        url = f"{base_url}/problem.action?id={problem_id}"
+        url = f"{self.base_url}/problem.action?id={problem_id}"
         resp = self._request_url("get", url)
-        if re.search("No such problem", resp):
-            return
-        try:
-            title = re.findall("<title>{}: (.*?)</title>".format(problem_id), resp)[0]
-        except IndexError:
-            return
-        return {"title": title}
+        return self._parse_problem(resp, problem_id)
 
     def get_problem_list(self):
-        url = f"{base_url}/problems.action"
+        return sorted(self.iter_problem_list())
+
+    def iter_problem_list(self):
+        url = f"{self.base_url}/problems.action"
         resp = self._request_url("get", url)
-        volume_list = []
+        volume_list = self._parse_volumes(resp)
+        executor = ThreadPoolExecutor(max_workers=self.volume_concurrency)
+        futures = {
+            executor.submit(self._request_url, "get", f"{url}?volume={vol}"): vol
+            for vol in volume_list
+        }
         try:
-            table = BeautifulSoup(resp, "lxml").find("table")
-            tr = table.find("tr")
-            tr = tr.find_next_sibling("tr")
-            tags = tr.find_all("a")
-            for tag in tags:
-                r = re.search(r"\[(.*)\]", tag.text.strip())
-                volume_list.append(r.groups()[0])
-        except (AttributeError, IndexError):
-            pass
-        problem_list = []
-        for vol in volume_list:
-            page_url = f"{url}?volume={vol}"
-            resp = self._request_url("get", page_url)
-            problem_list += self.__class__._parse_problem_id(resp)
-        problem_list.sort()
-        return problem_list
+            for future in as_completed(futures):
+                try:
+                    resp = future.result()
+                except exceptions.ConnectionError as e:
+                    _volume_failed(self.get_name(), futures[future], e)
+                    continue
+                yield from self._parse_problem_id(resp)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
 
     def submit_problem(self, problem_id, language, source_code):
         if self.auth is None:
             raise exceptions.LoginRequired("Login is required")
-        submit_url = f"{base_url}/submit.action"
-        status_url = (
-            f"{base_url}/solutions.action?userId={self.username}&problemId={problem_id}"
-        )
-        captcha = self._get_captcha()
+        submit_url = f"{self.base_url}/submit.action"
+        status_url = f"{self.base_url}/solutions.action?userId={self.username}&problemId={problem_id}"
+        captcha = self._take_captcha()
         if captcha is None:
             raise exceptions.JudgeException("Can not find a valid captcha")
         data = {
@@ -111,73 +276,242 @@ class SOJClient(BaseClient):
             "source": source_code,
             "submit": "Submit",
         }
-        resp = self._request_url("post", submit_url, data=data)
+        try:
+            resp = self._request_url("post", submit_url, data=data)
+        finally:
+            self._prefetch_captcha()
         if re.search("ERROR", resp):
             if not self.check_login():
                 raise exceptions.LoginRequired("Login is required")
             else:
                 raise exceptions.SubmitError("Submit failed unexpectedly")
         resp = self._request_url("get", status_url)
-        soup = BeautifulSoup(resp, "lxml")
-        try:
-            tag = soup.find_all("table")[1].find_all("tr")[1]
-            run_id = next(tag.stripped_strings)
-        except IndexError:
-            raise exceptions.SubmitError
-        return run_id
+        return self._find_run_id(resp)
 
     def get_submit_status(self, run_id, **kwargs):
-        status_url = f"{base_url}/solutions.action?from={run_id}"
+        status_url = f"{self.base_url}/solutions.action?from={run_id}"
         resp = self._request_url("get", status_url)
-        try:
-            soup = BeautifulSoup(resp, "lxml")
-            tag = soup.find_all("table")[1].find_all("tr")[1]
-            col_tags = tag.find_all("td")
-            result = [" ".join(x.stripped_strings) for x in col_tags[5:]]
-            verdict, exe_time, exe_mem = result[0], int(result[1]), int(result[2])
-            return verdict, exe_time, exe_mem
-        except (IndexError, ValueError):
-            pass
+        return self._find_verdict(resp)
 
-    @staticmethod
-    def _parse_problem_id(text):
-        ids = []
-        table = BeautifulSoup(text, "lxml").find("table")
-        if not table:
-            return ids
-        trs = table.find_all("tr")[3:]
-        for tr in trs:
-            try:
-                tds = tr.find_all("td")
-                pid = tds[1].text.strip()
-                int(pid)
-            except (ValueError, IndexError):
-                continue
-            ids.append(pid)
-        return ids
+    def get_submit_statuses(self, run_ids, **kwargs):
+        user_id = kwargs.get("user_id", "")
+        pending = sorted(set(run_ids), key=_run_id_key, reverse=True)
+        result = {}
+        while pending:
+            url = f"{self.base_url}/solutions.action?userId={user_id}&from={pending[0]}"
+            resp = self._request_url("get", url)
+            verdicts = self._find_verdicts(resp)
+            if not verdicts:
+                break
+            result.update((x, verdicts[x]) for x in pending if x in verdicts)
+            pending = self._older_runs(pending, verdicts)
+        return result
 
     def _request_url(self, method, url, data=None, timeout=None):
         if timeout is None:
             timeout = self.timeout
         try:
-            r = self._session.request(method, url, data=data, timeout=timeout)
+            with metrics.track_request("scu", url) as tracked:
+                r = self._session.request(method, url, data=data, timeout=timeout)
+                tracked.set_status(r.status_code)
         except requests.exceptions.RequestException:
             raise exceptions.ConnectionError(f'Request "{url}" failed')
         return r.text
 
     def _get_captcha(self):
-        url = os.path.join(base_url, "validation_code")
+        url = os.path.join(self.base_url, "validation_code")
         try:
             r = self._session.get(url, timeout=self.timeout)
         except requests.exceptions.RequestException:
             raise exceptions.ConnectionError(f'Request "{url}" failed')
-        import hashlib
+        return self._lookup_captcha(r.content)
+
+    def _prefetch_captcha(self):
+        # SOJ only accepts the latest captcha of a session, so a single solved
+        # captcha is kept, fetched in the background after the last one is used.
+        self._captcha_future = _captcha_executor.submit(self._get_captcha)
+
+    def _take_captcha(self):
+        future, self._captcha_future = self._captcha_future, None
+        if future is not None:
+            try:
+                captcha = future.result()
+            except exceptions.ConnectionError:
+                captcha = None
+            if captcha is not None:
+                return captcha
+        return self._get_captcha()
+
+
+class AsyncSOJClient(_SOJPages, AsyncBaseClient):
+    def __init__(self, auth=None, **kwargs):
+        self.base_url = kwargs.get("base_url") or base_url
+        super().__init__("scu", self.base_url, kwargs.get("cookie_store"))
+        self.auth = auth
+        self.name = "scu"
+        self.client_type = "practice"
+        self.timeout = kwargs.get("timeout", 5)
+        self.volume_concurrency = kwargs.get("volume_concurrency", VOLUME_CONCURRENCY)
+        # Only clients which submit keep a solved captcha ready from login on.
+        self._keep_captcha = kwargs.get("prefetch_captcha", False)
+        self._captcha_task = None
+        # Login is deferred until the client is used inside an event loop.
+        if auth is not None:
+            self.username, self.password = auth
+
+    def get_name(self):
+        return self.name
+
+    def get_user_id(self):
+        if self.auth is None:
+            raise exceptions.LoginRequired("Login is required")
+        return self.username
 
-        h = hashlib.md5(r.content).hexdigest()
-        cursor = db.cursor()
-        cursor.execute("SELECT Code FROM Captcha WHERE Hash=?", (h,))
-        res = cursor.fetchall()
+    def get_client_type(self):
+        return self.client_type
+
+    async def login(self, username, password):
+        url = self.base_url + "/login.action"
+        data = {"back": 2, "id": username, "password": password, "submit": "login"}
+        resp = await self._request_url("post", url, data=data)
+        self._check_login_response(resp)
+        self.auth = (username, password)
+        self.username = username
+        self.password = password
+        self._save_cookies()
+        if self._keep_captcha:
+            self._prefetch_captcha()
+
+    async def check_login(self):
+        url = f"{self.base_url}/update_user_form.action"
+        resp = await self._request_url("get", url)
+        if re.search("Please login first", resp):
+            return False
+        return True
+
+    async def update_cookies(self):
+        if self.auth is None:
+            raise exceptions.LoginRequired
+        await self.login(self.username, self.password)
+
+    async def get_problem(self, problem_id):
+        url = f"{self.base_url}/problem.action?id={problem_id}"
+        resp = await self._request_url("get", url)
+        return self._parse_problem(resp, problem_id)
+
+    async def get_problem_list(self):
+        return sorted([x async for x in self.iter_problem_list()])
+
+    async def iter_problem_list(self):
+        url = f"{self.base_url}/problems.action"
+        resp = await self._request_url("get", url)
+        volume_list = self._parse_volumes(resp)
+        semaphore = asyncio.Semaphore(self.volume_concurrency)
+
+        async def fetch(vol):
+            async with semaphore:
+                try:
+                    return await self._request_url("get", f"{url}?volume={vol}")
+                except exceptions.ConnectionError as e:
+                    _volume_failed(self.get_name(), vol, e)
+                    return ""
+
+        tasks = [asyncio.ensure_future(fetch(vol)) for vol in volume_list]
         try:
-            return res[0][0]
-        except IndexError:
-            return
+            for future in asyncio.as_completed(tasks):
+                for problem_id in self._parse_problem_id(await future):
+                    yield problem_id
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def submit_problem(self, problem_id, language, source_code):
+        if self.auth is None:
+            raise exceptions.LoginRequired("Login is required")
+        submit_url = f"{self.base_url}/submit.action"
+        status_url = f"{self.base_url}/solutions.action?userId={self.username}&problemId={problem_id}"
+        captcha = await self._take_captcha()
+        if captcha is None:
+            raise exceptions.JudgeException("Can not find a valid captcha")
+        data = {
+            "problemId": problem_id,
+            "validation": captcha,
+            "language": language,
+            "source": source_code,
+            "submit": "Submit",
+        }
+        try:
+            resp = await self._request_url("post", submit_url, data=data)
+        finally:
+            self._prefetch_captcha()
+        if re.search("ERROR", resp):
+            if not await self.check_login():
+                raise exceptions.LoginRequired("Login is required")
+            else:
+                raise exceptions.SubmitError("Submit failed unexpectedly")
+        resp = await self._request_url("get", status_url)
+        return self._find_run_id(resp)
+
+    async def get_submit_status(self, run_id, **kwargs):
+        status_url = f"{self.base_url}/solutions.action?from={run_id}"
+        resp = await self._request_url("get", status_url)
+        return self._find_verdict(resp)
+
+    async def get_submit_statuses(self, run_ids, **kwargs):
+        user_id = kwargs.get("user_id", "")
+        pending = sorted(set(run_ids), key=_run_id_key, reverse=True)
+        result = {}
+        while pending:
+            url = f"{self.base_url}/solutions.action?userId={user_id}&from={pending[0]}"
+            resp = await self._request_url("get", url)
+            verdicts = self._find_verdicts(resp)
+            if not verdicts:
+                break
+            result.update((x, verdicts[x]) for x in pending if x in verdicts)
+            pending = self._older_runs(pending, verdicts)
+        return result
+
+    async def _request_url(self, method, url, data=None, timeout=None, raw=False):
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            with metrics.track_request("scu", url) as tracked:
+                return await pool.request(
+                    self._get_session(),
+                    method,
+                    url,
+                    data=data,
+                    timeout=timeout,
+                    raw=raw,
+                    on_status=tracked.set_status,
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            raise exceptions.ConnectionError(f'Request "{url}" failed')
+
+    async def _get_captcha(self):
+        url = os.path.join(self.base_url, "validation_code")
+        content = await self._request_url("get", url, raw=True)
+        return self._lookup_captcha(content)
+
+    def _prefetch_captcha(self):
+        # See SOJClient._prefetch_captcha.
+        if self._captcha_task is not None:
+            self._captcha_task.cancel()
+        self._captcha_task = asyncio.ensure_future(self._get_captcha())
+
+    async def _take_captcha(self):
+        task, self._captcha_task = self._captcha_task, None
+        if task is not None:
+            try:
+                captcha = await task
+            except exceptions.ConnectionError:
+                captcha = None
+            if captcha is not None:
+                return captcha
+        return await self._get_captcha()
+
+    async def close(self):
+        if self._captcha_task is not None:
+            self._captcha_task.cancel()
+            self._captcha_task = None
+        await super().close()
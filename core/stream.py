@@ -0,0 +1,242 @@
+import heapq
+import os
+import socket
+import threading
+import time
+
+import redis
+
+from config import logger
+
+# Tasks for the VJudge handlers live in redis streams read by one consumer
+# group. An entry stays pending until its consumer acks it, entries of a dead
+# consumer are claimed by the others and entries which keep failing are moved
+# to "<stream>-dead". Only failures reported by the consumers count, not
+# claims or bounces, so restarting a node does not dead letter its entries.
+SUBMITTER_STREAM = "vjudge-submitter-stream"
+CRAWLER_STREAM = "vjudge-crawler-stream"
+# The lists used before the streams, drained into the streams on startup.
+LEGACY_LISTS = {
+    SUBMITTER_STREAM: "vjudge-submitter-tasks",
+    CRAWLER_STREAM: "vjudge-crawler-tasks",
+}
+GROUP = "vjudge"
+MAX_LEN = 100000
+# Entries nobody touched for this long (ms) are claimed by another consumer.
+# Consumers touch their own entries every third of it while working on them.
+CLAIM_IDLE = 60 * 1000
+MAX_FAILURES = 5
+# How often an entry is passed on by consumers which cannot run it. A consumer
+# waits BOUNCE_DELAY seconds before passing it on, doubled at every hop.
+MAX_HOPS = 10
+BOUNCE_DELAY = 1
+MAX_BOUNCE_DELAY = CLAIM_IDLE / 1000 / 4
+
+
+def node_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def add_task(redis_con, stream, data, lane=None):
+    # lane picks the priority lane of the task, see core/lanes.py.
+    fields = {"data": data}
+    if lane is not None:
+        fields["lane"] = lane
+    return redis_con.xadd(stream, fields, maxlen=MAX_LEN, approximate=True)
+
+
+def _next_id(entry_id):
+    # The smallest entry id after entry_id. Exclusive ranges need redis 6.2.
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    ms, seq = entry_id.split("-")
+    return f"{ms}-{int(seq) + 1}"
+
+
+def _entry(entry_id, fields):
+    lane = fields.get(b"lane")
+    return entry_id, fields.get(b"data"), lane.decode() if lane else None
+
+
+class TaskStream(object):
+    def __init__(
+        self, redis_con, stream, group=GROUP, consumer=None, on_dead_letter=None
+    ):
+        self._redis_con = redis_con
+        self._stream = stream
+        self._group = group
+        self._consumer = consumer or node_name()
+        # Called with (data, reason) once an entry is given up on.
+        self._on_dead_letter = on_dead_letter
+        self._dead_letter_stream = f"{stream}-dead"
+        # entry_id -> failures, of the pending entries which failed.
+        self._failures_key = f"{stream}-failures"
+        # (due, entry_id, fields) of the entries waiting to be passed on.
+        self._bounces = []
+        self._bounces_lock = threading.Lock()
+        self._last_claim = 0
+
+    @property
+    def block_time(self):
+        return CLAIM_IDLE // 3
+
+    def create_group(self):
+        try:
+            self._redis_con.xgroup_create(
+                self._stream, self._group, id="0", mkstream=True
+            )
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        legacy_list = LEGACY_LISTS.get(self._stream)
+        if legacy_list is None:
+            return
+        while True:
+            # The lists were pushed on the left and popped on the right.
+            data = self._redis_con.rpop(legacy_list)
+            if data is None:
+                break
+            add_task(self._redis_con, self._stream, data)
+
+    def read(self, count=10):
+        # Returns [(entry_id, data, lane)], the idle entries claimed from other
+        # consumers first. Blocks up to block_time when there is nothing to do.
+        self._pass_on_bounces()
+        entries = self._claim_idle()
+        if entries:
+            return entries
+        block_time = self.block_time
+        with self._bounces_lock:
+            if self._bounces:
+                due = self._bounces[0][0] - time.monotonic()
+                block_time = max(1, min(block_time, int(due * 1000)))
+        result = self._redis_con.xreadgroup(
+            self._group,
+            self._consumer,
+            {self._stream: ">"},
+            count=count,
+            block=block_time,
+        )
+        if not result:
+            return []
+        return [_entry(*x) for x in result[0][1]]
+
+    def ack(self, *entry_ids):
+        if entry_ids:
+            with self._redis_con.pipeline() as pipe:
+                pipe.xack(self._stream, self._group, *entry_ids)
+                pipe.hdel(self._failures_key, *entry_ids)
+                pipe.execute()
+
+    def fail(self, entry_id):
+        # Leaves an entry pending, so it is claimed again after CLAIM_IDLE. It
+        # is dead lettered once it failed MAX_FAILURES times.
+        self._redis_con.hincrby(self._failures_key, entry_id, 1)
+
+    def touch(self, entry_ids):
+        # Resets the idle time of entries still being worked on, so other
+        # consumers do not claim them.
+        if entry_ids:
+            self._redis_con.xclaim(
+                self._stream,
+                self._group,
+                self._consumer,
+                min_idle_time=0,
+                message_ids=list(entry_ids),
+                justid=True,
+            )
+
+    def dead_letter(self, entry_id, data, reason):
+        self._redis_con.xadd(
+            self._dead_letter_stream,
+            {"data": data or b"", "entry_id": entry_id, "reason": reason},
+            maxlen=MAX_LEN,
+            approximate=True,
+        )
+        self.ack(entry_id)
+        logger.error(
+            f"Moved task to {self._dead_letter_stream}, entry_id: {entry_id}, reason: {reason}"
+        )
+        if self._on_dead_letter is not None:
+            self._on_dead_letter(data, reason)
+
+    def bounce(self, entry_id, data):
+        # Hands an entry this consumer cannot run to the others as a new entry
+        # with one more hop, after a delay, so a consumer reading its own
+        # bounces does not use up the hops at once. Past MAX_HOPS it is left
+        # pending instead and claimed again after CLAIM_IDLE.
+        entries = self._redis_con.xrange(self._stream, entry_id, entry_id)
+        fields = entries[0][1] if entries else {b"data": data}
+        hops = int(fields.get(b"hops", 0)) + 1
+        if hops > MAX_HOPS:
+            return False
+        fields[b"hops"] = hops
+        delay = min(MAX_BOUNCE_DELAY, BOUNCE_DELAY * 2 ** (hops - 1))
+        with self._bounces_lock:
+            heapq.heappush(self._bounces, (time.monotonic() + delay, entry_id, fields))
+        return True
+
+    def _pass_on_bounces(self):
+        now = time.monotonic()
+        with self._bounces_lock:
+            bounces = []
+            while self._bounces and self._bounces[0][0] <= now:
+                bounces.append(heapq.heappop(self._bounces))
+            waiting = [x[1] for x in self._bounces]
+        # Entries waiting to be passed on are not claimed by the others.
+        self.touch(waiting)
+        for _, entry_id, fields in bounces:
+            # The failures so far go with the new entry.
+            failures = self._failures(entry_id, fields)
+            if failures:
+                fields[b"failures"] = failures
+            with self._redis_con.pipeline() as pipe:
+                pipe.xadd(self._stream, fields, maxlen=MAX_LEN, approximate=True)
+                pipe.xack(self._stream, self._group, entry_id)
+                pipe.hdel(self._failures_key, entry_id)
+                pipe.execute()
+
+    def _failures(self, entry_id, fields):
+        failures = self._redis_con.hget(self._failures_key, entry_id)
+        return int(fields.get(b"failures", 0)) + int(failures or 0)
+
+    def _claim_idle(self):
+        # XPENDING and XCLAIM instead of XAUTOCLAIM, which needs redis 6.2.
+        now = time.monotonic()
+        if now - self._last_claim < self.block_time / 1000:
+            return []
+        self._last_claim = now
+        entries = []
+        start_id = "-"
+        while True:
+            pending = self._redis_con.xpending_range(
+                self._stream, self._group, min=start_id, max="+", count=100
+            )
+            idle = [
+                x["message_id"]
+                for x in pending
+                if x["time_since_delivered"] >= CLAIM_IDLE
+            ]
+            if idle:
+                claimed = self._redis_con.xclaim(
+                    self._stream,
+                    self._group,
+                    self._consumer,
+                    min_idle_time=CLAIM_IDLE,
+                    message_ids=idle,
+                )
+                for entry_id, fields in claimed:
+                    # Entries trimmed from the stream come back empty.
+                    if entry_id is None or fields is None:
+                        continue
+                    entry = _entry(entry_id, fields)
+                    if self._failures(entry_id, fields) >= MAX_FAILURES:
+                        self.dead_letter(entry_id, entry[1], "too many failures")
+                        continue
+                    entries.append(entry)
+            if len(pending) < 100:
+                break
+            start_id = _next_id(pending[-1]["message_id"])
+        if entries:
+            logger.warning(f"Claimed {len(entries)} idle tasks from {self._stream}")
+        return entries
@@ -0,0 +1,89 @@
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import logger
+from .models import db, SubmissionTimeline
+
+# The spans between two stages of a SubmissionTimeline:
+# web: the web app commit and the Celery submit_problem hop,
+# stream: the redis stream until a VJudge node reads the submission,
+# queue: the in-memory lanes, rate limits and cooldowns until a submitter
+# takes it, submit: the remote submit, first poll and polling: the status
+# polls until the verdict, propagation: until the web app applied it.
+SPANS = (
+    ("web", "created", "enqueued"),
+    ("stream", "enqueued", "received"),
+    ("queue", "received", "dequeued"),
+    ("submit", "dequeued", "submitted"),
+    ("first poll", "submitted", "first_poll"),
+    ("polling", "first_poll", "verdict"),
+    ("propagation", "verdict", "propagated"),
+    ("total", "created", "propagated"),
+)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def mark(submission_id, stage, when=None):
+    # Records and commits the first time a submission reached stage. Called
+    # after the caller's own commit, a failed write is only logged, so the
+    # timeline never holds up a submission or rolls back a verdict.
+    try:
+        timeline = db.session.get(SubmissionTimeline, submission_id)
+        if timeline is None:
+            timeline = SubmissionTimeline(submission_id=submission_id)
+            db.session.add(timeline)
+        if getattr(timeline, stage) is None:
+            setattr(timeline, stage, when or datetime.utcnow())
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(
+            f"Record timeline failed, submission_id: {submission_id}, stage: {stage}, reason: {e}"
+        )
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def breakdown(since):
+    # [(span, count, [seconds at each of QUANTILES])] of the submissions
+    # created after since. The seconds are None without any sample.
+    timelines = SubmissionTimeline.query.filter(
+        SubmissionTimeline.created >= since
+    ).all()
+    result = []
+    for name, start, end in SPANS:
+        values = [
+            (getattr(x, end) - getattr(x, start)).total_seconds()
+            for x in timelines
+            if getattr(x, start) is not None and getattr(x, end) is not None
+        ]
+        if values:
+            result.append(
+                (name, len(values), [_percentile(values, q) for q in QUANTILES])
+            )
+        else:
+            result.append((name, 0, [None] * len(QUANTILES)))
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Percentiles of the seconds submissions spend in each stage"
+    )
+    arg_parser.add_argument("--hours", type=float, default=24)
+    args = arg_parser.parse_args()
+    since = datetime.utcnow() - timedelta(hours=args.hours)
+    header = "".join(f"{'p' + str(int(q * 100)):>10}" for q in QUANTILES)
+    print(f"{'span':<12}{'count':>8}{header}")
+    for name, count, values in breakdown(since):
+        cells = "".join(f"{'-':>10}" if x is None else f"{x:>10.3f}" for x in values)
+        print(f"{name:<12}{count:>8}{cells}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import time
+from datetime import datetime
+
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from config import Config
+from .models import db, Problem
+
+PROBLEM_COLUMNS = ("oj_name", "problem_id", "last_update", "digest") + tuple(
+    Problem.content_fields
+)
+
+
+def _upsert_statement(dialect_name):
+    table = Problem.__table__
+    updated = [x for x in PROBLEM_COLUMNS if x not in ("oj_name", "problem_id")]
+    if dialect_name == "sqlite":
+        stmt = sqlite.insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=["oj_name", "problem_id"],
+            set_={x: stmt.excluded[x] for x in updated},
+        )
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=["oj_name", "problem_id"],
+            set_={x: stmt.excluded[x] for x in updated},
+        )
+    if dialect_name == "mysql":
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update({x: stmt.inserted[x] for x in updated})
+    return None
+
+
+def upsert_problems(rows):
+    # Writes all rows in one transaction, as one batched statement where the
+    # database supports upserts.
+    if not rows:
+        return
+    session = db.session
+    stmt = _upsert_statement(session.get_bind().dialect.name)
+    if stmt is None:
+        for row in rows:
+            session.merge(Problem(**row))
+    else:
+        session.execute(stmt, rows)
+    session.commit()
+
+
+class ProblemBatch(object):
+    # Buffers the problems of a full crawl and writes the changed ones every
+    # Config.CRAWL_BATCH_SIZE problems or Config.CRAWL_FLUSH_INTERVAL seconds.
+
+    def __init__(self, oj_name, batch_size=None, flush_interval=None):
+        self._oj_name = oj_name
+        self._batch_size = batch_size or Config.CRAWL_BATCH_SIZE
+        self._flush_interval = flush_interval or Config.CRAWL_FLUSH_INTERVAL
+        self._rows = {}
+        self._first_added = None
+        self.written = 0
+        self.unchanged = 0
+
+    def add(self, problem_id, content):
+        row = {x: content.get(x) for x in Problem.content_fields}
+        row["oj_name"] = self._oj_name
+        row["problem_id"] = problem_id
+        row["digest"] = Problem.compute_digest(content)
+        self._rows[problem_id] = row
+        if self._first_added is None:
+            self._first_added = time.monotonic()
+        if (
+            len(self._rows) >= self._batch_size
+            or time.monotonic() - self._first_added >= self._flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows, self._rows, self._first_added = self._rows, {}, None
+        known = dict(
+            db.session.query(Problem.problem_id, Problem.digest).filter(
+                Problem.oj_name == self._oj_name,
+                Problem.problem_id.in_(list(rows)),
+            )
+        )
+        now = datetime.utcnow()
+        changed = []
+        for problem_id, row in rows.items():
+            if known.get(problem_id) == row["digest"]:
+                continue
+            row["last_update"] = now
+            changed.append(row)
+        upsert_problems(changed)
+        self.written += len(changed)
+        self.unchanged += len(rows) - len(changed)
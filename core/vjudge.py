@@ -1,205 +1,851 @@
 import asyncio
+import functools
 import json
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from queue import Queue, Empty
+from queue import Empty
 
 import redis
-from sqlalchemy import or_
 
 from config import logger, Config
+from . import (
+    events,
+    lanes,
+    lease,
+    metrics,
+    polling,
+    ratelimit,
+    shard,
+    stream,
+    timeline,
+    upsert,
+)
 from .models import db, Submission, Problem, Contest
-from .site import get_client_by_oj_name, exceptions
+from .site import (
+    get_client_by_oj_name,
+    get_async_client_by_oj_name,
+    get_site_by_oj_name,
+    exceptions,
+    pool,
+)
+from .site.cookies import FileCookieStore, RedisCookieStore
 
+PENDING_VERDICTS = ("Being Judged", "Queuing", "Compiling", "Running")
+# Give up on a run after the same total wait as the old per-run schedule.
+STATUS_TIMEOUT = sum(range(120))
+# The pending runs of an account fail after this many status polls in a row
+# failed, the delay between them doubles from polling.MIN_INTERVAL.
+MAX_POLL_ERRORS = 8
+# Submits one account may have on the way at once.
+MAX_IN_FLIGHT = 1
+# A failing account rests up to this many seconds, scaled by its failure rate.
+FAILURE_EWMA_ALPHA = 0.3
+FAILURE_COOLDOWN = 30
+LOGIN_RETRY_INTERVAL = 60
+# A submission no account could log in for is given up on after this many
+# tries, or once every usable account of its oj_name failed it.
+MAX_LOGIN_FAILURES = 5
+# The result of a submit which was not sent because the account could not
+# log in, dispatched again like True.
+LOGIN_FAILED = "login failed"
+# Every account of a site waits this many seconds after a submit could not
+# reach the site.
+CONNECTION_BACKOFF = 5
+# A submit which failed before anything was sent, like an SOJ captcha which
+# could not be solved, is tried this many times with the same account.
+SUBMIT_ATTEMPTS = 3
+IDLE_CHECK_INTERVAL = timedelta(minutes=1)
+REPORT_INTERVAL = 60 * 60
 
-class StatusCrawler(threading.Thread):
-    def __init__(self, client, daemon=None):
-        super().__init__(daemon=daemon)
+
+def _new_cookie_store():
+    if Config.COOKIE_STORE == "redis":
+        return RedisCookieStore(redis.StrictRedis.from_url(Config.DEFAULT_REDIS_URL))
+    if Config.COOKIE_STORE == "file":
+        return FileCookieStore(Config.COOKIE_FILE)
+    return None
+
+
+cookie_store = _new_cookie_store()
+
+# The database and redis calls of the JudgeScheduler loop run on this one
+# thread, so a commit (an fsync on SQLite) never stalls the polls and submits
+# of every other account. Each job gets a fresh session, closed afterwards,
+# so the rows the loop gets back are detached and no transaction stays open.
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vjudge-db")
+
+
+def _db_job(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        db.session.remove()
+
+
+async def _run_db(fn, *args, **kwargs):
+    return await asyncio.get_event_loop().run_in_executor(
+        _db_executor, functools.partial(_db_job, fn, *args, **kwargs)
+    )
+
+
+def _post_db(fn, *args, **kwargs):
+    # Like _run_db without waiting for it, failures are only logged. Jobs run
+    # in order, e.g. an ack after the verdict posted before it.
+    future = _db_executor.submit(_db_job, fn, *args, **kwargs)
+    future.add_done_callback(_log_db_failure)
+
+
+def _log_db_failure(future):
+    if future.exception() is not None:
+        logger.error(f"Database job failed, reason: {future.exception()!r}")
+
+
+def _load_submission(submission_id):
+    return db.session.get(Submission, submission_id)
+
+
+def _save_submission(submission_id, stages=(), pending_only=False, **fields):
+    # Commits fields, then marks the timeline stages [(stage, when)] and
+    # publishes the verdict. With pending_only a submission which has a final
+    # verdict already is left alone.
+    submission = db.session.get(Submission, submission_id)
+    if submission is None:
+        return
+    if pending_only and submission.verdict not in ("Queuing", "Being Judged"):
+        return
+    for name, value in fields.items():
+        setattr(submission, name, value)
+    db.session.commit()
+    for stage, when in stages:
+        timeline.mark(submission_id, stage, when)
+    events.publish_verdict(submission)
+
+
+def _client_options(oj_name):
+    site = get_site_by_oj_name(oj_name)
+    return {
+        "base_url": Config.BASE_URLS.get(site),
+        "volume_concurrency": Config.VOLUME_CONCURRENCY.get(site, 1),
+        "cookie_store": cookie_store,
+    }
+
+
+class StatusCrawler(object):
+    # Polls the verdicts of one account. It lives on the JudgeScheduler loop
+    # and shares the async client with the account's Submitter.
+
+    def __init__(self, client, on_finished):
         self._client = client
+        self._on_finished = on_finished
         self._user_id = client.get_user_id()
         self._name = client.get_name()
-        self._start_event = threading.Event()
-        self._stop_event = threading.Event()
-        self._tasks = []
-        self._thread = None
-        self._loop = None
+        self._site = get_site_by_oj_name(self._name)
+        self._stopping = False
+        self._tasks = set()
+        self._waiters = {}
+        self._plans = {}
+        # run_id -> the user_id stored on its submission, used to poll it.
+        self._run_users = {}
+        self._poller = None
+        self._wakeup = asyncio.Event()
+        self._last_poll = 0
+        self._errors = 0
+        self.last_activity = time.monotonic()
 
-    def run(self):
-        self._thread = threading.current_thread()
-        self._loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self._loop)
-        self._loop.call_soon(self._start_event.set)
-        self._loop.run_forever()
-        pending_tasks = self._pending_tasks()
-        self._loop.run_until_complete(asyncio.gather(*pending_tasks))
-
-    def wait_start(self, timeout=None):
-        return self._start_event.wait(timeout)
+    @property
+    def busy(self):
+        return bool(self._tasks)
 
-    def add_task(self, submission_id):
-        if not self._start_event.is_set():
-            raise RuntimeError("Cannot add task before crawler is started")
-        if self._stop_event.is_set():
+    def add_task(self, submission_id, resumed=False):
+        # resumed: the run was submitted before a restart, not by this process.
+        if self._stopping:
             raise RuntimeError("Cannot add task when crawler is stopping")
-        self._loop.call_soon_threadsafe(
-            asyncio.ensure_future, self._crawl_status(submission_id)
-        )
+        task = asyncio.ensure_future(self._crawl_status(submission_id, resumed))
+        self._tasks.add(task)
+        self.last_activity = time.monotonic()
+        task.add_done_callback(functools.partial(self._on_crawl_done, submission_id))
         return True
 
-    def stop(self):
-        if not self._start_event.is_set():
-            raise RuntimeError("Cannot stop crawler before it is started")
-        if self._stop_event.is_set():
+    def _on_crawl_done(self, submission_id, task):
+        self._tasks.discard(task)
+        self.last_activity = time.monotonic()
+        failed = task.cancelled() or task.exception() is not None
+        if failed and not task.cancelled():
+            logger.error(
+                f"Crawled status failed, submission_id: {submission_id}, reason: {task.exception()}"
+            )
+        self._on_finished(submission_id, failed)
+
+    async def stop(self):
+        if self._stopping:
             raise RuntimeError("Crawler can only be stopped once")
-        self._stop_event.set()
-        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._stopping = True
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
 
-    async def _crawl_status(self, submission_id):
-        submission = Submission.query.get(submission_id)
+    async def _crawl_status(self, submission_id, resumed):
+        submission = await _run_db(_load_submission, submission_id)
         if (
-            not submission.run_id
+            submission is None
+            or not submission.run_id
             or submission.oj_name != self._name
             or submission.verdict != "Being Judged"
         ):
             return
-        for delay in range(120):
-            await asyncio.sleep(delay)
+        future = asyncio.get_event_loop().create_future()
+        self._waiters[submission.run_id] = future
+        plan = polling.new_plan(self._site, submission.language, learn=not resumed)
+        self._plans[submission.run_id] = plan
+        self._run_users[submission.run_id] = submission.user_id or self._user_id
+        # Let the poller plan again with the new run.
+        self._wakeup.set()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll_status())
+        try:
+            verdict, exe_time, exe_mem = await asyncio.wait_for(
+                future, timeout=STATUS_TIMEOUT
+            )
+        except exceptions.JudgeException as e:
+            await self._save_verdict(submission, plan, verdict="Judge Failed")
+            logger.error(
+                f"Crawled status failed, submission_id: {submission.id}, reason: {e}"
+            )
+            return
+        except asyncio.TimeoutError:
+            await self._save_verdict(submission, plan, verdict="Judge Failed")
+            logger.error(
+                f"Crawled status failed, submission_id: {submission.id}, reason: Timeout"
+            )
+            return
+        finally:
+            self._waiters.pop(submission.run_id, None)
+            self._plans.pop(submission.run_id, None)
+            self._run_users.pop(submission.run_id, None)
+        await self._save_verdict(
+            submission, plan, verdict=verdict, exe_time=exe_time, exe_mem=exe_mem
+        )
+        metrics.VERDICT_SECONDS.labels(self._site).observe(
+            (datetime.utcnow() - submission.time_stamp).total_seconds()
+        )
+        logger.info(
+            f"Crawled status successfully, submission_id: {submission.id}, verdict: {verdict}"
+        )
+
+    @staticmethod
+    async def _save_verdict(submission, plan, **fields):
+        stages = [("verdict", None)]
+        if plan.first_polled is not None:
+            stages.insert(0, ("first_poll", plan.first_polled))
+        await _run_db(_save_submission, submission.id, stages, **fields)
+
+    async def _poll_status(self):
+        # One status page fetch per poll resolves every run of this account
+        # that appears on it. A poll is due when the plan of any pending run
+        # says so, see core/polling.py. A failed poll is tried again later,
+        # the runs are only failed after MAX_POLL_ERRORS failures in a row.
+        while self._waiters:
+            run_ids = self._pending_run_ids()
+            due = self._last_poll + min(
+                polling.MAX_INTERVAL, polling.MIN_INTERVAL * 2**self._errors
+            )
+            if run_ids:
+                due = max(due, min(self._plans[x].next_poll() for x in run_ids))
+            self._wakeup.clear()
             try:
-                verdict, exe_time, exe_mem = self._client.get_submit_status(
-                    submission.run_id,
-                    user_id=submission.user_id,
-                    problem_id=submission.problem_id,
-                )
-            except exceptions.ConnectionError as e:
-                submission.verdict = "Judge Failed"
-                db.session.commit()
-                logger.error(
-                    f"Crawled status failed, submission_id: {submission.id}, reason: {e}"
+                await asyncio.wait_for(
+                    self._wakeup.wait(), max(0, due - time.monotonic())
                 )
-                return
-            except exceptions.LoginRequired:
-                try:
-                    self._client.update_cookies()
-                    logger.debug(
-                        f"StatusCrawler login expired, login again, name: {self._name}, user_id: {self._user_id}"
-                    )
+                continue
+            except asyncio.TimeoutError:
+                pass
+            run_ids = self._pending_run_ids()
+            if not run_ids:
+                continue
+            self._last_poll = time.monotonic()
+            try:
+                results = await self._poll(run_ids)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._poll_failed(e)
+                continue
+            self._errors = 0
+            now = time.monotonic()
+            for run_id in run_ids:
+                future = self._waiters.get(run_id)
+                if future is None or future.done():
                     continue
-                except exceptions.ConnectionError as e:
-                    submission.verdict = "Judge Failed"
-                    db.session.commit()
-                    logger.error(
-                        f"Crawled status failed, submission_id: {submission.id}, reason: {e}"
-                    )
-                    return
-            if verdict not in ("Being Judged", "Queuing", "Compiling", "Running"):
-                submission.verdict = verdict
-                submission.exe_time = exe_time
-                submission.exe_mem = exe_mem
-                db.session.commit()
-                logger.info(
-                    f"Crawled status successfully, submission_id: {submission.id}, verdict: {submission.verdict}"
-                )
-                return
-        submission.verdict = "Judge Failed"
-        db.session.commit()
-        logger.error(
-            f"Crawled status failed, submission_id: {submission.id}, reason: Timeout"
-        )
+                result = results.get(run_id)
+                finished = result is not None and result[0] not in PENDING_VERDICTS
+                self._plans[run_id].polled(now, finished)
+                if finished:
+                    future.set_result(result)
 
-    def _pending_tasks(self):
-        if hasattr(asyncio, "all_tasks"):
-            pending_tasks = asyncio.all_tasks(self._loop)
-        else:
-            pending_tasks = {
-                t for t in asyncio.Task.all_tasks(self._loop) if not t.done()
-            }
-        return pending_tasks
+    async def _poll(self, run_ids):
+        # Runs are looked up with the user_id of their submission, one status
+        # query per user_id.
+        by_user = {}
+        for run_id in run_ids:
+            user_id = self._run_users.get(run_id, self._user_id)
+            by_user.setdefault(user_id, []).append(run_id)
+        results = {}
+        for user_id, user_run_ids in by_user.items():
+            results.update(await self._poll_user(user_run_ids, user_id))
+        return results
+
+    async def _poll_user(self, run_ids, user_id):
+        try:
+            return await self._client.get_submit_statuses(run_ids, user_id=user_id)
+        except exceptions.LoginRequired:
+            await self._client.update_cookies()
+            logger.debug(
+                f"StatusCrawler login expired, login again, name: {self._name}, user_id: {self._user_id}"
+            )
+            return await self._client.get_submit_statuses(run_ids, user_id=user_id)
+
+    def _poll_failed(self, e):
+        self._errors += 1
+        if self._errors < MAX_POLL_ERRORS:
+            logger.warning(
+                f"Polled status failed, name: {self._name}, user_id: {self._user_id}, "
+                f"errors: {self._errors}, reason: {e}"
+            )
+            return
+        self._errors = 0
+        if not isinstance(e, exceptions.JudgeException):
+            e = exceptions.JudgeException(f"Poll status failed: {e!r}")
+        self._resolve_all(exception=e)
+
+    def _pending_run_ids(self):
+        return [k for k, v in self._waiters.items() if not v.done()]
+
+    def _resolve_all(self, exception):
+        for future in self._waiters.values():
+            if not future.done():
+                future.set_exception(exception)
 
     def __repr__(self):
         return f"<StatusCrawler(oj_name={self._name}, user_id={self._user_id})>"
 
 
-class Submitter(threading.Thread):
-    def __init__(self, client, submit_queue, status_crawler, daemon=None):
-        super().__init__(daemon=daemon)
+class Submitter(object):
+    # One account of an oj_name. The Dispatcher hands it a submission when it
+    # is the account which can send it soonest.
+
+    def __init__(self, client, status_crawler, on_finished, leases=None):
         self._client = client
+        self._on_finished = on_finished
+        self._leases = leases
         self._user_id = client.get_user_id()
         self._name = client.get_name()
-        self._submit_queue = submit_queue
+        self._site = get_site_by_oj_name(self._name)
         self._status_crawler = status_crawler
-        self._stop_event = threading.Event()
+        self._limiter = ratelimit.get_limiter(self._site, "submit", self._user_id)
+        self.in_flight = 0
+        self.failure_rate = 0
+        self.logged_in = True
+        self._cooldown_until = 0
 
-    def run(self):
-        self._status_crawler.start()
-        self._status_crawler.wait_start()
-        logger.info(f"Started submitter, name: {self._name}, user_id: {self._user_id}")
-        while True:
+    @property
+    def user_id(self):
+        return self._user_id
+
+    @property
+    def leased(self):
+        return self._leases is None or self._leases.held(self._site, self._user_id)
+
+    @property
+    def busy(self):
+        return self.in_flight > 0 or self._status_crawler.busy
+
+    @property
+    def last_activity(self):
+        return self._status_crawler.last_activity
+
+    def ready_in(self):
+        # Seconds until this account can send a submission, None when it is
+        # busy with as many submissions as it may send at once or another
+        # node holds its lease.
+        if self.in_flight >= MAX_IN_FLIGHT or not self.leased:
+            return None
+        cooldown = self._cooldown_until - time.monotonic()
+        return max(0, self._limiter.delay(), cooldown)
+
+    def watch(self, submission_id):
+        # Polls a run submitted before a restart.
+        self._status_crawler.add_task(submission_id, resumed=True)
+
+    def submit(self, submission_id):
+        # The task result is True, or LOGIN_FAILED, when the submission was not
+        # sent and must be dispatched again, maybe to another account. The
+        # account counts as busy from now on, not only once the task runs.
+        self.in_flight += 1
+        return asyncio.ensure_future(self._submit(submission_id))
+
+    async def _submit(self, submission_id):
+        try:
+            return await self._send(submission_id)
+        finally:
+            self.in_flight -= 1
+
+    async def _send(self, submission_id):
+        submission = await _run_db(_load_submission, submission_id)
+        if submission is None:
+            logger.error(f"Submission {submission_id} is not found")
+            self._on_finished(submission_id, False)
+            return False
+        await asyncio.sleep(self._limiter.reserve())
+        try:
+            run_id = await self._submit_problem(submission)
+        except exceptions.SubmitTooFrequently as e:
+            self._count("throttled")
+            self._limiter.backoff(e.retry_after, site_wide=e.site_wide)
+            # Only this account waits, the others keep taking the queue.
+            self._cooldown_until = max(
+                self._cooldown_until, time.monotonic() + e.retry_after
+            )
+            logger.warning(
+                f"Submitter is throttled, name: {self._name}, user_id: {self._user_id}, "
+                f"retry after {e.retry_after}s"
+            )
+            return True
+        except exceptions.LoginError as e:
+            # Nothing was sent, another account can take the submission.
+            self._count("login_failed")
+            self._login_failed(e)
+            return LOGIN_FAILED
+        except (exceptions.SubmitError, exceptions.ConnectionError) as e:
+            self._count("failed")
+            self._record_result(failed=True)
+            if isinstance(e, exceptions.ConnectionError):
+                self._limiter.backoff(CONNECTION_BACKOFF, site_wide=True)
+            await self._submit_failed(submission, e)
+            return False
+        except exceptions.LoginRequired:
             try:
-                submission = Submission.query.get(self._submit_queue.get(timeout=60))
-            except Empty:
-                if self._stop_event.is_set():
-                    break
-                continue
-            logger.info(
-                f"Start judging submission {submission.id}, verdict: {submission.verdict}"
+                await self._client.update_cookies()
+                logger.debug(
+                    f"Submitter login is expired, login again, name: {self._name}, user_id: {self._user_id}"
+                )
+            except (exceptions.ConnectionError, exceptions.LoginError) as e:
+                self._login_failed(e)
+                return LOGIN_FAILED
+            return True
+        except exceptions.JudgeException as e:
+            # Still failing after SUBMIT_ATTEMPTS, e.g. no valid captcha.
+            self._count("failed")
+            self._record_result(failed=True)
+            await self._submit_failed(submission, e)
+            return False
+        self.logged_in = True
+        self._count("ok")
+        self._record_result(failed=False)
+        await _run_db(
+            _save_submission,
+            submission.id,
+            [("submitted", None)],
+            run_id=run_id,
+            user_id=self._user_id,
+            verdict="Being Judged",
+        )
+        logger.info(f"Submission {submission.id} is submitted successfully")
+        self._status_crawler.add_task(submission.id)
+        self._limiter.recover()
+        return False
+
+    async def _submit_problem(self, submission):
+        # Other JudgeExceptions than the known ones happen before the code is
+        # sent, so they are tried again at once, with a new captcha on SOJ.
+        for attempt in range(SUBMIT_ATTEMPTS):
+            try:
+                return await self._client.submit_problem(
+                    submission.problem_id, submission.language, submission.source_code
+                )
+            except exceptions.JudgeException as e:
+                if type(e) is not exceptions.JudgeException:
+                    raise
+                if attempt == SUBMIT_ATTEMPTS - 1:
+                    raise
+                logger.warning(
+                    f"Submit failed before sending, try again, name: {self._name}, "
+                    f"user_id: {self._user_id}, reason: {e}"
+                )
+
+    async def _submit_failed(self, submission, e):
+        await _run_db(
+            _save_submission,
+            submission.id,
+            [("verdict", None)],
+            verdict="Submit Failed",
+        )
+        logger.error(f"Submission {submission.id} is submitted failed, reason: {e}")
+        self._on_finished(submission.id, False)
+
+    def _count(self, result):
+        metrics.SUBMITS.labels(self._site, self._user_id, result).inc()
+
+    def _record_result(self, failed):
+        self.failure_rate += FAILURE_EWMA_ALPHA * (int(failed) - self.failure_rate)
+        if failed:
+            # An account which keeps failing is left alone for longer.
+            self._cooldown_until = (
+                time.monotonic() + self.failure_rate * FAILURE_COOLDOWN
             )
-            if submission.verdict not in ("Queuing", "Being Judged"):
+
+    def _login_failed(self, e):
+        self.logged_in = False
+        self._record_result(failed=True)
+        self._cooldown_until = time.monotonic() + LOGIN_RETRY_INTERVAL
+        logger.error(
+            f"Submitter cannot login, name: {self._name}, user_id: {self._user_id}, reason: {e}"
+        )
+
+    async def close(self):
+        await self._status_crawler.stop()
+        await self._client.close()
+
+    def __repr__(self):
+        return (
+            f"<Submitter(oj_name={self._name}, user_id={self._user_id}, "
+            f"in_flight={self.in_flight}, failure_rate={self.failure_rate:.2f}, "
+            f"logged_in={self.logged_in})>"
+        )
+
+
+class Dispatcher(object):
+    # Holds the queued submissions of one oj_name and sends each one with the
+    # account which can submit it soonest. It is a task on the JudgeScheduler
+    # loop.
+
+    def __init__(self, oj_name, submitters, on_finished, on_released):
+        self._name = oj_name
+        self._submitters = submitters
+        self._on_finished = on_finished
+        self._on_released = on_released
+        self._pending = lanes.WeightedLanes(lanes.SUBMIT_LANES)
+        self._submit_tasks = set()
+        # submission_id -> [user_ids], the accounts which could not log in to
+        # send it.
+        self._login_failures = {}
+        self._changed = asyncio.Event()
+        self._stopping = False
+        self._last_activity = time.monotonic()
+
+    @property
+    def busy(self):
+        return bool(
+            self._pending or self._submit_tasks or any(x.busy for x in self._submitters)
+        )
+
+    @property
+    def last_activity(self):
+        return max(self._last_activity, *(x.last_activity for x in self._submitters))
+
+    def queued(self):
+        return self._pending.lengths()
+
+    def add(self, submission_id, lane=None):
+        self._pending.append(submission_id, lane)
+        self._last_activity = time.monotonic()
+        self._changed.set()
+
+    def stop(self):
+        self._stopping = True
+        self._changed.set()
+
+    async def run(self):
+        logger.info(f"Started dispatcher, name: {self._name}")
+        while self._pending or not self._stopping:
+            self._changed.clear()
+            if not self._pending:
+                await self._changed.wait()
+                continue
+            lane, submission_id = self._pending.peek()
+            submission = await _run_db(_load_submission, submission_id)
+            if not self._pending or self._pending.peek() != (lane, submission_id):
+                # The queue changed while the submission was read.
+                continue
+            if submission is None or submission.verdict not in (
+                "Queuing",
+                "Being Judged",
+            ):
+                self._pending.pop()
+                self._on_finished(submission_id, False)
                 continue
             if submission.verdict == "Being Judged":
-                self._status_crawler.add_task(submission.id)
+                self._pending.pop()
+                owner = self._owner(submission)
+                if owner is None:
+                    self._give_up(
+                        submission.id,
+                        "Judge Failed",
+                        f"no account with user_id {submission.user_id}",
+                    )
+                else:
+                    owner.watch(submission.id)
+                continue
+            if not any(x.leased for x in self._submitters):
+                # Other nodes hold every account now, let them take the queue.
+                while self._pending:
+                    self._on_released(self._pending.pop()[1])
+                continue
+            submitter, delay = self._pick()
+            if submitter is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
                 continue
+            self._pending.pop()
+            _post_db(timeline.mark, submission.id, "dequeued", datetime.utcnow())
+            logger.info(
+                f"Start judging submission {submission.id}, user_id: {submitter.user_id}, lane: {lane}"
+            )
+            task = submitter.submit(submission.id)
+            self._submit_tasks.add(task)
+            task.add_done_callback(
+                functools.partial(self._on_submit_done, submission.id, lane, submitter)
+            )
+        logger.info(f"Stopping dispatcher, name: {self._name}")
+        if self._submit_tasks:
+            await asyncio.gather(*self._submit_tasks, return_exceptions=True)
+        for submitter in self._submitters:
+            await submitter.close()
+        logger.info(f"Stopped dispatcher, name: {self._name}")
+
+    def _pick(self):
+        # The account ready soonest, the less failing one on a tie. None when
+        # every account is busy, then the next finished submit wakes us up.
+        best, best_key = None, None
+        for submitter in self._submitters:
+            ready_in = submitter.ready_in()
+            if ready_in is None:
+                continue
+            key = (ready_in, submitter.failure_rate, submitter.in_flight)
+            if best_key is None or key < best_key:
+                best, best_key = submitter, key
+        if best is None:
+            return None, None
+        return best, best_key[0]
+
+    def _owner(self, submission):
+        # Only the account which submitted a run can see its status, None
+        # when it is no longer configured.
+        for submitter in self._submitters:
+            if submitter.user_id == submission.user_id:
+                return submitter
+        return None
+
+    def _on_submit_done(self, submission_id, lane, submitter, task):
+        self._submit_tasks.discard(task)
+        self._last_activity = time.monotonic()
+        if task.cancelled():
+            self._login_failures.pop(submission_id, None)
+            self._on_finished(submission_id, True)
+        elif task.exception() is not None:
+            self._login_failures.pop(submission_id, None)
+            logger.error(
+                f"Submission {submission_id} is submitted failed, reason: {task.exception()}"
+            )
+            self._on_finished(submission_id, True)
+        elif not task.result():
+            self._login_failures.pop(submission_id, None)
+        elif task.result() == LOGIN_FAILED and self._login_failed(
+            submission_id, submitter
+        ):
+            self._give_up(submission_id, "Submit Failed", "no account can log in")
+        else:
+            self._pending.appendleft(submission_id, lane)
+        self._changed.set()
+
+    def _login_failed(self, submission_id, submitter):
+        # Whether the submission should be given up on, after submitter could
+        # not log in to send it.
+        failures = self._login_failures.setdefault(submission_id, [])
+        failures.append(submitter.user_id)
+        usable = {x.user_id for x in self._submitters if x.leased}
+        return len(failures) >= MAX_LOGIN_FAILURES or usable <= set(failures)
+
+    def _give_up(self, submission_id, verdict, reason):
+        self._login_failures.pop(submission_id, None)
+        _post_db(
+            _save_submission,
+            submission_id,
+            [("verdict", None)],
+            pending_only=True,
+            verdict=verdict,
+        )
+        logger.error(f"Gave up on submission {submission_id}, reason: {reason}")
+        self._on_finished(submission_id, False)
+
+    def __repr__(self):
+        return (
+            f"<Dispatcher(oj_name={self._name}, pending={len(self._pending)}, "
+            f"submitters={self._submitters})>"
+        )
+
+
+class JudgeScheduler(threading.Thread):
+    # One event loop multiplexing the dispatchers and status crawlers of every
+    # account and oj_name, instead of a thread pair per account.
+
+    def __init__(
+        self,
+        normal_accounts,
+        contest_accounts,
+        daemon=None,
+        on_finished=None,
+        on_released=None,
+        leases=None,
+    ):
+        super().__init__(daemon=daemon)
+        self._normal_accounts = normal_accounts
+        self._contest_accounts = contest_accounts
+        self._leases = leases
+        # Called on the loop with (submission_id, failed) once a submission
+        # got its final verdict, or failed=True when it was given up on.
+        self._on_finished = on_finished or (lambda submission_id, failed: None)
+        # Called on the loop with a submission_id given back unsent, because
+        # other nodes lease every account of its oj_name now.
+        self._on_released = on_released or (lambda submission_id: None)
+        self._start_event = threading.Event()
+        self._loop = None
+        self._running_dispatchers = {}
+        self._stopping_dispatchers = set()
+        self._dispatcher_tasks = {}
+        self._last_report = time.monotonic()
+        metrics.gauges.add(
+            "vjudge_submit_queue_depth",
+            "Submissions waiting for a submitter",
+            ["oj_name", "lane"],
+            self._queue_depth,
+        )
+
+    def run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(self._start_event.set)
+        self._loop.run_forever()
+        self._loop.run_until_complete(pool.close_connectors())
+
+    def wait_start(self, timeout=None):
+        return self._start_event.wait(timeout)
+
+    def _queue_depth(self):
+        result = {}
+        for oj_name, info in list(self._running_dispatchers.items()):
+            for lane, depth in info["dispatcher"].queued().items():
+                result[(oj_name, lane)] = depth
+        return result
+
+    def add_submission(self, oj_name, submission_id, lane=None):
+        # Thread safe. Returns False when no account of oj_name can be used.
+        future = asyncio.run_coroutine_threadsafe(
+            self._add_submission(oj_name, submission_id, lane), self._loop
+        )
+        return future.result()
+
+    def warm_up(self):
+        # Thread safe. Starts the warm standby submitters, see Config.WARM_STANDBY.
+        self._loop.call_soon_threadsafe(self._warm_up)
+
+    def stop_idle_submitters(self):
+        self._loop.call_soon_threadsafe(self._stop_idle_submitters)
+
+    def _warm_up(self):
+        for oj_name in _standby_oj_names(self._normal_accounts):
+            if oj_name not in self._running_dispatchers:
+                self._start_new_dispatcher(oj_name)
+
+    async def _add_submission(self, oj_name, submission_id, lane):
+        if oj_name not in self._running_dispatchers:
+            if not self._start_new_dispatcher(oj_name):
+                return False
+        self._running_dispatchers[oj_name]["dispatcher"].add(submission_id, lane)
+        return True
+
+    def _start_new_dispatcher(self, oj_name):
+        submitters = []
+        accounts = {}
+        if oj_name in self._normal_accounts:
+            accounts = self._normal_accounts[oj_name]
+        if oj_name in self._contest_accounts:
+            accounts = self._contest_accounts[oj_name]
+        for auth in accounts:
             try:
-                run_id = self._client.submit_problem(
-                    submission.problem_id, submission.language, submission.source_code
+                client = get_async_client_by_oj_name(
+                    oj_name, auth, prefetch_captcha=True, **_client_options(oj_name)
                 )
-            except (
-                exceptions.SubmitError,
-                exceptions.ConnectionError,
-                exceptions.LoginError,
-            ) as e:
-                submission.verdict = "Submit Failed"
-                db.session.commit()
+                status_crawler = StatusCrawler(client, self._finished)
+                submitters.append(
+                    Submitter(client, status_crawler, self._finished, self._leases)
+                )
+            except exceptions.JudgeException as e:
                 logger.error(
-                    f"Submission {submission.id} is submitted failed, reason: {e}"
+                    f"Create submitter failed, name: {oj_name}, user_id: {auth[0]}, reason: {e}"
                 )
-            except exceptions.LoginRequired:
-                try:
-                    self._client.update_cookies()
-                    self._submit_queue.put(submission.id)
-                    logger.debug(
-                        f"Submitter login is expired, login again, name: {self._name}, user_id: {self._user_id}"
-                    )
-                except exceptions.ConnectionError as e:
-                    submission.verdict = "Submit Failed"
-                    db.session.commit()
-                    logger.error(
-                        f"Submission {submission.id} is submitted failed, reason: {e}"
-                    )
-            else:
-                submission.run_id = run_id
-                submission.user_id = self._user_id
-                submission.verdict = "Being Judged"
-                db.session.commit()
-                logger.info(f"Submission {submission.id} is submitted successfully")
-                self._status_crawler.add_task(submission.id)
-            time.sleep(5)
-        logger.info(f"Stopping submitter, name: {self._name}, user_id: {self._user_id}")
-        self._status_crawler.stop()
-        self._status_crawler.join()
-        logger.info(f"Stopped submitter, name: {self._name}, user_id: {self._user_id}")
+        if not submitters:
+            return False
+        dispatcher = Dispatcher(oj_name, submitters, self._finished, self._released)
+        self._dispatcher_tasks[dispatcher] = asyncio.ensure_future(dispatcher.run())
+        self._running_dispatchers[oj_name] = {"dispatcher": dispatcher}
+        return True
 
-    def stop(self):
-        self._stop_event.set()
+    def _finished(self, submission_id, failed):
+        # The callbacks ack or bounce stream entries, redis calls which run on
+        # the database thread too, after the verdict written before them.
+        _post_db(self._on_finished, submission_id, failed)
 
-    def __repr__(self):
-        return f"<Submitter(oj_name={self._name}, user_id={self._user_id})>"
+    def _released(self, submission_id):
+        _post_db(self._on_released, submission_id)
+
+    def _stop_idle_submitters(self):
+        groups = {}
+        for oj_name, dispatcher_info in self._running_dispatchers.items():
+            dispatcher = dispatcher_info["dispatcher"]
+            groups[oj_name] = (dispatcher.busy, dispatcher.last_activity)
+        for oj_name in _idle_groups(groups, _standby_oj_names(self._normal_accounts)):
+            dispatcher = self._running_dispatchers.pop(oj_name)["dispatcher"]
+            # Stopping drains what is still queued or being judged.
+            dispatcher.stop()
+            self._stopping_dispatchers.add(dispatcher)
+            logger.info(f"No more task, stop all {oj_name} submitters")
+        stopped_dispatchers = []
+        for dispatcher in self._stopping_dispatchers:
+            if self._dispatcher_tasks[dispatcher].done():
+                stopped_dispatchers.append(dispatcher)
+        for dispatcher in stopped_dispatchers:
+            self._stopping_dispatchers.remove(dispatcher)
+            self._dispatcher_tasks.pop(dispatcher)
+        logger.debug(f"Running dispatchers: {self._running_dispatchers}")
+        logger.debug(f"Stopping dispatchers: {self._stopping_dispatchers}")
+        if time.monotonic() - self._last_report < REPORT_INTERVAL:
+            return
+        self._last_report = time.monotonic()
+        for site in polling.judge_times.sites():
+            logger.info(
+                f"Median verdict detection lag, site: {site}, "
+                f"lag: {polling.judge_times.median_lag(site):.2f}s"
+            )
 
 
 class PageCrawler(threading.Thread):
-    def __init__(self, client, page_queue, daemon=None):
+    def __init__(
+        self,
+        client,
+        page_queue,
+        on_finished,
+        leases=None,
+        full_crawls=None,
+        daemon=None,
+    ):
         super().__init__(daemon=daemon)
         self._client = client
+        self._on_finished = on_finished
+        self._leases = leases
+        self._full_crawls = full_crawls
         self._name = client.get_name()
         self._user_id = client.get_user_id()
         self._client_type = client.get_client_type()
@@ -207,65 +853,114 @@ class PageCrawler(threading.Thread):
         if self._client_type == "contest":
             self._supported_crawl_type.append("contest")
         self._page_queue = page_queue
+        self._limiter = ratelimit.get_limiter(
+            get_site_by_oj_name(self._name), "crawl", self._user_id
+        )
         self._stop_event = threading.Event()
+        self.busy = False
+        self.last_activity = time.monotonic()
 
     def run(self):
         logger.info(
             f"Started PageCrawler, name: {self._name}, user_id: {self._user_id}"
         )
+        site = get_site_by_oj_name(self._name)
         while True:
+            if self.busy:
+                self.busy = False
+                self.last_activity = time.monotonic()
+            if self._leases is not None and not self._leases.held(site, self._user_id):
+                # Leave the queue to the crawlers of leased accounts.
+                if self._stop_event.wait(1):
+                    break
+                continue
             try:
                 data = self._page_queue.get(timeout=60)
             except Empty:
                 if self._stop_event.is_set():
                     break
                 continue
-            if not isinstance(data, dict):
-                logger.error(f'PageCrawler: data type should be dict, data: "{data}"')
-                continue
-            crawl_type = data.get("type")
-            if crawl_type not in self._supported_crawl_type:
-                logger.error(f"Unsupported crawl_type: {crawl_type}")
-                continue
+            self.busy = True
+            self._handle(data)
+        logger.info(
+            f"Stopped PageCrawler, name: {self._name}, user_id: {self._user_id}"
+        )
+
+    def _handle(self, data):
+        if not isinstance(data, dict):
+            logger.error(f'PageCrawler: data type should be dict, data: "{data}"')
+            return
+        crawl_type = data.get("type")
+        if crawl_type not in self._supported_crawl_type:
+            logger.error(f"Unsupported crawl_type: {crawl_type}")
+            self._on_finished(data, False)
+            return
+        failed = False
+        try:
+            if crawl_type == "problem":
+                problem_id = data.get("problem_id")
+                if data.get("problem_ids") is not None:
+                    self._crawl_shard(data)
+                elif problem_id:
+                    self._crawl_problem(problem_id)
+                elif data.get("incremental"):
+                    self._crawl_problem_incremental(data.get("lane"))
+                else:
+                    self._crawl_problem_all(data.get("lane"))
+            elif crawl_type == "contest":
+                self._crawl_contest()
+        except exceptions.ConnectionError as e:
+            failed = True
+            logger.error(
+                f"Crawled page failed, name: {self._name}, user_id: {self._user_id}, reason: {e}"
+            )
+        except exceptions.LoginRequired:
             try:
-                if crawl_type == "problem":
-                    problem_id = data.get("problem_id")
-                    if problem_id:
-                        self._crawl_problem(problem_id)
-                    else:
-                        self._crawl_problem_all()
-                elif crawl_type == "contest":
-                    self._crawl_contest()
+                self._client.update_cookies()
+                self._page_queue.put(data, data.get("lane"))
+                logger.debug(
+                    f"PageCrawler login expired, login again, name: {self._name}, user_id: {self._user_id}"
+                )
+                return
             except exceptions.ConnectionError as e:
+                failed = True
                 logger.error(
-                    f"Crawled page failed, name: {self._name}, user_id: {self._user_id}, reason: {e}"
+                    f"Crawled contest failed, name: {self._name}, user_id: {self._user_id}, reason: {e}"
                 )
-            except exceptions.LoginRequired:
-                try:
-                    self._client.update_cookies()
-                    self._page_queue.put(data)
-                    logger.debug(
-                        f"PageCrawler login expired, login again, name: {self._name}, user_id: {self._user_id}"
-                    )
-                except exceptions.ConnectionError as e:
-                    logger.error(
-                        f"Crawled contest failed, name: {self._name}, user_id: {self._user_id}, reason: {e}"
-                    )
-        logger.info(
-            f"Stopped PageCrawler, name: {self._name}, user_id: {self._user_id}"
-        )
+        self._on_finished(data, failed)
+
+    def _serve_urgent(self):
+        # A whole problem list takes long, so the most urgent lane gets its
+        # weighted share of turns between two problems of it.
+        lane, weight = next(iter(lanes.CRAWL_LANES.items()))
+        for _ in range(weight):
+            try:
+                data = self._page_queue.get_nowait(lane)
+            except Empty:
+                return
+            self._handle(data)
 
     def stop(self):
         self._stop_event.set()
 
-    def _crawl_problem(self, problem_id):
+    def _fetch_problem(self, problem_id):
+        self._limiter.acquire()
         result = self._client.get_problem(problem_id)
         if not isinstance(result, dict):
             logger.error(
                 f"No such problem, name: {self._name}, "
                 f"user_id: {self._user_id}, problem_id: {problem_id}"
             )
+            return None
+        return result
+
+    def _crawl_problem(self, problem_id):
+        result = self._fetch_problem(problem_id)
+        if result is None:
             return
+        # A single problem is refreshed on request, app/tasks.py waits for its
+        # last_update to change, so it is written even when unchanged. Only
+        # the batched crawls skip unchanged problems, see core/upsert.py.
         problem = (
             Problem.query.filter_by(oj_name=self._name, problem_id=problem_id).first()
             or Problem()
@@ -281,6 +976,7 @@ class PageCrawler(threading.Thread):
         problem.sample_output = result.get("sample_output")
         problem.time_limit = result.get("time_limit")
         problem.mem_limit = result.get("mem_limit")
+        problem.digest = Problem.compute_digest(result)
         db.session.add(problem)
         db.session.commit()
         logger.info(
@@ -288,10 +984,51 @@ class PageCrawler(threading.Thread):
             f"user_id: {self._user_id}, problem_id: {problem_id}"
         )
 
-    def _crawl_problem_all(self):
-        problem_list = self._client.get_problem_list()
-        for problem_id in problem_list:
-            self._crawl_problem(problem_id)
+    def _crawl_problem_all(self, lane=None):
+        # Only the problem list is downloaded here. The problems are queued
+        # again as shards while the volumes come in, so all crawlers of the
+        # site crawl them in parallel.
+        if self._full_crawls is None:
+            self._crawl_problems(self._client.iter_problem_list())
+            return
+        self._full_crawls.start(self._name, self._client.iter_problem_list(), lane)
+
+    def _crawl_problem_incremental(self, lane=None):
+        if self._full_crawls is None:
+            self._crawl_problem_all(lane)
+            return
+        problem_ids = self._full_crawls.plan_incremental(
+            self._name, self._client.iter_problem_list()
+        )
+        self._full_crawls.start(self._name, problem_ids, lane, kind="incremental")
+
+    def _crawl_shard(self, data):
+        self._crawl_problems(data["problem_ids"])
+        if self._full_crawls is not None:
+            self._full_crawls.finish_shard(
+                self._name,
+                data["run"],
+                data["shard"],
+                data["problem_ids"],
+                data["kind"],
+            )
+
+    def _crawl_problems(self, problem_ids):
+        # Problems are written in batches, a transaction per problem is what
+        # limited a full crawl on SQLite.
+        batch = upsert.ProblemBatch(self._name)
+        try:
+            for problem_id in problem_ids:
+                result = self._fetch_problem(problem_id)
+                if result is not None:
+                    batch.add(problem_id, result)
+                self._serve_urgent()
+        finally:
+            batch.flush()
+            logger.info(
+                f"Crawled problem list, name: {self._name}, user_id: {self._user_id}, "
+                f"written: {batch.written}, unchanged: {batch.unchanged}"
+            )
 
     def _crawl_contest(self):
         contest = Contest.query.filter_by(oj_name=self._name).first() or Contest()
@@ -315,185 +1052,306 @@ class PageCrawler(threading.Thread):
             f"Crawled contest successfully, name: {self._name}, "
             f"user_id: {self._user_id}, contest_id: {contest.contest_id}"
         )
-        self._crawl_problem_all()
+        # Contests have few problems, they are crawled right away.
+        self._crawl_problems(self._client.iter_problem_list())
+
+
+def _standby_oj_names(normal_accounts):
+    # The normal oj_names kept warm from the start, see Config.WARM_STANDBY.
+    # A site has a single normal oj_name, named after it.
+    return [x for x in normal_accounts if Config.WARM_STANDBY.get(x, False)]
+
+
+def _idle_groups(groups, standby):
+    # groups: {oj_name: (busy, last_activity)}. Returns the worker groups idle
+    # for longer than Config.WORKER_IDLE_TIMEOUT, except the warm standby ones.
+    now = time.monotonic()
+    return [
+        oj_name
+        for oj_name, (busy, last_activity) in groups.items()
+        if not busy
+        and now - last_activity > Config.WORKER_IDLE_TIMEOUT
+        and oj_name not in standby
+    ]
+
+
+def _leased(leases, normal_accounts, contest_accounts, oj_name):
+    # Whether this node holds the lease of any account of oj_name.
+    if leases is None:
+        return True
+    accounts = contest_accounts.get(oj_name) or normal_accounts.get(oj_name, [])
+    return leases.any_held(get_site_by_oj_name(oj_name), [x[0] for x in accounts])
+
+
+def _bounce(tasks, entry_id, data):
+    if tasks.bounce(entry_id, data):
+        logger.debug(f"No leased account here, passed on task, entry_id: {entry_id}")
+    else:
+        logger.warning(f"No node took the task, left it pending, entry_id: {entry_id}")
 
 
 class SubmitterHandler(threading.Thread):
-    def __init__(self, normal_accounts, contest_accounts, daemon=None):
+    def __init__(self, normal_accounts, contest_accounts, daemon=None, leases=None):
         super().__init__(daemon=daemon)
-        self._redis_key = "vjudge-submitter-tasks"
         self._redis_con = redis.StrictRedis.from_url(Config.DEFAULT_REDIS_URL)
+        self._tasks = stream.TaskStream(
+            self._redis_con,
+            stream.SUBMITTER_STREAM,
+            on_dead_letter=self._dead_lettered,
+        )
         self._normal_accounts = normal_accounts
         self._contest_accounts = contest_accounts
-        self._running_submitters = {}
-        self._stopping_submitters = set()
-        self._queues = {}
+        # submission_id -> stream entry, until the submission is finished.
+        self._running = {}
+        self._lock = threading.Lock()
+        self._leases = leases
+        self._scheduler = JudgeScheduler(
+            normal_accounts,
+            contest_accounts,
+            True,
+            on_finished=self._finished,
+            on_released=self._released,
+            leases=leases,
+        )
 
     def run(self):
-        self._scan_unfinished_tasks()
+        self._scheduler.start()
+        self._scheduler.wait_start()
+        # Unfinished submissions of a crashed process are still pending in the
+        # stream and are claimed back, no table scan is needed.
+        self._tasks.create_group()
+        self._scheduler.warm_up()
         last_clean = datetime.utcnow()
         while True:
-            data = self._redis_con.brpop(self._redis_key, timeout=600)
-            if datetime.utcnow() - last_clean > timedelta(hours=1):
-                self._stop_idle_submitters()
+            entries = self._tasks.read()
+            with self._lock:
+                running = list(self._running.values())
+            self._tasks.touch(running)
+            if datetime.utcnow() - last_clean > IDLE_CHECK_INTERVAL:
+                self._scheduler.stop_idle_submitters()
                 last_clean = datetime.utcnow()
-            if not data:
-                continue
-            try:
-                submission_id = int(data[1])
-            except (ValueError, TypeError):
-                logger.error(f'SubmitterHandler: receive corrupt data "{data[1]}"')
-                continue
-            submission = Submission.query.get(submission_id)
-            if not submission:
-                logger.error(f"Submission {submission_id} is not found")
-                continue
-            if (
-                submission.oj_name not in self._normal_accounts
-                and submission.oj_name not in self._contest_accounts
-            ):
-                logger.error(f"Unsupported oj_name: {submission.oj_name}")
-                continue
-            if submission.oj_name not in self._queues:
-                self._queues[submission.oj_name] = Queue()
-            submit_queue = self._queues.get(submission.oj_name)
-            if submission.oj_name not in self._running_submitters:
-                if not self._start_new_submitters(submission.oj_name, submit_queue):
-                    submission.verdict = "Submit Failed"
-                    db.session.commit()
-                    logger.error(f"Cannot start client for {submission.oj_name}")
-                    continue
-            assert submission.oj_name in self._running_submitters
-            submit_queue.put(submission.id)
+            for entry_id, data, lane in entries:
+                self._handle(entry_id, data, lane)
 
-    def _scan_unfinished_tasks(self):
-        submissions = Submission.query.filter(
-            or_(Submission.verdict == "Queuing", Submission.verdict == "Being Judged")
+    def _handle(self, entry_id, data, lane):
+        try:
+            submission_id = int(data)
+        except (ValueError, TypeError):
+            logger.error(f'SubmitterHandler: receive corrupt data "{data}"')
+            self._tasks.dead_letter(entry_id, data, "corrupt data")
+            return
+        submission = Submission.query.get(submission_id)
+        if not submission:
+            logger.error(f"Submission {submission_id} is not found")
+            self._tasks.ack(entry_id)
+            return
+        if (
+            submission.oj_name not in self._normal_accounts
+            and submission.oj_name not in self._contest_accounts
+        ):
+            logger.error(f"Unsupported oj_name: {submission.oj_name}")
+            self._tasks.dead_letter(entry_id, data, "unsupported oj_name")
+            return
+        if not _leased(
+            self._leases,
+            self._normal_accounts,
+            self._contest_accounts,
+            submission.oj_name,
+        ):
+            _bounce(self._tasks, entry_id, data)
+            return
+        with self._lock:
+            duplicate = submission_id in self._running
+            if not duplicate:
+                self._running[submission_id] = entry_id
+        if duplicate:
+            self._tasks.ack(entry_id)
+            return
+        timeline.mark(submission.id, "received")
+        if not self._scheduler.add_submission(submission.oj_name, submission.id, lane):
+            submission.verdict = "Submit Failed"
+            db.session.commit()
+            timeline.mark(submission.id, "verdict")
+            events.publish_verdict(submission)
+            logger.error(f"Cannot start client for {submission.oj_name}")
+            self._finished(submission.id, False)
+
+    def _dead_lettered(self, data, reason):
+        # Nothing else gives a submission which was given up on its verdict.
+        try:
+            submission_id = int(data)
+        except (ValueError, TypeError):
+            return
+        submission = Submission.query.get(submission_id)
+        if submission is None or submission.verdict not in ("Queuing", "Being Judged"):
+            return
+        if submission.verdict == "Queuing":
+            submission.verdict = "Submit Failed"
+        else:
+            submission.verdict = "Judge Failed"
+        db.session.commit()
+        timeline.mark(submission.id, "verdict")
+        events.publish_verdict(submission)
+        logger.error(
+            f"Gave up on submission {submission.id}, verdict: {submission.verdict}, "
+            f"reason: {reason}"
         )
-        for submission in submissions:
-            self._redis_con.lpush(self._redis_key, submission.id)
 
-    def _start_new_submitters(self, oj_name, submit_queue):
-        submitter_info = {"submitters": {}}
-        submitters = submitter_info.get("submitters")
-        accounts = {}
-        if oj_name in self._normal_accounts:
-            accounts = self._normal_accounts[oj_name]
-        if oj_name in self._contest_accounts:
-            accounts = self._contest_accounts[oj_name]
-        for auth in accounts:
-            try:
-                crawler = StatusCrawler(
-                    get_client_by_oj_name(oj_name, auth), daemon=True
-                )
-                submitter = Submitter(
-                    get_client_by_oj_name(oj_name, auth),
-                    submit_queue,
-                    crawler,
-                    daemon=True,
-                )
-            except exceptions.JudgeException as e:
-                logger.error(
-                    f"Create submitter failed, name: {oj_name}, user_id: auth[0], reason: {e}"
-                )
-                continue
-            submitter.start()
-            submitters[auth[0]] = submitter
-        if not submitters:
-            return False
-        submitter_info["start_time"] = datetime.utcnow()
-        self._running_submitters[oj_name] = submitter_info
-        return True
+    def _finished(self, submission_id, failed):
+        # A failed entry is only let go, so it is delivered again later and
+        # dead lettered after too many failures.
+        with self._lock:
+            entry_id = self._running.pop(submission_id, None)
+        if entry_id is None:
+            return
+        if failed:
+            self._tasks.fail(entry_id)
+        else:
+            self._tasks.ack(entry_id)
 
-    def _stop_idle_submitters(self):
-        free_clients = []
-        for oj_name in self._running_submitters:
-            submitter_info = self._running_submitters[oj_name]
-            if datetime.utcnow() - submitter_info["start_time"] > timedelta(hours=1):
-                free_clients.append(oj_name)
-        for oj_name in free_clients:
-            submitter_info = self._running_submitters[oj_name]
-            submitters = submitter_info.get("submitters")
-            for user_id in submitters:
-                submitter = submitters.get(user_id)
-                submitter.stop()
-                self._stopping_submitters.add(submitter)
-            self._running_submitters.pop(oj_name)
-            logger.info(f"No more task, stop all {oj_name} submitters")
-        stopped_submitters = []
-        for submitter in self._stopping_submitters:
-            if not submitter.is_alive():
-                stopped_submitters.append(submitter)
-        for submitter in stopped_submitters:
-            self._stopping_submitters.remove(submitter)
-        logger.info("Stopped idle submitters")
-        logger.info(f"Running submitters: {self._running_submitters}")
-        logger.info(f"Stopping submitters: {self._stopping_submitters}")
+    def _released(self, submission_id):
+        with self._lock:
+            entry_id = self._running.pop(submission_id, None)
+        if entry_id is not None:
+            _bounce(self._tasks, entry_id, str(submission_id))
 
 
 class CrawlerHandler(threading.Thread):
-    def __init__(self, normal_accounts, contest_accounts, daemon=None):
+    def __init__(self, normal_accounts, contest_accounts, daemon=None, leases=None):
         super().__init__(daemon=daemon)
-        self._redis_key = "vjudge-crawler-tasks"
+        self._leases = leases
         self._redis_con = redis.StrictRedis.from_url(Config.DEFAULT_REDIS_URL)
+        self._tasks = stream.TaskStream(self._redis_con, stream.CRAWLER_STREAM)
+        self._full_crawls = shard.FullCrawls(self._redis_con)
         self._normal_accounts = normal_accounts
         self._contest_accounts = contest_accounts
         self._running_crawlers = {}
         self._stopping_crawlers = set()
         self._queues = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        metrics.gauges.add(
+            "vjudge_crawl_queue_depth",
+            "Crawl tasks waiting for a crawler",
+            ["oj_name", "lane"],
+            self._queue_depth,
+        )
+
+    def _queue_depth(self):
+        result = {}
+        for oj_name, crawl_queue in list(self._queues.items()):
+            for lane, depth in crawl_queue.lengths().items():
+                result[(oj_name, lane)] = depth
+        return result
 
     def run(self):
+        self._tasks.create_group()
+        for oj_name in _standby_oj_names(self._normal_accounts):
+            self._queues[oj_name] = lanes.LaneQueue(lanes.CRAWL_LANES)
+            self._start_new_crawlers(oj_name, self._queues[oj_name])
         last_clean = datetime.utcnow()
         while True:
-            if datetime.utcnow() - last_clean > timedelta(hours=1):
+            if datetime.utcnow() - last_clean > IDLE_CHECK_INTERVAL:
                 self._stop_idle_crawlers()
                 last_clean = datetime.utcnow()
-            data = self._redis_con.brpop(self._redis_key, timeout=600)
-            if not data:
-                continue
-            try:
-                data = json.loads(data[1])
-            except json.JSONDecodeError:
-                logger.error(f'CrawlerHandler: received corrupt data "{data[1]}"')
-                continue
-            if not isinstance(data, dict):
-                logger.error(
-                    f'CrawlerHandler: data type should be dict, data: "{data}"'
-                )
-                continue
-            crawl_type = data.get("type")
-            oj_name = data.get("oj_name")
-            if crawl_type not in ("problem", "contest"):
-                logger.error(f"Unsupported crawl_type: {crawl_type}")
-                continue
+            entries = self._tasks.read()
+            with self._lock:
+                running = list(self._running)
+            self._tasks.touch(running)
+            for entry_id, data, lane in entries:
+                self._handle(entry_id, data, lane)
+
+    def _handle(self, entry_id, raw_data, lane):
+        try:
+            data = json.loads(raw_data)
+        except (json.JSONDecodeError, TypeError):
+            logger.error(f'CrawlerHandler: received corrupt data "{raw_data}"')
+            self._tasks.dead_letter(entry_id, raw_data, "corrupt data")
+            return
+        if not isinstance(data, dict):
+            logger.error(f'CrawlerHandler: data type should be dict, data: "{data}"')
+            self._tasks.dead_letter(entry_id, raw_data, "corrupt data")
+            return
+        crawl_type = data.get("type")
+        oj_name = data.get("oj_name")
+        if crawl_type not in ("problem", "contest"):
+            logger.error(f"Unsupported crawl_type: {crawl_type}")
+            self._tasks.dead_letter(entry_id, raw_data, "unsupported crawl_type")
+            return
+        if (
+            oj_name not in self._normal_accounts
+            and oj_name not in self._contest_accounts
+        ):
+            logger.error(f"Unsupported oj_name: {oj_name}")
+            self._tasks.dead_letter(entry_id, raw_data, "unsupported oj_name")
+            return
+        if not _leased(
+            self._leases, self._normal_accounts, self._contest_accounts, oj_name
+        ):
+            _bounce(self._tasks, entry_id, raw_data)
+            return
+        if crawl_type == "problem" and "problem_ids" in data:
+            # A shard of a full or incremental crawl, see core/shard.py.
             if (
-                oj_name not in self._normal_accounts
-                and oj_name not in self._contest_accounts
+                not isinstance(data["problem_ids"], list)
+                or not isinstance(data.get("run"), str)
+                or not isinstance(data.get("shard"), int)
+                or data.get("kind", "full") not in shard.KINDS
             ):
-                logger.error(f"Unsupported oj_name: {oj_name}")
-                continue
-            if oj_name not in self._queues:
-                self._queues[oj_name] = Queue()
-            crawl_queue = self._queues.get(oj_name)
-            if oj_name not in self._running_crawlers:
-                if not self._start_new_crawlers(oj_name, crawl_queue):
-                    logger.error(f"Cannot start client for {oj_name}")
-                    continue
-            assert oj_name in self._running_crawlers
-            if crawl_type == "problem":
-                crawl_all = data.get("all")
-                problem_id = data.get("problem_id")
-                if crawl_all is not True:
-                    crawl_all = False
-                if not crawl_all and problem_id is None:
-                    logger.error("Missing crawl_params: problem_id")
-                    continue
-                data = {"type": "problem"}
-                if not crawl_all:
-                    data["problem_id"] = problem_id
-                crawl_queue.put(data)
-            elif crawl_type == "contest":
-                crawl_queue.put({"type": "contest"})
+                logger.error(f'CrawlerHandler: received corrupt shard "{raw_data}"')
+                self._tasks.dead_letter(entry_id, raw_data, "corrupt shard")
+                return
+            data = {
+                "type": "problem",
+                "problem_ids": data["problem_ids"],
+                "run": data["run"],
+                "shard": data["shard"],
+                # Shards queued before the kinds were split belong to full runs.
+                "kind": data.get("kind", "full"),
+            }
+        elif crawl_type == "problem" and data.get("incremental") is True:
+            data = {"type": "problem", "incremental": True}
+        elif crawl_type == "problem":
+            crawl_all = data.get("all")
+            problem_id = data.get("problem_id")
+            if crawl_all is not True:
+                crawl_all = False
+            if not crawl_all and problem_id is None:
+                logger.error("Missing crawl_params: problem_id")
+                self._tasks.dead_letter(entry_id, raw_data, "missing problem_id")
+                return
+            data = {"type": "problem"}
+            if not crawl_all:
+                data["problem_id"] = problem_id
+        else:
+            data = {"type": "contest"}
+        data["entry_id"] = entry_id
+        data["lane"] = lane
+        if oj_name not in self._queues:
+            self._queues[oj_name] = lanes.LaneQueue(lanes.CRAWL_LANES)
+        crawl_queue = self._queues.get(oj_name)
+        if oj_name not in self._running_crawlers:
+            if not self._start_new_crawlers(oj_name, crawl_queue):
+                # Left pending, it is delivered again later.
+                logger.error(f"Cannot start client for {oj_name}")
+                self._tasks.fail(entry_id)
+                return
+        assert oj_name in self._running_crawlers
+        with self._lock:
+            self._running.add(entry_id)
+        self._running_crawlers[oj_name]["last_activity"] = time.monotonic()
+        crawl_queue.put(data, lane)
+
+    def _finished(self, data, failed):
+        entry_id = data.get("entry_id")
+        with self._lock:
+            self._running.discard(entry_id)
+        if entry_id is None:
+            return
+        if failed:
+            self._tasks.fail(entry_id)
+        else:
+            self._tasks.ack(entry_id)
 
     def _start_new_crawlers(self, oj_name, crawl_queue):
         crawler_info = {"crawlers": {}}
@@ -505,8 +1363,16 @@ class CrawlerHandler(threading.Thread):
             accounts = self._contest_accounts[oj_name]
         for auth in accounts:
             try:
+                client = get_client_by_oj_name(
+                    oj_name, auth, **_client_options(oj_name)
+                )
                 crawler = PageCrawler(
-                    get_client_by_oj_name(oj_name, auth), crawl_queue, daemon=True
+                    client,
+                    crawl_queue,
+                    self._finished,
+                    self._leases,
+                    self._full_crawls,
+                    daemon=True,
                 )
             except exceptions.JudgeException as e:
                 logger.error(
@@ -517,17 +1383,20 @@ class CrawlerHandler(threading.Thread):
             crawlers[auth[0]] = crawler
         if not crawlers:
             return False
-        crawler_info["start_time"] = datetime.utcnow()
+        crawler_info["last_activity"] = time.monotonic()
         self._running_crawlers[oj_name] = crawler_info
         return True
 
     def _stop_idle_crawlers(self):
-        free_clients = []
-        for oj_name in self._running_crawlers:
-            crawler_info = self._running_crawlers[oj_name]
-            if datetime.utcnow() - crawler_info["start_time"] > timedelta(hours=1):
-                free_clients.append(oj_name)
-        for oj_name in free_clients:
+        groups = {}
+        for oj_name, crawler_info in self._running_crawlers.items():
+            crawlers = crawler_info["crawlers"].values()
+            busy = not self._queues[oj_name].empty() or any(x.busy for x in crawlers)
+            last_activity = max(
+                crawler_info["last_activity"], *(x.last_activity for x in crawlers)
+            )
+            groups[oj_name] = (busy, last_activity)
+        for oj_name in _idle_groups(groups, _standby_oj_names(self._normal_accounts)):
             crawler_info = self._running_crawlers[oj_name]
             crawlers = crawler_info.get("crawlers")
             for user_id in crawlers:
@@ -542,9 +1411,8 @@ class CrawlerHandler(threading.Thread):
                 stopped_crawlers.append(crawler)
         for crawler in stopped_crawlers:
             self._stopping_crawlers.remove(crawler)
-        logger.info("Stopped idle crawlers")
-        logger.info(f"Running crawlers: {self._running_crawlers}")
-        logger.info(f"Stopping crawlers: {self._stopping_crawlers}")
+        logger.debug(f"Running crawlers: {self._running_crawlers}")
+        logger.debug(f"Stopping crawlers: {self._stopping_crawlers}")
 
 
 class VJudge(object):
@@ -578,11 +1446,48 @@ class VJudge(object):
         return self._contest_accounts
 
     def start(self):
+        # Tables and columns added since the database was created.
+        db.upgrade()
+        accounts = []
+        for oj_name, auths in (
+            *self._normal_accounts.items(),
+            *self._contest_accounts.items(),
+        ):
+            accounts.extend((get_site_by_oj_name(oj_name), x[0]) for x in auths)
+        redis_con = redis.StrictRedis.from_url(Config.DEFAULT_REDIS_URL)
+        leases = lease.AccountLeases(redis_con, accounts, daemon=True)
+        leases.start()
+        leases.wait_ready()
+        metrics.watch_streams(
+            redis_con,
+            {
+                stream.SUBMITTER_STREAM: stream.GROUP,
+                stream.CRAWLER_STREAM: stream.GROUP,
+                events.VERDICT_STREAM: events.VERDICT_GROUP,
+            },
+        )
+        metrics.gauges.add(
+            "vjudge_leases_held",
+            "Accounts leased by this node",
+            ["site"],
+            lambda: {(k,): v for k, v in leases.counts().items()},
+        )
+        metrics.gauges.add(
+            "vjudge_detection_lag_seconds",
+            "Median delay between a verdict and its detection",
+            ["site"],
+            lambda: {
+                (x,): polling.judge_times.median_lag(x)
+                for x in polling.judge_times.sites()
+                if polling.judge_times.median_lag(x) is not None
+            },
+        )
+        metrics.serve()
         submitter_handle = SubmitterHandler(
-            self._normal_accounts, self._contest_accounts, True
+            self._normal_accounts, self._contest_accounts, True, leases
         )
         crawler_handle = CrawlerHandler(
-            self._normal_accounts, self._contest_accounts, True
+            self._normal_accounts, self._contest_accounts, True, leases
         )
         submitter_handle.start()
         crawler_handle.start()
@@ -14,7 +14,7 @@ def init_db():
         admin.password = "123456"
         db.session.add(admin)
         db.session.commit()
-    core_db.create_all()
+    core_db.upgrade()
 
 
 if __name__ == "__main__":
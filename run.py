@@ -21,6 +21,7 @@ flask_process = subprocess.Popen(
 celery_process = subprocess.Popen(
     shlex.split("celery --app=app.celery worker -l info --concurrency=8 --beat")
 )
+verdict_process = subprocess.Popen(shlex.split("python -m app.verdicts"))
 
 try:
     vjudge = VJudge()
@@ -30,5 +31,7 @@ except KeyboardInterrupt:
 finally:
     flask_process.terminate()
     celery_process.terminate()
+    verdict_process.terminate()
     flask_process.wait()
     celery_process.wait()
+    verdict_process.wait()